@@ -1,4 +1,6 @@
-from typing import List
+from typing import List, Sequence, Tuple
+from collections import OrderedDict
+from weakref import WeakKeyDictionary, finalize, ref
 
 import numpy as np
 import tensorflow as tf
@@ -7,15 +9,19 @@
 from arrows.arrow import Arrow
 from reverseflow.to_graph import arrow_to_graph
 from arrows.config import floatX
+from arrows.primitive.array_arrows import complement_values
+from arrows.util.hash import structural_hash
 from arrows.port_attributes import (is_error_port, extract_attribute,
   is_param_port, get_port_dtype)
 
 
-def apply(arrow: Arrow, inputs: List[np.ndarray]) -> List[np.ndarray]:
+def apply(arrow: Arrow, inputs: List[np.ndarray], profile=None) -> List[np.ndarray]:
     """Apply an arrow to some inputs.  Uses tensorflow for actual computation.
     Args:
         Arrow: The Arrow to compute
         inputs: Input values to the arrow
+        profile: ExecutionProfile to record graph construction and (traced)
+            op times of each sub arrow into
     Returns:
         list of outputs Arrow(inputs)"""
     assert len(inputs) == arrow.num_in_ports(), "wrong # inputs"
@@ -27,24 +33,128 @@ def apply(arrow: Arrow, inputs: List[np.ndarray]) -> List[np.ndarray]:
             dtype = get_port_dtype(arrow.in_port(i))
             input_tensors.append(tf.placeholder(dtype=dtype,
                                  shape=inputs[i].shape))
-        outputs = arrow_to_graph(arrow, input_tensors)
+        outputs = arrow_to_graph(arrow, input_tensors, profile=profile)
         feed_dict = dict(zip(input_tensors, inputs))
         init = tf.global_variables_initializer()
         sess.run(init)
-        outputs = sess.run(fetches=outputs,
-                           feed_dict=feed_dict)
+        if profile is None:
+            outputs = sess.run(fetches=outputs,
+                               feed_dict=feed_dict)
+        else:
+            run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+            run_metadata = tf.RunMetadata()
+            outputs = sess.run(fetches=outputs,
+                               feed_dict=feed_dict,
+                               options=run_options,
+                               run_metadata=run_metadata)
+            profile.add_run_metadata(run_metadata)
     sess.close()
     return outputs
 
 
-def apply_backwards(arrow: Arrow, outputs: List[np.ndarray], port_attr=None) -> List[np.ndarray]:
+class CompiledArrow():
+    """An arrow converted to a tensorflow graph once and executed many times.
+    A graph and session is kept for each distinct signature (input shapes and
+    port dtypes) of inputs, the least recently used is closed once there are
+    more than `max_sessions` of them.
+    Only a weak reference to the arrow is kept, sessions are closed when it
+    is collected and recompiled when its structural hash changes"""
+
+    def __init__(self, arrow: Arrow, max_sessions: int=8) -> None:
+        assert max_sessions > 0, "need room for at least one session"
+        self.arrow_ref = ref(arrow)
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.hash = structural_hash(arrow)
+        finalize(arrow, self.close)
+
+    @property
+    def arrow(self) -> Arrow:
+        arrow = self.arrow_ref()
+        assert arrow is not None, "Compiled arrow no longer exists"
+        return arrow
+
+    def signature(self, inputs: List[np.ndarray]) -> Tuple:
+        arrow = self.arrow
+        return tuple((np.shape(inputs[i]), get_port_dtype(arrow.in_port(i)))
+                     for i in range(len(inputs)))
+
+    def compile(self, signature: Tuple):
+        """Construct graph and session for inputs of `signature`"""
+        graph = tf.Graph()
+        sess = tf.Session(graph=graph)
+        with graph.as_default():
+            input_tensors = [tf.placeholder(dtype=dtype, shape=shape)
+                             for shape, dtype in signature]
+            outputs = arrow_to_graph(self.arrow, input_tensors)
+            sess.run(tf.global_variables_initializer())
+        graph.finalize()
+        return sess, input_tensors, outputs
+
+    def get_session(self, inputs: List[np.ndarray]):
+        # Graphs of an arrow modified since they were built are stale
+        arrow_hash = structural_hash(self.arrow)
+        if arrow_hash != self.hash:
+            self.close()
+            self.hash = arrow_hash
+        signature = self.signature(inputs)
+        if signature in self.sessions:
+            self.sessions.move_to_end(signature)
+        else:
+            self.sessions[signature] = self.compile(signature)
+            if len(self.sessions) > self.max_sessions:
+                _, (sess, _, _) = self.sessions.popitem(last=False)
+                sess.close()
+        return self.sessions[signature]
+
+    def __call__(self, inputs: List[np.ndarray]) -> List[np.ndarray]:
+        """Apply arrow to inputs, as `apply`"""
+        assert len(inputs) == self.arrow.num_in_ports(), "wrong # inputs"
+        sess, input_tensors, outputs = self.get_session(inputs)
+        return sess.run(fetches=outputs,
+                        feed_dict=dict(zip(input_tensors, inputs)))
+
+    def map(self, input_batch: Sequence[List[np.ndarray]]
+            ) -> List[List[np.ndarray]]:
+        """Apply arrow to each list of inputs in `input_batch`"""
+        return [self(inputs) for inputs in input_batch]
+
+    def close(self) -> None:
+        for sess, _, _ in self.sessions.values():
+            sess.close()
+        self.sessions.clear()
+
+
+# Compiled arrows, which are dropped (and their sessions closed) along with
+# their arrow
+COMPILED = WeakKeyDictionary()
+
+
+def compile_arrow(arrow: Arrow, max_sessions: int=8) -> CompiledArrow:
+    """Compiled executor for `arrow`, reusing an existing one if possible
+    Args:
+        arrow: The Arrow to compute
+        max_sessions: Number of sessions (one per input signature) to cache
+    Returns:
+        CompiledArrow `f` such that f(inputs) == apply(arrow, inputs)"""
+    if arrow not in COMPILED:
+        COMPILED[arrow] = CompiledArrow(arrow, max_sessions)
+    return COMPILED[arrow]
+
+
+def apply_backwards(arrow: Arrow,
+                    outputs: List[np.ndarray],
+                    port_attr=None,
+                    incremental=False) -> List[np.ndarray]:
     """
     Takes out_port vals (excluding errors) and returns in_port vals (including params).
+    If `incremental` propagate with the worklist engine.
     FIXME: Mutates port_attr
     """
-    out_ports = [out_port for out_port in arrow.out_ports() if not is_error_port(out_port)]
+    out_ports = [out_port for out_port in arrow.out_ports()
+                 if not is_error_port(out_port)]
     if port_attr is None:
-        port_attr = propagate(arrow)
+        port_attr = propagate(arrow, incremental=incremental)
     for i, out_port in enumerate(out_ports):
         if out_port not in port_attr:
             port_attr[out_port] = {}
@@ -60,24 +170,98 @@ def apply_backwards(arrow: Arrow, outputs: List[np.ndarray], port_attr=None) ->
                 print("WARNING: shape of error port unknown: %s" % (out_port))
                 port_attr[out_port]['value'] = 0
 
-    port_attr = propagate(arrow, port_attr)#, only_prop=set(['value']))
+    with complement_values():
+        # , only_prop=set(['value']))
+        port_attr = propagate(arrow, port_attr, incremental=incremental)
     vals = extract_attribute('value', port_attr)
     in_vals = {port: vals[port] for port in arrow.in_ports() if port in vals}
     return in_vals
 
-def from_input_list(fwd, inv, input_batch, port_attr=None):
+def apply_backwards_batch(arrow: Arrow,
+                          outputs: List[np.ndarray],
+                          port_attr=None,
+                          incremental=False) -> List[np.ndarray]:
+    """
+    As apply_backwards, but each output has a leading batch dimension, and
+    the in_port vals of the whole batch are found with a single propagation.
+    Only values are propagated; shapes in `port_attr` are of one example.
+    Value dispatches must handle batches, which holds for the elementwise
+    ones (arithmetic, dupl), broadcast and the approximate identities.
+    """
+    if port_attr is None:
+        port_attr = propagate(arrow, incremental=incremental)
+    port_attr = {port: dict(attrs) for port, attrs in port_attr.items()}
+    batch_size = len(outputs[0])
+    out_ports = [out_port for out_port in arrow.out_ports()
+                 if not is_error_port(out_port)]
+
+    # Shapes of a single example, which can't be inferred from batched values
+    shapes_known = True
+    for i, out_port in enumerate(out_ports):
+        assert len(outputs[i]) == batch_size, "outputs differ in batch size"
+        attrs = port_attr.setdefault(out_port, {})
+        if 'shape' not in attrs:
+            attrs['shape'] = np.shape(outputs[i])[1:]
+            shapes_known = False
+    if not shapes_known:
+        port_attr = propagate(arrow, port_attr, only_prop=set(['shape']),
+                              incremental=incremental)
+
+    for i, out_port in enumerate(out_ports):
+        port_attr[out_port]['value'] = outputs[i]
+    for out_port in arrow.out_ports():
+        if is_error_port(out_port):
+            attrs = port_attr.setdefault(out_port, {})
+            if 'shape' in attrs:
+                attrs['value'] = np.zeros((batch_size,) + tuple(attrs['shape']))
+            else:
+                print("WARNING: shape of error port unknown: %s" % (out_port))
+                attrs['value'] = 0
+
+    with complement_values():
+        port_attr = propagate(arrow, port_attr, only_prop=set(['value']),
+                              incremental=incremental)
+    vals = extract_attribute('value', port_attr)
+    in_vals = {}
+    for port in arrow.in_ports():
+        if port in vals:
+            # Values independent of the outputs, e.g. constants, are unbatched
+            shape = port_attr[port].get('shape', np.shape(vals[port]))
+            if np.ndim(vals[port]) == len(shape):
+                in_vals[port] = np.broadcast_to(vals[port],
+                                                (batch_size,) + tuple(shape))
+            else:
+                in_vals[port] = vals[port]
+    return in_vals
+
+def from_input_list(fwd, inv, input_batch, port_attr=None, incremental=False,
+                    batched=False):
     """
     [input] -> [inputs, params, outputs].
     optionally if port_attr is already computed, pass it in to save time.
+    If `batched` the params of all inputs are found with one propagation.
     """
     if port_attr is None:
-        port_attr = propagate(inv)
+        port_attr = propagate(inv, incremental=incremental)
+    compiled_fwd = compile_arrow(fwd)
+    if batched:
+        stacked = [np.stack([input_data[i] for input_data in input_batch])
+                   for i in range(len(input_batch[0]))]
+        params_bwd = apply_backwards_batch(inv, stacked, port_attr=port_attr,
+                                           incremental=incremental)
+        param_ports = [port for port in inv.in_ports() if is_param_port(port)]
+        params = [[params_bwd[port][j] for port in param_ports]
+                  for j in range(len(input_batch))]
+        outputs = compiled_fwd.map(input_batch)
+        return list(zip(input_batch, params, outputs))
+
     params = []
     outputs = []
     for input_data in input_batch:
-        params_bwd = apply_backwards(inv, input_data, port_attr=port_attr)
+        params_bwd = apply_backwards(inv, input_data, port_attr=port_attr,
+                                     incremental=incremental)
         params_list = [params_bwd[port] for port in inv.in_ports() if is_param_port(port)]
-        outputs_list = apply(fwd, input_data)
+        outputs_list = compiled_fwd(input_data)
         params.append(params_list)
         outputs.append(outputs_list)
     return list(zip(input_batch, params, outputs))
@@ -0,0 +1,288 @@
+"""Interpret an arrow with numpy, without constructing a tensorflow graph"""
+from typing import List, Sequence
+
+import numpy as np
+from overloading import overload
+
+from arrows.arrow import Arrow
+from arrows.config import floatX
+from arrows.sourcearrow import SourceArrow
+from arrows.compositearrow import CompositeArrow
+from arrows.std_arrows import *
+from arrows.apply.interpret import interpret
+from arrows.port_attributes import get_port_dtype
+from arrows.util.numpy_ops import (gather_nd, scatter_nd, sparse_to_dense,
+                                   constant)
+from reverseflow.util.misc import complement_mask, complement_indices
+
+ArrayList = Sequence[np.ndarray]
+
+
+@overload
+def conv(a: Arrow, args: ArrayList, state) -> ArrayList:
+    assert False, "Error, no numpy conversion for %s implemented" % a
+
+
+@overload
+def conv(a: BroadcastArrow, args: ArrayList, state) -> ArrayList:
+    # Numpy broadcasts automatically, so do nothing
+    return args
+
+
+@overload
+def conv(a: InvBroadcastArrow, args: ArrayList, state) -> ArrayList:
+    return [args[0][tuple(0 for i in a.ext_shape)]]
+
+
+@overload
+def conv(a: AddArrow, args: ArrayList, state) -> ArrayList:
+    return [np.add(*args)]
+
+
+@overload
+def conv(a: SubArrow, args: ArrayList, state) -> ArrayList:
+    return [np.subtract(*args)]
+
+
+@overload
+def conv(a: MulArrow, args: ArrayList, state) -> ArrayList:
+    return [np.multiply(*args)]
+
+
+@overload
+def conv(a: DivArrow, args: ArrayList, state) -> ArrayList:
+    # Like tf.div, integer division rounds down
+    if all(np.issubdtype(np.asarray(arg).dtype, np.integer) for arg in args):
+        return [np.floor_divide(*args)]
+    return [np.divide(*args)]
+
+
+@overload
+def conv(a: FloorDivArrow, args: ArrayList, state) -> ArrayList:
+    return [np.floor_divide(*args)]
+
+
+@overload
+def conv(a: PowArrow, args: ArrayList, state) -> ArrayList:
+    return [np.power(*args)]
+
+
+@overload
+def conv(a: ExpArrow, args: ArrayList, state) -> ArrayList:
+    return [np.exp(*args)]
+
+
+@overload
+def conv(a: LogArrow, args: ArrayList, state) -> ArrayList:
+    return [np.log(*args)]
+
+
+@overload
+def conv(a: LogBaseArrow, args: ArrayList, state) -> ArrayList:
+    return [np.log(args[1]) / np.log(args[0])]
+
+
+@overload
+def conv(a: NegArrow, args: ArrayList, state) -> ArrayList:
+    return [np.negative(*args)]
+
+
+@overload
+def conv(a: AddNArrow, args: ArrayList, state) -> ArrayList:
+    return [sum(args[1:], args[0])]
+
+
+@overload
+def conv(a: SinArrow, args: ArrayList, state) -> ArrayList:
+    return [np.sin(*args)]
+
+
+@overload
+def conv(a: CosArrow, args: ArrayList, state) -> ArrayList:
+    return [np.cos(*args)]
+
+
+@overload
+def conv(a: ASinArrow, args: ArrayList, state) -> ArrayList:
+    return [np.arcsin(*args)]
+
+
+@overload
+def conv(a: ACosArrow, args: ArrayList, state) -> ArrayList:
+    return [np.arccos(*args)]
+
+
+@overload
+def conv(a: AbsArrow, args: ArrayList, state) -> ArrayList:
+    return [np.abs(args[0])]
+
+
+@overload
+def conv(a: SquareArrow, args: ArrayList, state) -> ArrayList:
+    return [np.square(args[0])]
+
+
+@overload
+def conv(a: MaxArrow, args: ArrayList, state) -> ArrayList:
+    return [np.maximum(args[0], args[1])]
+
+
+@overload
+def conv(a: ClipArrow, args: ArrayList, state) -> ArrayList:
+    return [np.clip(*args)]
+
+
+@overload
+def conv(a: ReduceMeanArrow, args: ArrayList, state) -> ArrayList:
+    axis = tuple(np.atleast_1d(args[1]).astype(int))
+    return [np.mean(args[0], axis=axis)]
+
+
+@overload
+def conv(a: SquaredDifference, args: ArrayList, state) -> ArrayList:
+    return [np.square(np.subtract(*args))]
+
+
+@overload
+def conv(a: DuplArrow, args: ArrayList, state) -> ArrayList:
+    return [args[0] for i in range(a.num_out_ports())]
+
+
+@overload
+def conv(a: InvDuplArrow, args: ArrayList, state) -> ArrayList:
+    return [args[0]]
+
+
+@overload
+def conv(a: IdentityArrow, args: ArrayList, state) -> ArrayList:
+    return [args[0]]
+
+
+@overload
+def conv(a: IgnoreInputArrow, args: ArrayList, state) -> ArrayList:
+    return [args[1]]
+
+
+@overload
+def conv(a: GreaterArrow, args: ArrayList, state) -> ArrayList:
+    return [np.greater(args[0], args[1])]
+
+
+@overload
+def conv(a: IfArrow, args: ArrayList, state) -> ArrayList:
+    return [np.where(*args)]
+
+
+@overload
+def conv(a: SelectArrow, args: ArrayList, state) -> ArrayList:
+    return [np.where(*args)]
+
+
+@overload
+def conv(a: CastArrow, args: ArrayList, state) -> ArrayList:
+    # to_dtype may be a tensorflow dtype
+    dtype = getattr(a.to_dtype, 'as_numpy_dtype', a.to_dtype)
+    return [np.asarray(args[0]).astype(dtype)]
+
+
+@overload
+def conv(a: RankArrow, args: ArrayList, state) -> ArrayList:
+    return [np.array(np.ndim(args[0]), dtype='int32')]
+
+
+@overload
+def conv(a: RangeArrow, args: ArrayList, state) -> ArrayList:
+    return [np.arange(args[0], args[1])]
+
+
+@overload
+def conv(a: SourceArrow, args: ArrayList, state) -> ArrayList:
+    assert len(args) == 0, "Source arrow has no inputs"
+    return [constant(a.value)]
+
+
+@overload
+def conv(a: GatherArrow, args: ArrayList, state) -> ArrayList:
+    return [np.take(args[0], args[1], axis=0)]
+
+
+@overload
+def conv(a: GatherNdArrow, args: ArrayList, state) -> ArrayList:
+    return [gather_nd(*args)]
+
+
+@overload
+def conv(a: ScatterNdArrow, args: ArrayList, state) -> ArrayList:
+    return [scatter_nd(*args)]
+
+
+@overload
+def conv(a: SparseToDenseArrow, args: ArrayList, state) -> ArrayList:
+    return [sparse_to_dense(*args)]
+
+
+@overload
+def conv(a: ComplementMaskArrow, args: ArrayList, state) -> ArrayList:
+    return [complement_mask(*args).astype(floatX())]
+
+
+@overload
+def conv(a: ComplementIndicesArrow, args: ArrayList, state) -> ArrayList:
+    return [complement_indices(*args).astype(np.asarray(args[1]).dtype)]
+
+
+@overload
+def conv(a: ReshapeArrow, args: ArrayList, state) -> ArrayList:
+    return [np.reshape(args[0], tuple(np.atleast_1d(args[1])))]
+
+
+@overload
+def conv(a: SliceArrow, args: ArrayList, state) -> ArrayList:
+    inp, begin, size = args
+    # As in tf.slice a size of -1 takes all remaining elements
+    slices = tuple(slice(b, None if s == -1 else b + s)
+                   for b, s in zip(np.atleast_1d(begin), np.atleast_1d(size)))
+    return [np.asarray(inp)[slices]]
+
+
+@overload
+def conv(a: SqueezeArrow, args: ArrayList, state) -> ArrayList:
+    return [np.squeeze(*args)]
+
+
+@overload
+def conv(a: StackArrow, args: ArrayList, state) -> ArrayList:
+    return [np.stack(args, axis=a.axis)]
+
+
+@overload
+def conv(a: ConcatArrow, args: ArrayList, state) -> ArrayList:
+    return [np.concatenate(args, axis=a.axis)]
+
+
+@overload
+def conv(a: TransposeArrow, args: ArrayList, state) -> ArrayList:
+    return [np.transpose(args[0], a.perm)]
+
+
+def apply_numpy(arrow: Arrow, inputs: List[np.ndarray],
+                profile=None) -> List[np.ndarray]:
+    """Apply an arrow to some inputs using numpy rather than tensorflow.
+    Inputs are converted to the dtype of their port, as in `apply`
+    Args:
+        Arrow: The Arrow to compute
+        inputs: Input values to the arrow
+        profile: ExecutionProfile to record the time of each sub arrow into,
+            which for numpy is in its convert column
+    Returns:
+        list of outputs Arrow(inputs)"""
+    assert len(inputs) == arrow.num_in_ports(), "wrong # inputs"
+    inputs = [np.asarray(inputs[i], dtype=get_port_dtype(arrow.in_port(i)))
+              for i in range(len(inputs))]
+    state = {}
+    if profile is not None:
+        profile.root = arrow if profile.root is None else profile.root
+        state['exec_profile'] = profile
+    if isinstance(arrow, CompositeArrow):
+        return interpret(conv, arrow, inputs, state, {})
+    return conv(arrow, inputs, state)
@@ -6,8 +6,9 @@
 from arrows.primitive.cast_arrows import *
 from arrows.primitive.constant import *
 from arrows.port_attributes import *
+from arrows.apply.propagate import port_equiv_index
 from pqdict import pqdict
-from typing import List, Dict, MutableMapping, Union, Callable
+from typing import List, Dict, MutableMapping, Union, Callable, Tuple
 from collections import OrderedDict
 
 
@@ -98,6 +99,115 @@ def inner_interpret(conv: Callable,
     out_port_indices = sorted(list(outputs_dict.keys()))
     return [outputs_dict[i] for i in out_port_indices]
 
+class Plan():
+    """
+    Flat schedule for interpreting a composite arrow.
+    Connected ports share a slot, composites are inlined and primitives are
+    ordered such that their inputs are computed before them.
+    """
+
+    def __init__(self,
+                 n_slots: int,
+                 in_slots: List[int],
+                 out_slots: List[int],
+                 instructions: List[Tuple[Arrow, Tuple[int, ...],
+                                          Tuple[int, ...]]],
+                 port_slot: Dict[Port, int]) -> None:
+        self.n_slots = n_slots
+        self.in_slots = in_slots
+        self.out_slots = out_slots
+        self.instructions = instructions
+        self.port_slot = port_slot
+
+
+def compile_plan(comp_arrow: CompositeArrow) -> Plan:
+    """Compile comp_arrow into a Plan"""
+    port_slot = {}  # type: Dict[Port, int]
+    n_slots = 0
+    for port, equiv in port_equiv_index(comp_arrow).items():
+        if port not in port_slot:
+            for equiv_port in equiv:
+                port_slot[equiv_port] = n_slots
+            n_slots += 1
+
+    def slot(port: Port) -> int:
+        nonlocal n_slots
+        if port not in port_slot:
+            port_slot[port] = n_slots
+            n_slots += 1
+        return port_slot[port]
+
+    prims = [arrow for arrow in comp_arrow.get_sub_arrows_nested()
+             if not isinstance(arrow, CompositeArrow)]
+    in_slots = [slot(port) for port in comp_arrow.in_ports()]
+    prim_slots = {prim: (tuple(slot(port) for port in prim.in_ports()),
+                         tuple(slot(port) for port in prim.out_ports()))
+                  for prim in prims}
+    producer = {}  # type: Dict[int, Arrow]
+    for prim in prims:
+        for out_slot in prim_slots[prim][1]:
+            producer[out_slot] = prim
+
+    # Order primitives topologically, each waits on its unresolved inputs
+    n_waiting = {}  # type: Dict[Arrow, int]
+    consumers = {}  # type: Dict[Arrow, List[Arrow]]
+    for prim in prims:
+        n_waiting[prim] = 0
+        for in_slot in prim_slots[prim][0]:
+            if in_slot in producer:
+                n_waiting[prim] += 1
+                consumers.setdefault(producer[in_slot], []).append(prim)
+            else:
+                assert in_slot in in_slots, "No value will reach %s" % prim
+    order = [prim for prim in prims if n_waiting[prim] == 0]
+    for prim in order:
+        for consumer in consumers.get(prim, []):
+            n_waiting[consumer] -= 1
+            if n_waiting[consumer] == 0:
+                order.append(consumer)
+    assert len(order) == len(prims), "Must resolve inputs of each arrow first"
+
+    instructions = [(prim,) + prim_slots[prim] for prim in order]
+    out_slots = [slot(port) for port in comp_arrow.out_ports()]
+    return Plan(n_slots, in_slots, out_slots, instructions, port_slot)
+
+
+def get_plan(comp_arrow: CompositeArrow) -> Plan:
+    """Plan of comp_arrow, compiled only if it has changed since last time"""
+    if comp_arrow.plan is None:
+        comp_arrow.plan = compile_plan(comp_arrow)
+    return comp_arrow.plan
+
+
+def run_plan(conv: Callable,
+             plan: Plan,
+             inputs: List,
+             state: Dict,
+             port_grab: Dict[Port, Any]) -> List:
+    """Interpret a Plan on some inputs"""
+    values = [None] * plan.n_slots  # type: List[Any]
+    for in_slot, input_value in zip(plan.in_slots, inputs):
+        values[in_slot] = input_value
+
+    profile = state.get('exec_profile')
+    for sub_arrow, in_slots, out_slots in plan.instructions:
+        args = [values[i] for i in in_slots]
+        if profile is None:
+            outputs = conv(sub_arrow, args, state)
+        else:
+            outputs = profile.run(conv, sub_arrow, args, state)
+        assert len(outputs) == len(out_slots), "diff num outputs"
+        for out_slot, output in zip(out_slots, outputs):
+            values[out_slot] = output
+
+    # Extract some port, kind of a hack
+    for port in port_grab:
+        if port in plan.port_slot and values[plan.port_slot[port]] is not None:
+            port_grab[port] = values[plan.port_slot[port]]
+
+    return [values[i] for i in plan.out_slots]
+
+
 def interpret(conv: Callable,
               comp_arrow: CompositeArrow,
               inputs: List,
@@ -109,18 +219,10 @@ def interpret(conv: Callable,
         conv:
         comp_arrow: Composite Arrow to execute
         inputs: list of inputs to composite arrow
+        state: passed to conv; if state['exec_profile'] is an
+            ExecutionProfile the conversion of each primitive is recorded
     Returns:
         List of outputs
     """
-    arrow_colors = gen_arrow_colors(comp_arrow)
-    arrow_inputs = gen_arrow_inputs(comp_arrow, inputs, arrow_colors)
-    # FIXME: A horrible horrible hack to pass through port_grab to conv(a:CompositeArrow)
-    state['port_grab'] = port_grab
-    result = inner_interpret(conv,
-                             comp_arrow,
-                             inputs,
-                             arrow_colors,
-                             arrow_inputs,
-                             state,
-                             port_grab)
-    return result
+    assert len(inputs) == comp_arrow.num_in_ports(), "wrong # inputs"
+    return run_plan(conv, get_plan(comp_arrow), inputs, state, port_grab)
@@ -0,0 +1,280 @@
+"""Opt-in profiling of propagation and of interpretation.
+
+Usage:
+    with profiling() as profile:
+        propagate(arrow)
+    print(profile.report())
+
+    profile = ExecutionProfile()
+    apply(arrow, inputs, profile=profile)
+    print(profile.report())
+
+Or from the command line, on any function which returns an arrow:
+    python -m arrows.apply.profile test_arrows:test_twoxyplusx --invert
+"""
+import argparse
+import importlib
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+# Profiles which propagate records into, innermost last
+ACTIVE = []
+
+
+def current_profile():
+    """Profile propagate should record into, None if not profiling"""
+    return ACTIVE[-1] if len(ACTIVE) > 0 else None
+
+
+@contextmanager
+def profiling(profile=None):
+    """Record every call to propagate within the context into profile"""
+    profile = PropagationProfile() if profile is None else profile
+    ACTIVE.append(profile)
+    try:
+        yield profile
+    finally:
+        ACTIVE.pop()
+
+
+def fname(f) -> str:
+    return getattr(f, '__name__', repr(f))
+
+
+def attr_nbytes(value) -> int:
+    """Approximate memory used by a port attribute value"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return sys.getsizeof(value)
+
+
+class DispatchStats():
+    """Counters for a (arrow class, predicate, dispatch) triple"""
+    __slots__ = ('pred_calls', 'pred_true', 'pred_time', 'fires',
+                 'dispatch_time')
+
+    def __init__(self):
+        self.pred_calls = 0
+        self.pred_true = 0
+        self.pred_time = 0.0
+        self.fires = 0
+        self.dispatch_time = 0.0
+
+
+class PropagationProfile():
+    """Counters and timers of propagation"""
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.iterations = 0
+        # arrow class name -> number of times / seconds popped off working set
+        self.visits = defaultdict(int)
+        self.visit_time = defaultdict(float)
+        # (arrow class name, pred name, dispatch name) -> DispatchStats
+        self.dispatches = defaultdict(DispatchStats)
+        self.peak_ports = 0
+        self.peak_attrs = 0
+        self.peak_nbytes = 0
+
+    def pred(self, arrow, pred, dispatch, port_attr) -> bool:
+        """Evaluate pred(arrow, port_attr) and record it"""
+        start = time.perf_counter()
+        result = pred(arrow, port_attr)
+        stats = self.dispatches[(arrow.__class__.__name__, fname(pred),
+                                 fname(dispatch))]
+        stats.pred_time += time.perf_counter() - start
+        stats.pred_calls += 1
+        stats.pred_true += bool(result)
+        return result
+
+    def dispatch(self, arrow, pred, dispatch, port_attr):
+        """Evaluate dispatch(arrow, port_attr) and record it"""
+        start = time.perf_counter()
+        result = dispatch(arrow, port_attr)
+        stats = self.dispatches[(arrow.__class__.__name__, fname(pred),
+                                 fname(dispatch))]
+        stats.dispatch_time += time.perf_counter() - start
+        stats.fires += 1
+        return result
+
+    def visit(self, arrow, start: float) -> None:
+        """Record that arrow was taken from the working set at time start"""
+        self.iterations += 1
+        name = arrow.__class__.__name__
+        self.visits[name] += 1
+        self.visit_time[name] += time.perf_counter() - start
+
+    def finish(self, port_attr, start: float) -> None:
+        """Record the end of a call to propagate which began at start"""
+        self.calls += 1
+        self.time += time.perf_counter() - start
+        nattrs = sum(len(attrs) for attrs in port_attr.values())
+        nbytes = sum(attr_nbytes(value) for attrs in port_attr.values()
+                     for value in attrs.values())
+        self.peak_ports = max(self.peak_ports, len(port_attr))
+        self.peak_attrs = max(self.peak_attrs, nattrs)
+        self.peak_nbytes = max(self.peak_nbytes, nbytes)
+
+    def stats(self):
+        """Dict of all counters"""
+        return {'calls': self.calls,
+                'time': self.time,
+                'iterations': self.iterations,
+                'visits': dict(self.visits),
+                'visit_time': dict(self.visit_time),
+                'dispatches': {key: {slot: getattr(stats, slot)
+                                     for slot in DispatchStats.__slots__}
+                               for key, stats in self.dispatches.items()},
+                'peak_ports': self.peak_ports,
+                'peak_attrs': self.peak_attrs,
+                'peak_nbytes': self.peak_nbytes}
+
+    def report(self, top=20) -> str:
+        """Human readable summary, most expensive first"""
+        lines = ["%s propagate calls, %.3fs, %s iterations" %
+                 (self.calls, self.time, self.iterations),
+                 "Peak: %s ports, %s attributes, %.1f KB" %
+                 (self.peak_ports, self.peak_attrs, self.peak_nbytes / 1024),
+                 "",
+                 "%-28s %8s %10s" % ("arrow", "visits", "time (s)")]
+        by_time = sorted(self.visits, key=lambda k: -self.visit_time[k])
+        for name in by_time[:top]:
+            lines.append("%-28s %8d %10.4f" % (name, self.visits[name],
+                                               self.visit_time[name]))
+        lines += ["",
+                  "%-28s %-22s %-22s %7s %6s %9s %6s %9s" %
+                  ("arrow", "pred", "dispatch", "evals", "true", "pred (s)",
+                   "fires", "disp (s)")]
+        by_time = sorted(self.dispatches.items(),
+                         key=lambda item: -(item[1].pred_time +
+                                            item[1].dispatch_time))
+        for (arrow, pred, dispatch), stats in by_time[:top]:
+            lines.append("%-28s %-22s %-22s %7d %6d %9.4f %6d %9.4f" %
+                         (arrow[:28], pred[:22], dispatch[:22],
+                          stats.pred_calls, stats.pred_true, stats.pred_time,
+                          stats.fires, stats.dispatch_time))
+        return "\n".join(lines)
+
+
+def arrow_path(arrow, root=None):
+    """Arrows from the outermost composite (excluding root) down to arrow"""
+    path = []
+    while arrow is not None and arrow is not root:
+        path.append(arrow)
+        arrow = arrow.parent
+    return path[::-1]
+
+
+def scope_name(arrow, root=None) -> str:
+    """Tensorflow name scope for the ops of arrow, nested like its parents"""
+    names = [re.sub(r'[^A-Za-z0-9_.\-]', '_', a.name or a.__class__.__name__)
+             for a in arrow_path(arrow, root)]
+    return "/".join(names)
+
+
+class ExecutionProfile():
+    """Time spent interpreting each primitive arrow, attributed to its class
+    and to the class of every composite it is nested in.
+    Interpretation time is the time to convert an arrow, e.g. to construct
+    its tensorflow ops.  If `scope` is set (e.g. to tf.name_scope) the
+    operations of each arrow are created within a scope named after it, so
+    that op timings of a tensorflow trace can be added with add_run_metadata.
+    """
+
+    def __init__(self, scope=None):
+        self.scope = scope
+        self.root = None
+        # arrow -> number of times / seconds converted
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+        # name scope -> arrow and arrow -> seconds its ops ran for
+        self.scopes = {}
+        self.op_times = defaultdict(float)
+
+    def run(self, conv, arrow, args, state):
+        """Convert arrow with conv and record it"""
+        start = time.perf_counter()
+        if self.scope is None:
+            outputs = conv(arrow, args, state)
+        else:
+            with self.scope(scope_name(arrow, self.root)) as scope:
+                outputs = conv(arrow, args, state)
+            self.scopes[scope.rstrip('/')] = arrow
+        self.times[arrow] += time.perf_counter() - start
+        self.counts[arrow] += 1
+        return outputs
+
+    def add_run_metadata(self, run_metadata) -> None:
+        """Attribute the time of each op in a tensorflow trace
+        (RunMetadata of sess.run with trace_level=FULL_TRACE) to its arrow"""
+        for dev_stats in run_metadata.step_stats.dev_stats:
+            for node_stats in dev_stats.node_stats:
+                scope = node_stats.node_name.split(':')[0]
+                while scope not in self.scopes and '/' in scope:
+                    scope = scope.rsplit('/', 1)[0]
+                if scope in self.scopes:
+                    arrow = self.scopes[scope]
+                    self.op_times[arrow] += node_stats.all_end_rel_micros / 1e6
+
+    def by_class(self):
+        """{class name: [arrows, conversions, convert (s), run (s)]}, where
+        composites include everything nested within them"""
+        table = defaultdict(lambda: [set(), 0, 0.0, 0.0])
+        for arrow in set(self.times) | set(self.op_times):
+            for a in arrow_path(arrow, self.root):
+                row = table[a.__class__.__name__]
+                row[0].add(a)
+                row[1] += self.counts[arrow]
+                row[2] += self.times[arrow]
+                row[3] += self.op_times[arrow]
+        return {name: [len(row[0])] + row[1:] for name, row in table.items()}
+
+    def report(self, top=20) -> str:
+        """Arrow classes ranked by run time, then by conversion time"""
+        table = self.by_class()
+        lines = ["%-28s %7s %8s %12s %10s" %
+                 ("arrow", "arrows", "convs", "convert (s)", "run (s)")]
+        ranked = sorted(table.items(), key=lambda item: (-item[1][3], -item[1][2]))
+        for name, (narrows, nconvs, convert_time, run_time) in ranked[:top]:
+            lines.append("%-28s %7d %8d %12.4f %10.4f" %
+                         (name[:28], narrows, nconvs, convert_time, run_time))
+        return "\n".join(lines)
+
+
+def load_arrow(spec: str):
+    """Arrow returned by calling `module:function` with no arguments"""
+    module_name, function_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), function_name)()
+
+
+def main(argv=None):
+    # Not this module's profiling, which is __main__'s when run with -m
+    from arrows.apply.profile import profiling
+    from arrows.apply.propagate import propagate
+    from reverseflow.invert import invert
+    parser = argparse.ArgumentParser(
+        description="Profile propagation of an arrow")
+    parser.add_argument('arrow', help="module:function which returns an arrow")
+    parser.add_argument('--invert', action='store_true',
+                        help="profile inversion of the arrow, then its inverse")
+    parser.add_argument('--incremental', action='store_true',
+                        help="use the worklist propagation engine")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args(argv)
+    arrow = load_arrow(args.arrow)
+    with profiling() as profile:
+        if args.invert:
+            arrow = invert(arrow, incremental=args.incremental)
+        propagate(arrow, incremental=args.incremental)
+    print(profile.report(args.top))
+    return profile
+
+
+if __name__ == "__main__":
+    main()
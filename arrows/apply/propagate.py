@@ -4,17 +4,27 @@
 from arrows.port import Port
 from arrows.compositearrow import CompositeArrow
 from arrows.port_attributes import get_port_attr, PortAttributes
+from arrows.apply.profile import current_profile
+from arrows.apply.shapes import is_polymorphic, unify_shapes
+from arrows.primitive.array_arrows import COMPLEMENT_VALUES
+from arrows.util.hash import canonical_ports, sha1, structural_hash, value_key
+from arrows.util.io import save_pickle, load_pickle
+from arrows.util.lru import LRUCache
 
 from arrows.port_attributes import *
 from arrows.compositearrow import *
 from arrows.util.misc import *
 
 
-from copy import copy
-from typing import Dict, Callable, TypeVar, Any, Set
+from copy import copy, deepcopy
+import os
+import pickle
+import time
+from typing import Dict, Callable, TypeVar, Any, Set, Tuple, List
 from collections import defaultdict
 
 import numpy as np
+from pqdict import pqdict
 
 # FIXME: Really port_attr reflects two different kinds of things.
 # This which are actually about the ports themselves, i.e. whether its an out
@@ -29,7 +39,7 @@
 def resolve(x, y, fail_on_conflict=True):
     # _x = x
     # _y = y
-    if isinstance(x, np.ndarray) or isinstance(x, int) or isinstance(x, float) or isinstance(x, np.number):
+    if isinstance(x, (np.ndarray, int, float, np.number)):
         # _x = np.where(np.isfinite(x), x, y)
         # _y = np.where(np.isfinite(y), y, x)
         # diff = np.abs(_x - _y)
@@ -38,7 +48,8 @@ def resolve(x, y, fail_on_conflict=True):
         err = np.mean(diff)
         # if fail_on_conflict and err >= 1e-6:
         #     import pdb; pdb.set_trace()
-        assert not fail_on_conflict or err < 1e-6, "conflicting: %s, %s" % (x, y)
+        assert not fail_on_conflict or err < 1e-6, \
+            "conflicting: %s, %s" % (x, y)
     else:
         assert not fail_on_conflict or x == y, "conflicting: %s, %s" % (x, y)
     # if isinstance(x, int):
@@ -48,6 +59,14 @@ def resolve(x, y, fail_on_conflict=True):
     # return _x
     return x
 
+def resolve_shape(x, y, fail_on_conflict=True):
+    """Unify shapes x and y, which may have None (unknown) dimensions"""
+    try:
+        return unify_shapes([x, y])
+    except AssertionError:
+        assert not fail_on_conflict, "conflicting: %s, %s" % (x, y)
+        return x
+
 def update_port_attr(to_update: PortAttributes,
                      with_p: PortAttributes,
                      dont_update: Set,
@@ -55,7 +74,9 @@ def update_port_attr(to_update: PortAttributes,
                      fail_on_conflict=True):
     for key, value in with_p.items():
         if (do_update is None or key in do_update) and (key not in dont_update):
-            if key in to_update:
+            if key == 'shape' and key in to_update:
+                value = resolve_shape(value, to_update[key], fail_on_conflict)
+            elif key in to_update:
                 value = resolve(value, to_update[key], fail_on_conflict)
             to_update[key] = value
 
@@ -78,32 +99,43 @@ def update_neigh(sub_port_attr: PortAttributes,
                  context: CompositeArrow,
                  comp_arrow: CompositeArrow,
                  do_update,
-                 working_set: Set[Arrow]):
+                 working_set: Set[Arrow],
+                 refined: Set[Arrow]=None):
     """
-    For every port in sub_port_attr the port_attr data all of its connected nodes
+    For every port in sub_port_attr the port_attr data all of its connected
+    nodes
     Args:
         sub_port_attr: Port Attributes restricted to a particular arrow
         port_attr: Global PortAttributes for composition to be update
         context: The composition
         working_set: Set of arrows that need further propagation
+        refined: Set to add arrows to whose port shapes became more specific
     """
     for port, attrs in sub_port_attr.items():
         neigh_ports = equiv_neigh(port, context)
         for neigh_port in neigh_ports:
-            # If the neighbouring node doesn't have a key which I have, then it will
-            # have to be added to working set to propagate again
+            # If the neighbouring node doesn't have a key which I have, then it
+            # will have to be added to working set to propagate again
             if (neigh_port.arrow != comp_arrow):
-                neigh_attr_keys = port_attr[neigh_port].keys()
-                if any((attr_key not in neigh_attr_keys for attr_key in attrs.keys())):
+                neigh_attr = port_attr[neigh_port]
+                if any(attr_key not in neigh_attr for attr_key in attrs):
+                    working_set.add(neigh_port.arrow)
+                elif (refined is not None and 'shape' in attrs and
+                      is_polymorphic(neigh_attr['shape']) and
+                      tuple(attrs['shape']) != tuple(neigh_attr['shape'])):
                     working_set.add(neigh_port.arrow)
-            update_port_attr(port_attr[neigh_port], attrs, dont_update=DONT_PROP, do_update=do_update)
+                    refined.add(neigh_port.arrow)
+            update_port_attr(port_attr[neigh_port], attrs,
+                             dont_update=DONT_PROP, do_update=do_update)
         # Update global with this port
-        update_port_attr(port_attr[port], attrs, dont_update=DONT_PROP, do_update=do_update)
+        update_port_attr(port_attr[port], attrs, dont_update=DONT_PROP,
+                         do_update=do_update)
 
 
 def extract_port_attr(comp_arrow, port_attr):
     for sub_arrow in comp_arrow.get_all_arrows():
-        if isinstance(sub_arrow, CompositeArrow) and sub_arrow is not comp_arrow:
+        if (isinstance(sub_arrow, CompositeArrow) and
+                sub_arrow is not comp_arrow):
             extract_port_attr(sub_arrow, port_attr)
         else:
             for port in sub_arrow.ports():
@@ -112,6 +144,308 @@ def extract_port_attr(comp_arrow, port_attr):
                     port_attr[port] = {}
                 update_port_attr(port_attr[port], attributes, set())
 
+def port_equiv_index(comp_arrow: CompositeArrow
+                     ) -> Dict[Port, Tuple[Port, ...]]:
+    """
+    Map every connected port to all the ports it is equivalent to
+    Equivalence is the transitive closure of the edges of `comp_arrow` and of
+    every composite nested within it, so a class crosses composite boundaries.
+    Each class includes the port itself.
+    """
+    contexts = [comp_arrow] + [arrow
+                               for arrow in comp_arrow.get_sub_arrows_nested()
+                               if isinstance(arrow, CompositeArrow)]
+    neighs = defaultdict(list)
+    for context in contexts:
+        for left, right in context.edges.items():
+            neighs[left].append(right)
+            neighs[right].append(left)
+
+    index = {}
+    for port in neighs:
+        if port not in index:
+            equiv = [port]
+            seen = set(equiv)
+            for equiv_port in equiv:
+                for neigh in neighs[equiv_port]:
+                    if neigh not in seen:
+                        seen.add(neigh)
+                        equiv.append(neigh)
+            equiv = tuple(equiv)
+            for equiv_port in equiv:
+                index[equiv_port] = equiv
+    return index
+
+
+def topo_order(context: CompositeArrow) -> List[Arrow]:
+    """Sub arrows of `context` in topological order, arrows on cycles last"""
+    sub_arrows = list(context.get_sub_arrows())
+    succs = defaultdict(list)
+    nin = {arrow: 0 for arrow in sub_arrows}
+    for left, right in context.edges.items():
+        if left.arrow is not context and right.arrow is not context:
+            succs[left.arrow].append(right.arrow)
+            nin[right.arrow] += 1
+    order = [arrow for arrow in sub_arrows if nin[arrow] == 0]
+    for arrow in order:
+        for succ in succs[arrow]:
+            nin[succ] -= 1
+            if nin[succ] == 0:
+                order.append(succ)
+    ordered = set(order)
+    order.extend(arrow for arrow in sub_arrows if arrow not in ordered)
+    return order
+
+
+def topo_priority(comp_arrow: CompositeArrow,
+                  prefix: Tuple[int, ...]=(),
+                  priority=None) -> Dict[Arrow, Tuple[int, ...]]:
+    """
+    Priority of every arrow nested in `comp_arrow` such that sub arrows come
+    after their parents and, within a composition, in topological order
+    """
+    priority = {} if priority is None else priority
+    for i, sub_arrow in enumerate(topo_order(comp_arrow)):
+        priority[sub_arrow] = prefix + (i,)
+        if isinstance(sub_arrow, CompositeArrow):
+            topo_priority(sub_arrow, prefix + (i,), priority)
+    return priority
+
+
+# Key recorded when a predicate depends on every attribute of a port
+ANY_ATTR = None
+
+
+class RecordReads():
+    """Attributes of a port which record which keys a predicate looks at"""
+
+    def __init__(self, port: Port, attrs: Dict, reads: Set):
+        self.port = port
+        self.attrs = attrs
+        self.reads = reads
+
+    def __contains__(self, key):
+        self.reads.add((self.port, key))
+        return key in self.attrs
+
+    def __getitem__(self, key):
+        self.reads.add((self.port, key))
+        return self.attrs[key]
+
+    def get(self, key, default=None):
+        self.reads.add((self.port, key))
+        return self.attrs.get(key, default)
+
+    def keys(self):
+        self.reads.add((self.port, ANY_ATTR))
+        return self.attrs.keys()
+
+    def items(self):
+        self.reads.add((self.port, ANY_ATTR))
+        return self.attrs.items()
+
+    def values(self):
+        self.reads.add((self.port, ANY_ATTR))
+        return self.attrs.values()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+
+def propagate_worklist(comp_arrow: CompositeArrow,
+                       port_attr: PortAttributes,
+                       already_prop: Set,
+                       only_prop=None,
+                       profile=None) -> None:
+    """
+    Propagate to a fixed point with a worklist, updating `port_attr` in place
+    Unlike the default engine this:
+    - Builds the port equivalence classes once, rather than searching the
+      neighbourhood of a port each time it is updated
+    - Only floods the attribute keys which are new to a port, and only visits
+      arrows whose ports actually gained a key
+    - Only reevaluates a predicate if one of the (port, key) pairs it read
+      when it last failed has since changed
+    - Visits arrows in topological order
+    Args:
+        comp_arrow: Composite Arrow to propagate through
+        port_attr: port->attributes for every port in comp_arrow
+        already_prop: (arrow, dispatch) pairs which have already fired
+        only_prop: If not None, only propagate these attribute keys
+        profile: If not None, PropagationProfile to record into
+    """
+    equiv = port_equiv_index(comp_arrow)
+    priority = topo_priority(comp_arrow)
+    sub_arrows = list(priority.keys())
+    dispatches = {arrow: arrow.get_dispatches() for arrow in sub_arrows}
+    working_set = pqdict(priority)
+    changed = defaultdict(set)
+    pred_reads = {}
+    # Ports whose shapes became more specific, and dispatches fired here
+    refined = defaultdict(set)
+    fired_here = set()
+
+    def update(port: Port, attrs: Dict) -> None:
+        for key, value in attrs.items():
+            if key in DONT_PROP or (only_prop is not None and
+                                    key not in only_prop):
+                continue
+            for equiv_port in equiv.get(port, (port,)):
+                equiv_attr = port_attr[equiv_port]
+                if key in equiv_attr:
+                    if key != 'shape':
+                        equiv_attr[key] = resolve(value, equiv_attr[key])
+                        continue
+                    # A shape may become more specific, e.g. (None, 1) to (4, 1)
+                    value = resolve_shape(value, equiv_attr[key])
+                    if value == tuple(equiv_attr[key]):
+                        continue
+                    refined[equiv_port.arrow].add((equiv_port, key))
+                equiv_attr[key] = value
+                arrow = equiv_port.arrow
+                if arrow is not comp_arrow:
+                    changed[arrow].update(((equiv_port, key),
+                                           (equiv_port, ANY_ATTR)))
+                    if arrow not in working_set:
+                        working_set[arrow] = priority[arrow]
+
+    def fire(sub_arrow: Arrow, pred, dispatch,
+             sub_port_attr: PortAttributes) -> None:
+        if profile is None:
+            new_sub_port_attr = dispatch(sub_arrow, sub_port_attr)
+        else:
+            new_sub_port_attr = profile.dispatch(sub_arrow, pred, dispatch,
+                                                 sub_port_attr)
+        for port, attrs in new_sub_port_attr.items():
+            update(port, attrs)
+
+    # Ports exposed at the top level and ports of nested composites start
+    # with information which their neighbours may not have yet
+    for port in list(port_attr.keys()):
+        if is_exposed(port, comp_arrow) or (
+                port.arrow in priority and
+                isinstance(port.arrow, CompositeArrow)):
+            update(port, dict(port_attr[port]))
+
+    while len(working_set) > 0:
+        sub_arrow, _ = working_set.popitem()
+        start = None if profile is None else time.perf_counter()
+        sub_changed = changed.pop(sub_arrow, set())
+        sub_refined = refined.pop(sub_arrow, set())
+        sub_port_attr = {port: port_attr[port] for port in sub_arrow.ports()}
+        for pred, dispatch in dispatches[sub_arrow].items():
+            if (sub_arrow, dispatch) in already_prop:
+                # Fire again only to refine shapes computed from shapes with
+                # dimensions of unknown size
+                if len(sub_refined) > 0 and (sub_arrow, dispatch) in fired_here:
+                    fire(sub_arrow, pred, dispatch, sub_port_attr)
+                continue
+            reads = pred_reads.get((sub_arrow, pred))
+            if reads is not None and reads.isdisjoint(sub_changed):
+                continue
+            reads = set()
+            recorder = {port: RecordReads(port, attrs, reads)
+                        for port, attrs in sub_port_attr.items()}
+            if profile is None:
+                fired = pred(sub_arrow, recorder)
+            else:
+                fired = profile.pred(sub_arrow, pred, dispatch, recorder)
+            if fired:
+                fire(sub_arrow, pred, dispatch, sub_port_attr)
+                already_prop.add((sub_arrow, dispatch))
+                fired_here.add((sub_arrow, dispatch))
+            else:
+                pred_reads[(sub_arrow, pred)] = reads
+        if profile is not None:
+            profile.visit(sub_arrow, start)
+
+
+# Cache of propagation results, see enable_propagate_cache
+PROPAGATE_CACHE = LRUCache(128)
+PROPAGATE_CACHE_OPTIONS = {'enabled': False, 'cache_dir': None}
+
+
+def enable_propagate_cache(enabled=True, size=128, cache_dir=None) -> None:
+    """Reuse the results of `propagate` for arrows with the same structural
+    hash and input port attributes.
+    Args:
+        enabled: Whether propagate uses the cache by default
+        size: Number of results kept in memory, least recently used first out
+        cache_dir: If not None also persist results as pickles in this dir"""
+    PROPAGATE_CACHE_OPTIONS.update({'enabled': enabled,
+                                    'cache_dir': cache_dir})
+    PROPAGATE_CACHE.resize(size)
+
+
+def clear_propagate_cache() -> None:
+    PROPAGATE_CACHE.clear()
+
+
+def propagate_key(comp_arrow: CompositeArrow, port_attr, ids, only_prop,
+                  incremental) -> str:
+    """Key of a call of propagate, which is independent of which of
+    (structurally) equal arrows is propagated"""
+    inputs = sorted(value_key(ids[port]) + ":" + value_key(attrs)
+                    for port, attrs in port_attr.items())
+    only = None if only_prop is None else sorted(only_prop)
+    return sha1("%s|%s|%s|%s|%s" % (structural_hash(comp_arrow),
+                                    ",".join(inputs), only, incremental,
+                                    COMPLEMENT_VALUES['enabled']))
+
+
+def cache_get(key: str):
+    """Canonical propagation result for key, or None"""
+    result = PROPAGATE_CACHE.get(key)
+    if result is not None:
+        return result
+    cache_dir = PROPAGATE_CACHE_OPTIONS['cache_dir']
+    if cache_dir is not None:
+        # A truncated or otherwise unreadable file is a cache miss
+        result = load_pickle(os.path.join(cache_dir, "%s.pkl" % key))
+        if result is not None:
+            cache_put(key, result, persist=False)
+            return result
+    return None
+
+
+def cache_put(key: str, result, persist=True) -> None:
+    PROPAGATE_CACHE.put(key, result)
+    cache_dir = PROPAGATE_CACHE_OPTIONS['cache_dir']
+    if persist and cache_dir is not None:
+        try:
+            save_pickle(result, os.path.join(cache_dir, "%s.pkl" % key))
+        except (pickle.PicklingError, TypeError, AttributeError, OSError) as e:
+            print("WARNING: Could not persist propagation result: %s" % e)
+
+
+def cached_propagate(comp_arrow: CompositeArrow, port_attr, only_prop,
+                     incremental, profile) -> PortAttributes:
+    """propagate, reusing the result of a previous call on an equal arrow"""
+    ids = canonical_ports(comp_arrow)
+    if any(port not in ids for port in port_attr):
+        return propagate(comp_arrow, port_attr, only_prop=only_prop,
+                         incremental=incremental, profile=profile, cache=False)
+    key = propagate_key(comp_arrow, port_attr, ids, only_prop, incremental)
+    result = cache_get(key)
+    if result is None:
+        _port_attr = propagate(comp_arrow, port_attr, only_prop=only_prop,
+                               incremental=incremental, profile=profile,
+                               cache=False)
+        result = [(ids[port], attrs) for port, attrs in _port_attr.items()
+                  if port in ids]
+        cache_put(key, result)
+
+    # Copy so that callers can change the result
+    ports = {port_id: port for port, port_id in ids.items()}
+    _port_attr = defaultdict(lambda: dict())
+    for port_id, attrs in result:
+        _port_attr[ports[port_id]] = deepcopy(attrs)
+    return _port_attr
+
+
 #FIXME: Does unnecessary Propagate, will do a dispatch more than once
 # which is (probably) never needed
 # FIXME: There is a loss of information bug from port_attr,
@@ -120,7 +454,10 @@ def propagate(comp_arrow: CompositeArrow,
               port_attr: PortAttributes=None,
               state=None,
               already_prop=None,
-              only_prop=None) -> PortAttributes:
+              only_prop=None,
+              incremental=False,
+              profile=None,
+              cache=None) -> PortAttributes:
     """
     Propagate values around a composite arrow to determine knowns from unknowns
     The knowns should be determined by the knowns, otherwise an error throws
@@ -131,11 +468,27 @@ def propagate(comp_arrow: CompositeArrow,
         port_attr: port->value map for inputs to composite arrow
         state: A value of any type that is passed around during propagation
                and can be updated by sub_propagate
+        incremental: Use the worklist engine `propagate_worklist`, which
+            does not support state
+        profile: PropagationProfile to record counters and timings into,
+            defaults to the one of the enclosing `profiling()` context if any
+        cache: Whether to reuse results of previous calls on equal arrows,
+            defaults to what was set with `enable_propagate_cache`.
+            Not used when already_prop or state is given, as a cached
+            result would not update state
     Returns:
         port->value map for all ports in composite arrow
     """
+    assert not (incremental and state is not None), \
+        "propagate_worklist does not support state"
+    cache = PROPAGATE_CACHE_OPTIONS['enabled'] if cache is None else cache
+    if cache and already_prop is None and state is None:
+        return cached_propagate(comp_arrow,
+                                {} if port_attr is None else port_attr,
+                                only_prop, incremental, profile)
     already_prop = set() if already_prop is None else already_prop
-    print("Propagating")
+    profile = current_profile() if profile is None else profile
+    start = None if profile is None else time.perf_counter()
     # Copy port_attr to avoid affecting input
     port_attr = {} if port_attr is None else port_attr
     _port_attr = defaultdict(lambda: dict())
@@ -149,25 +502,57 @@ def propagate(comp_arrow: CompositeArrow,
     # update port_attr with values stored on port
     extract_port_attr(comp_arrow, _port_attr)
 
+    if incremental:
+        propagate_worklist(comp_arrow, _port_attr, already_prop, only_prop,
+                           profile)
+        if profile is not None:
+            profile.finish(_port_attr, start)
+        return _port_attr
+
     updated = set(comp_arrow.get_sub_arrows_nested())
-    update_neigh(_port_attr, _port_attr, comp_arrow, comp_arrow, only_prop, updated)
+    # Arrows to fire again since shapes of their ports became more specific
+    refined = set()
+    fired_here = set()
+    update_neigh(_port_attr, _port_attr, comp_arrow, comp_arrow, only_prop,
+                 updated)
     while len(updated) > 0:
         # print(len(updated), " arrows updating in proapgation iteration")
         sub_arrow = updated.pop()
+        refire = sub_arrow in refined
+        refined.discard(sub_arrow)
+        visit_start = None if profile is None else time.perf_counter()
         sub_port_attr = {port: _port_attr[port]
                            for port in sub_arrow.ports()
                            if port in _port_attr}
 
         pred_dispatches = sub_arrow.get_dispatches()
         for pred, dispatch in pred_dispatches.items():
-            if pred(sub_arrow, sub_port_attr) and (sub_arrow, dispatch) not in already_prop:
-                new_sub_port_attr = dispatch(sub_arrow, sub_port_attr)
-                update_neigh(new_sub_port_attr, _port_attr, sub_arrow.parent, comp_arrow, only_prop, updated)
+            if profile is None:
+                fired = pred(sub_arrow, sub_port_attr)
+            else:
+                fired = profile.pred(sub_arrow, pred, dispatch, sub_port_attr)
+            if fired and ((sub_arrow, dispatch) not in already_prop or
+                          refire and (sub_arrow, dispatch) in fired_here):
+                if profile is None:
+                    new_sub_port_attr = dispatch(sub_arrow, sub_port_attr)
+                else:
+                    new_sub_port_attr = profile.dispatch(sub_arrow, pred,
+                                                         dispatch,
+                                                         sub_port_attr)
+                update_neigh(new_sub_port_attr, _port_attr, sub_arrow.parent,
+                             comp_arrow, only_prop, updated, refined)
                 already_prop.add((sub_arrow, dispatch))
+                fired_here.add((sub_arrow, dispatch))
         if isinstance(sub_arrow, CompositeArrow):
-            # new_sub_port_attr = propagate(sub_arrow, sub_port_attr, state, already_prop)
+            # new_sub_port_attr = propagate(sub_arrow, sub_port_attr, state,
+            #                               already_prop)
             # update_neigh(new_sub_port_attr, _port_attr, comp_arrow, updated)
-            update_neigh(sub_port_attr, _port_attr, sub_arrow, comp_arrow, only_prop, updated)
-            update_neigh(sub_port_attr, _port_attr, sub_arrow.parent, comp_arrow, only_prop, updated)
-    print("Done Propagating")
+            update_neigh(sub_port_attr, _port_attr, sub_arrow, comp_arrow,
+                         only_prop, updated, refined)
+            update_neigh(sub_port_attr, _port_attr, sub_arrow.parent,
+                         comp_arrow, only_prop, updated, refined)
+        if profile is not None:
+            profile.visit(sub_arrow, visit_start)
+    if profile is not None:
+        profile.finish(_port_attr, start)
     return _port_attr
@@ -5,6 +5,30 @@
 from numpy import ndarray
 from arrows.util.misc import *
 import numpy
+from typing import Sequence, Tuple
+
+
+def unify_shapes(shapes: Sequence) -> Tuple:
+    """Most specific shape compatible with all of `shapes`, where a dimension
+    of None (e.g. a batch dimension) matches any size
+    Args:
+        shapes: Sequence of shapes, each a tuple or list of ints or None
+    Returns:
+        Tuple which is None only in dimensions where all shapes are None"""
+    shapes = [tuple(shape) for shape in shapes]
+    assert same([len(shape) for shape in shapes]), \
+        "Shapes have different ranks %s" % shapes
+    unified = []
+    for dims in zip(*shapes):
+        known = set(dim for dim in dims if dim is not None)
+        assert len(known) <= 1, "Shapes incompatible %s" % shapes
+        unified.append(known.pop() if known else None)
+    return tuple(unified)
+
+
+def is_polymorphic(shape) -> bool:
+    """Does shape have a dimension of unknown (None) size"""
+    return any(dim is None for dim in shape)
 
 
 def shape_pred(arr, port_attr: PortAttributes):
@@ -26,8 +50,7 @@ def shape_dispatch(arr, port_attr: PortAttributes):
     #         shape = s
     # return {port: {'shape': shape} for port in arr.out_ports()}
     #
-    assert same(shapes), "All shapes should be the same %s" % pts
-    shape = shapes[0]
+    shape = unify_shapes(shapes)
     return {port: {'shape': shape} for port in arr.ports()}
 
 
@@ -77,6 +100,12 @@ def source_dispatch(a, port_values: PortAttributes, state=None):
                                    'constant': CONST}}
 
 
+def batch_shape(value, shape):
+    """Leading dimensions of `value` in excess of `shape`, the shape of a
+    single example.  Empty unless value is a batch of examples"""
+    return numpy.shape(value)[:max(0, numpy.ndim(value) - len(shape))]
+
+
 def val_to_shape_pred(arr, port_attr: PortAttributes):
     return True
 
@@ -30,19 +30,53 @@ def all_ports(self):
     def port(self, index: int):
         return self.ports()[index]
 
+    # Tuples of (in, out, param, error) ports, None until computed
+    _port_kinds = None
+
+    def port_kinds(self):
+        """Tuples of in, out, param and error ports of the arrow, cached until
+        a port is added or changes kind"""
+        if self._port_kinds is None:
+            ports = self.ports()
+            self._port_kinds = (tuple(filter(pa.is_in_port, ports)),
+                                tuple(filter(pa.is_out_port, ports)),
+                                tuple(filter(pa.is_param_port, ports)),
+                                tuple(filter(pa.is_error_port, ports)))
+        return self._port_kinds
+
+    def invalidate_port_kinds(self) -> None:
+        self._port_kinds = None
+
+    # Structural hash (see arrows.util.hash), None until computed
+    _structural_hash = None
+
+    def invalidate_hash(self) -> None:
+        """Discard structural hash of this arrow and those it is in"""
+        arrow = self
+        while arrow is not None:
+            arrow._structural_hash = None
+            arrow = arrow.parent
+
+    def invalidate_plan(self) -> None:
+        """Discard structural hashes of this arrow and those it is in, and
+        interpretation plans of the latter"""
+        self._structural_hash = None
+        if self.parent is not None:
+            self.parent.invalidate_plan()
+
     def in_ports(self, idx=None):
         """
         Get InPorts of an Arrow.
         Returns:
             List of InPorts
         """
-        return [port for port in self._ports if pa.is_in_port(port)]
+        return list(self.port_kinds()[0])
 
     def in_port(self, index: int):
         """
         Get ith InPort
         """
-        return self.in_ports()[index]
+        return self.port_kinds()[0][index]
 
     def param_ports(self):
         """
@@ -50,7 +84,7 @@ def param_ports(self):
         Returns:
             List of ParamPorts
         """
-        return [port for port in self._ports if pa.is_param_port(port)]
+        return list(self.port_kinds()[2])
 
     def error_ports(self):
         """
@@ -58,7 +92,7 @@ def error_ports(self):
         Returns:
             List of ErrorPorts
         """
-        return [port for port in self._ports if pa.is_error_port(port)]
+        return list(self.port_kinds()[3])
 
     def out_ports(self):
         """
@@ -66,28 +100,28 @@ def out_ports(self):
         Returns:
             List of OutPorts
         """
-        return [port for port in self._ports if pa.is_out_port(port)]
+        return list(self.port_kinds()[1])
 
     def out_port(self, index: int):
         """
         Get ith OutPort
         """
-        return self.out_ports()[index]
+        return self.port_kinds()[1][index]
 
     def num_ports(self) -> int:
         return len(self.ports())
 
     def num_in_ports(self) -> int:
-        return len(self.in_ports())
+        return len(self.port_kinds()[0])
 
     def num_out_ports(self) -> int:
-        return len(self.out_ports())
+        return len(self.port_kinds()[1])
 
     def num_param_ports(self) -> int:
-        return len(self.param_ports())
+        return len(self.port_kinds()[2])
 
     def num_error_ports(self) -> int:
-        return len(self.error_ports())
+        return len(self.port_kinds()[3])
 
     def is_primitive(self) -> bool:
         return False
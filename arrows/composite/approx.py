@@ -197,11 +197,13 @@ def ibi_bwd_disp(arr: "IntervalBoundIdentity", port_attr: PortAttributes):
     inp = arr.in_port(0)
     if np.mean(err) < 1e-6:
         return {inp: {'value': out_val}}
-    if np.array_equal(arr.u, out_val):
-        return {inp: {'value': arr.u + err}}
-    if np.array_equal(arr.l, out_val):
-        return {inp: {'value': arr.l - err}}
-    return {}
+    # Elementwise, so that out_val may be a batch
+    at_u = np.isclose(out_val, arr.u)
+    at_l = np.isclose(out_val, arr.l)
+    if not np.all(at_u | at_l | np.isclose(err, 0)):
+        return {}
+    in_val = np.where(at_u, arr.u + err, np.where(at_l, arr.l - err, out_val))
+    return {inp: {'value': in_val}}
 
 class IntervalBoundIdentity(CompositeArrow):
     """
@@ -7,7 +7,7 @@
 from arrows.primitive.math_arrows import *
 from arrows.sourcearrow import SourceArrow
 from arrows.port_attributes import make_in_port, make_out_port, make_param_port
-from arrows.apply.apply import apply
+from arrows.apply.apply import apply, compile_arrow
 from reverseflow.invert import invert
 from reverseflow.inv_primitives.inv_math_arrows import *
 import numpy as np
@@ -49,10 +49,9 @@ def sample(self, shape = [1]):
         for shape_dim in shape:
             size = size * shape_dim
         p_values = np.random.uniform(size = size)
-        samples = []
-        for p in p_values:
-            sample = apply(self.quantile, [p])
-            samples.append(sample[0])
+        quantile = compile_arrow(self.quantile)
+        samples = [sample[0]
+                   for sample in quantile.map([[p] for p in p_values])]
         samples = np.asarray(samples)
         return np.reshape(samples, shape)
 
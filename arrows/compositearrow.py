@@ -71,10 +71,8 @@ def neigh_out_ports(self, in_port: Port) -> Sequence[Port]:
     def neigh_ports(self, port: Port) -> Sequence[Port]:
         if port in self.edges:
             return list(self.edges.fwd(port))
-        elif port in self.edges.right_to_left:
-            return list(self.edges.inv(port))
         else:
-            return []
+            return list(self.edges.inv(port))
 
     def get_all_arrows(self) -> Set[Arrow]:
         """Return all arrows including self"""
@@ -156,13 +154,16 @@ def add_edge(self, left: Port, right: Port):
             left: Projecting Port
             right: receiving Port
         """
-        assert left.arrow.parent is self or left.arrow.parent is None
-        assert right.arrow.parent is self or right.arrow.parent is None
+        assert (left.arrow is self or left.arrow.parent is self or
+                left.arrow.parent is None)
+        assert (right.arrow is self or right.arrow.parent is self or
+                right.arrow.parent is None)
         if left.arrow is not self:
             left.arrow.parent = self
         if right.arrow is not self:
             right.arrow.parent = self
         self.edges.add(left, right)
+        self.invalidate_plan()
 
     def remove_edge(self, left: Port, right: Port):
         """Remove an edge from the composite arrow
@@ -171,7 +172,16 @@ def remove_edge(self, left: Port, right: Port):
             right: receiving Port
         """
         self.edges.remove(left, right)
+        self.invalidate_plan()
 
+    def invalidate_plan(self) -> None:
+        """Discard interpretation plans and structural hashes of this arrow
+        and those it is in"""
+        arrow = self
+        while arrow is not None:
+            arrow.plan = None
+            arrow._structural_hash = None
+            arrow = arrow.parent
 
     def add_port(self, port_attr=None) -> Port:
         """Add a port to the arrow"""
@@ -182,48 +192,55 @@ def add_port(self, port_attr=None) -> Port:
             self.port_attr.append(port_attr)
         else:
             self.port_attr.append({})
+        self.invalidate_plan()
+        self.invalidate_port_kinds()
         return port
 
     def ports(self) -> List[Port]:
         return self._ports
 
     def __deepcopy__(self, memo):
+        return self.clone()
+
+    def clone(self, validate=False, suffix="_copy") -> "CompositeArrow":
+        """Copy of this arrow and every arrow nested within it.
+        Edges are copied in one pass through a map from each arrow to its
+        copy.  Port attribute values and values of source arrows are shared
+        rather than copied, see `copy_port_attr`.
+        Args:
+            validate: Check every copied composite is wired correctly
+            suffix: Appended to the names of the copies
+        Returns:
+            Copy whose sub arrows have the copy as parent"""
         new_arrow = copy(self)
-        new_edges = Relation()
-        new_name = None
-        if self.name != None:
-            new_name = self.name + "_copy"
-        new_arrow.name = new_name
+        if self.name is not None:
+            new_arrow.name = self.name + suffix
         new_arrow.parent = None
-
-        new_port_attr = [] # type: List[Dict]
-        for attribute in self.port_attr:
-            new_port_attr.append(deepcopy(attribute))
-        new_arrow.port_attr = new_port_attr
-
+        new_arrow.plan = None
+        new_arrow.invalidate_port_kinds()
+        new_arrow.port_attr = [copy_port_attr(attr) for attr in self.port_attr]
         new_arrow._ports = [Port(new_arrow, i) for i in range(self.num_ports())]
 
         copies = {self: new_arrow}
         for sub_arrow in self.get_sub_arrows():
-            copies[sub_arrow] = deepcopy(sub_arrow)
-            assert copies[sub_arrow].parent == None, "sub_arrow can't have a parent yet"
-
+            if isinstance(sub_arrow, CompositeArrow):
+                sub_copy = sub_arrow.clone(validate, suffix)
+            else:
+                sub_copy = deepcopy(sub_arrow)
+                if sub_arrow.name is not None:
+                    sub_copy.name = sub_arrow.name + suffix
+            sub_copy.parent = new_arrow
+            copies[sub_arrow] = sub_copy
+
+        new_edges = self.edges.__class__()
         for out_port, in_port in self.edges.items():
-            assert out_port.arrow in copies, "sub_arrow not copied"
-            assert in_port.arrow in copies, "sub_arrow not copied"
-            new_out = copies[out_port.arrow].ports()[out_port.index]
-            new_in = copies[in_port.arrow].ports()[in_port.index]
-            assert new_out.arrow == copies[out_port.arrow], "port not copied properly"
-            assert new_in.arrow == copies[in_port.arrow], "port not copied properly"
-            new_edges.add(new_out, new_in)
-
+            new_edges.add(copies[out_port.arrow]._ports[out_port.index],
+                          copies[in_port.arrow]._ports[in_port.index])
         new_arrow.edges = new_edges
-        assert new_arrow.num_ports() == len(new_arrow.port_attr), "incorrect number of attributes"
-        assert new_arrow.is_wired_correctly(), "arrow copy is wired incorrectly"
-        assert new_arrow.are_sub_arrows_parentless(), "sub_arrows can't have a parent yet"
-        for sub_arrow in new_arrow.get_sub_arrows():
-            sub_arrow.parent = new_arrow
 
+        if validate:
+            assert new_arrow.num_ports() == len(new_arrow.port_attr), "incorrect number of attributes"
+            assert new_arrow.is_wired_correctly(), "arrow copy is wired incorrectly"
         return new_arrow
 
 
@@ -260,7 +277,8 @@ def __init__(self,
                  out_ports: Sequence[Port]=None,
                  name: str=None,
                  parent=None,
-                 port_attr=None) -> None:
+                 port_attr=None,
+                 edge_store=Relation) -> None:
         """
         Args:
             edges: wires mapping out_ports to in_ports
@@ -269,6 +287,8 @@ def __init__(self,
             name: name of composition
             parent: Composite arrow this arrow is embedded in
             port_attr: tags for ports
+            edge_store: Relation class to store edges in, e.g. ArrayRelation
+                for arrows with very many edges
         Returns:
             Composite Arrow
 
@@ -276,7 +296,8 @@ def __init__(self,
         """
         super().__init__(name=name)
 
-        self.edges = Relation()
+        self.plan = None
+        self.edges = edge_store()
         self._ports = []
         self.port_attr = []
 
@@ -299,6 +320,7 @@ def __init__(self,
         if port_attr:
             assert len(port_attr) == n_ports
             self.port_attr = port_attr
+            self.invalidate_port_kinds()
 
         assert self.is_wired_correctly(), "The arrow is wired incorrectly"
         assert self.are_sub_arrows_parentless(), "subarrows must be parentless"
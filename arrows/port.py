@@ -10,6 +10,7 @@ class Port():
 
     A port is uniquely determined by the arrow it belongs to and a index.
     """
+    __slots__ = ('arrow', 'index')
 
     def __init__(self, arrow, index: int) -> None:
         self.arrow = arrow
@@ -30,10 +31,17 @@ def __ne__(self, other):
     def __hash__(self):
         return hash(self.arrow) + hash(self.index)
 
+    def __reduce__(self):
+        # Ports are dict keys (e.g. in edges) so must be hashable as soon as
+        # they are unpickled
+        return (self.__class__, (self.arrow, self.index))
+
 
 class InPort(Port):
     """Input port
     Transfers data from the outside arrow to 'In' side"""
+    __slots__ = ()
+
     def __str__(self):
         return "In%s" % super().__str__()
 
@@ -44,6 +52,8 @@ def __repr__(self):
 class OutPort(Port):
     """Output port
     Transfers data from the inside arrow to 'Out' side"""
+    __slots__ = ()
+
     def __str__(self):
         return "Out%s" % super().__str__()
 
@@ -6,6 +6,9 @@
 def make_in_port(port: Port) -> None:
     """Make 'port' an InPort"""
     port.arrow.port_attr[port.index]["InOut"] = "InPort"
+    port.arrow.invalidate_port_kinds()
+    # Plans depend on which ports are in and out ports
+    port.arrow.invalidate_plan()
 
 
 def is_in_port(port: Port) -> bool:
@@ -17,6 +20,8 @@ def is_in_port(port: Port) -> bool:
 def make_out_port(port: Port) -> None:
     """Make 'port' an OutPort"""
     port.arrow.port_attr[port.index]["InOut"] = "OutPort"
+    port.arrow.invalidate_port_kinds()
+    port.arrow.invalidate_plan()
 
 
 def is_out_port(port: Port):
@@ -29,12 +34,16 @@ def make_param_port(port: Port) -> None:
     """Make `port` as a parametric port"""
     assert is_in_port(port)
     port.arrow.port_attr[port.index]["parametric"] = True
+    port.arrow.invalidate_port_kinds()
+    port.arrow.invalidate_hash()
 
 
 def make_not_param_port(port: Port) -> None:
     """Make `port` as a not parametric port"""
     assert is_in_port(port)
     port.arrow.port_attr[port.index].pop('parametric', None)
+    port.arrow.invalidate_port_kinds()
+    port.arrow.invalidate_hash()
 
 
 def is_param_port(port: Port) -> bool:
@@ -47,6 +56,8 @@ def make_error_port(port: Port) -> None:
     """Make `port` as a error port"""
     assert is_out_port(port), "An error port must be error to be an out_port"
     port.arrow.port_attr[port.index]["error"] = True
+    port.arrow.invalidate_port_kinds()
+    port.arrow.invalidate_hash()
 
 
 def is_error_port(port: Port) -> bool:
@@ -61,6 +72,7 @@ def add_port_label(port: Port, label: str):
     if "labels" not in port_attr:
         port_attr["labels"] = set()
     port_attr["labels"].add(label)
+    port.arrow.invalidate_hash()
 
 
 def has_port_label(port: Port, label: str) -> bool:
@@ -106,6 +118,7 @@ def set_port_shape(port: Port, shape: Shape):
     """Set the shape of `port` to `shape`"""
     port_attr = port.arrow.port_attr[port.index]
     port_attr["shape"] = shape
+    port.arrow.invalidate_hash()
 
 
 def is_valid_dtype(dtype: str) -> bool:
@@ -118,6 +131,7 @@ def set_port_dtype(port: Port, dtype: str) -> str:
     assert is_valid_dtype(dtype), "invalid dtype"
     port_attr = port.arrow.port_attr[port.index]
     port_attr["dtype"] = dtype
+    port.arrow.invalidate_hash()
 
 
 def get_port_dtype(port: Port, default_to_floatX=True):
@@ -134,12 +148,22 @@ def set_port_value(port: Port, value):
     """Set the shape of `port` to `shape`"""
     port_attr = port.arrow.port_attr[port.index]
     port_attr["value"] = value
+    port.arrow.invalidate_hash()
 
 
 def get_port_attr(port: Port):
     """Get the attributes of the port"""
     return port.arrow.get_port_attr(port)
 
+
+def copy_port_attr(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of the attributes of a port which shares values such as numpy
+    arrays and shapes, which are replaced but never modified in place.
+    Containers, e.g. the set of labels, are copied"""
+    return {key: (type(value)(value) if isinstance(value, (set, dict, list))
+                  else value)
+            for key, value in attrs.items()}
+
 def port_has(port: Port, attribute: str, port_attr: PortAttributes) -> bool:
     """Does port have `attribute` in port_attr"""
     return port in port_attr and attribute in port_attr[port]
@@ -1,15 +1,21 @@
 """Array Operations"""
+from contextlib import contextmanager
+
 import numpy as np
-import tensorflow as tf
+from typing import Sequence, Tuple
 
 import arrows.compositearrow as compositearrows
+from arrows.config import floatX
 from arrows.primitivearrow import PrimitiveArrow
 from arrows.primitive.math_arrows import AddArrow
 from arrows.port_attributes import ports_has, PortAttributes, extract_attribute
 from arrows.apply.shapes import *
 from arrows.apply.constants import constant_pred, constant_dispatch
+from arrows.util.numpy_ops import (gather_nd, scatter_nd, sparse_to_dense,
+                                   batch_sparse_to_dense, constant)
 from reverseflow.util.mapping import Bimap
-from reverseflow.util.misc import complement_bool
+from reverseflow.util.misc import (complement_bool, complement_mask,
+                                   complement_indices, num_complement)
 
 
 def const_to_tuple(x):
@@ -127,9 +133,11 @@ def std_disp2(arr: "SparseToDenseArrow", port_attr: PortAttributes):
     inds = port_attr[arr.in_ports()[0]]['value']
     output_shape = const_to_tuple(port_attr[arr.in_ports()[1]]['value'])
     vals = port_attr[arr.in_ports()[2]]['value']
-    output = np.zeros(output_shape)
-    for i, ind in enumerate(list(inds)):
-        output[ind] = vals[i]
+    if np.ndim(inds) == 3 and np.shape(inds)[-1] == len(output_shape) - 1:
+        # (batch_size, n, index depth) indices into each element of a batch
+        output = batch_sparse_to_dense(inds, output_shape, vals)
+    else:
+        output = sparse_to_dense(inds, output_shape, vals)
     return {arr.out_ports()[0]: {'value': output}}
 
 
@@ -142,7 +150,9 @@ def std_disp3(arr: "SparseToDenseArrow", port_attr: PortAttributes):
     return {arr.in_ports()[2]: {'shape': (inds_shape[0],)}}
 
 def std_pred4(arr: "SparseToDenseArrow", port_attr: PortAttributes):
-    return ports_has(arr.out_ports(), 'shape', port_attr)
+    # A shape with dimensions of unknown size has no value
+    return (ports_has(arr.out_ports(), 'shape', port_attr) and
+            not is_polymorphic(port_attr[arr.out_port(0)]['shape']))
 
 
 def std_disp4(arr: "SparseToDenseArrow", port_attr: PortAttributes):
@@ -150,9 +160,7 @@ def std_disp4(arr: "SparseToDenseArrow", port_attr: PortAttributes):
     return {arr.in_ports()[1]: {'value': output_shape}}
 
 # For symbolic tensor
-from arrows.util.tf import tf_eval
 from arrows.transform.symbolic_tensor import SymbolicTensor
-import tensorflow as tf
 
 def std_symbt_pred(arr: "SparseToDenseArrow", port_attr: PortAttributes):
     # sparse_indices: value
@@ -170,7 +178,7 @@ def std_symb_disp(arr: "SparseToDenseArrow", port_attr: PortAttributes):
     indices = port_attr[arr.in_ports()[0]]['value']
     output_shape = port_attr[arr.in_ports()[1]]['value']
     values = st.indices
-    res = tf_eval(tf.sparse_to_dense, sparse_indices=indices, sparse_values=values, output_shape=output_shape)
+    res = sparse_to_dense(indices, output_shape, values)
     st = SymbolicTensor(indices=res, symbols=st.symbols, name=st.name, port=st.port)
     return {arr.out_port(0): {'symbolic_tensor': st}}
 
@@ -208,12 +216,10 @@ def snd_pred2(arr: "ScatterNdArrow", port_attr: PortAttributes):
 
 
 def snd_disp2(arr: "ScatterNdArrow", port_attr: PortAttributes):
-    inds = tf.constant(port_attr[arr.in_port(0)]['value'])
-    vals = tf.constant(port_attr[arr.in_port(1)]['value'])
-    output_shape = tf.constant(port_attr[arr.in_port(2)]['value'])
-    scatter = tf.scatter_nd(inds, vals, output_shape)
-    with tf.Session() as sess:
-        return {arr.out_port(0): {'value': sess.run(scatter)}}
+    inds = port_attr[arr.in_port(0)]['value']
+    vals = port_attr[arr.in_port(1)]['value']
+    output_shape = port_attr[arr.in_port(2)]['value']
+    return {arr.out_port(0): {'value': scatter_nd(inds, constant(vals), output_shape)}}
 
 
 def snd_pred3(arr: "ScatterNdArrow", port_attr: PortAttributes):
@@ -227,7 +233,9 @@ def snd_disp3(arr: "ScatterNdArrow", port_attr: PortAttributes):
     return {arr.in_ports()[1]: {'shape': indices_shape[:-1] + params_shape[indices_shape[-1]:]}}
 
 def snd_pred4(arr: "ScatterNdArrow", port_attr: PortAttributes):
-    return ports_has(arr.out_ports(), 'shape', port_attr)
+    # A shape with dimensions of unknown size has no value
+    return (ports_has(arr.out_ports(), 'shape', port_attr) and
+            not is_polymorphic(port_attr[arr.out_port(0)]['shape']))
 
 
 def snd_disp4(arr: "ScatterNdArrow", port_attr: PortAttributes):
@@ -249,11 +257,9 @@ def snd_pred6(arr: "ScatterNdArrow", port_attr: PortAttributes):
 
 
 def snd_disp6(arr: "ScatterNdArrow", port_attr: PortAttributes):
-    inds = tf.constant(port_attr[arr.in_port(0)]['value'])
-    output = tf.constant(port_attr[arr.out_port(0)]['value'])
-    gather_nd = tf.gather_nd(output, inds)
-    with tf.Session() as sess:
-        return {arr.in_ports()[1]: {'value': sess.run(gather_nd)}}
+    inds = port_attr[arr.in_port(0)]['value']
+    output = port_attr[arr.out_port(0)]['value']
+    return {arr.in_ports()[1]: {'value': gather_nd(constant(output), inds)}}
 
 def snd_symbt_pred(arr: "ScatterNdArrow", port_attr: PortAttributes):
     # sparse_indices: value
@@ -272,7 +278,7 @@ def snd_symb_disp(arr: "ScatterNdArrow", port_attr: PortAttributes):
     indices = port_attr[arr.in_ports()[0]]['value']
     output_shape = port_attr[arr.in_ports()[2]]['value']
     values = st.indices
-    res = tf_eval(tf.scatter_nd, indices=indices, updates=values, shape=output_shape)
+    res = scatter_nd(indices, values, output_shape)
     st = SymbolicTensor(indices=res, symbols=st.symbols, name=st.name, port=st.port)
     return {arr.out_port(0): {'symbolic_tensor': st}}
 
@@ -297,9 +303,113 @@ def get_dispatches(self):
             })
         return disp
 
+# Complements
+# ===========
+def compl_shape_pred(arr: "ComplementIndicesArrow", port_attr: PortAttributes):
+    return ports_has(arr.in_ports(), 'value', port_attr)
+
+
+def compl_mask_shape_disp(arr: "ComplementMaskArrow",
+                          port_attr: PortAttributes):
+    shape = const_to_tuple(port_attr[arr.in_port(1)]['value'])
+    return {arr.out_port(0): {'shape': shape}}
+
+
+def compl_indices_shape_disp(arr: "ComplementIndicesArrow",
+                             port_attr: PortAttributes):
+    inds = port_attr[arr.in_port(0)]['value']
+    shape = const_to_tuple(port_attr[arr.in_port(1)]['value'])
+    n_complement = num_complement(inds, shape)
+    return {arr.out_port(0): {'shape': (n_complement, len(shape))}}
+
+
+# A complement is as large as the tensor indexed, so its value is only
+# computed by propagations within `complement_values()`, e.g. in
+# apply_backwards, and not by those which only need shapes
+COMPLEMENT_VALUES = {'enabled': False}
+
+
+@contextmanager
+def complement_values(enabled=True):
+    """Compute values of complement arrows in propagations in the context"""
+    previous = COMPLEMENT_VALUES['enabled']
+    COMPLEMENT_VALUES['enabled'] = enabled
+    try:
+        yield
+    finally:
+        COMPLEMENT_VALUES['enabled'] = previous
+
+
+def compl_value_pred(arr: "ComplementIndicesArrow",
+                     port_attr: PortAttributes):
+    return (COMPLEMENT_VALUES['enabled'] and
+            ports_has(arr.in_ports(), 'value', port_attr))
+
+
+def compl_mask_value_disp(arr: "ComplementMaskArrow",
+                          port_attr: PortAttributes):
+    inds = port_attr[arr.in_port(0)]['value']
+    shape = port_attr[arr.in_port(1)]['value']
+    mask = complement_mask(inds, shape).astype(floatX())
+    return {arr.out_port(0): {'value': mask}}
+
+
+def compl_indices_value_disp(arr: "ComplementIndicesArrow",
+                             port_attr: PortAttributes):
+    inds = port_attr[arr.in_port(0)]['value']
+    shape = port_attr[arr.in_port(1)]['value']
+    return {arr.out_port(0): {'value': complement_indices(inds, shape)}}
+
+
+class ComplementMaskArrow(PrimitiveArrow):
+    """Float mask of shape `shape` which is 0 at `indices` and 1 elsewhere.
+    Computed when the arrow is executed, so unlike a SourceArrow of the mask
+    the arrow takes no space proportional to `shape`"""
+    def __init__(self):
+        name = 'ComplementMask'
+        super().__init__(n_in_ports=2, n_out_ports=1, name=name)
+
+    def get_dispatches(self):
+        disp = super().get_dispatches()
+        disp.update({
+            compl_shape_pred: compl_mask_shape_disp,
+            compl_value_pred: compl_mask_value_disp
+            })
+        return disp
+
+
+class ComplementIndicesArrow(PrimitiveArrow):
+    """Indices (m, rank) of elements of shape `shape` not in `indices`, i.e.
+    the complement of `indices`, computed when the arrow is executed"""
+    def __init__(self):
+        name = 'ComplementIndices'
+        super().__init__(n_in_ports=2, n_out_ports=1, name=name)
+
+    def get_dispatches(self):
+        disp = super().get_dispatches()
+        disp.update({
+            compl_shape_pred: compl_indices_shape_disp,
+            compl_value_pred: compl_indices_value_disp
+            })
+        return disp
+
+
 # Reshape
-# FIXME: We don't consider the special value -1, which is supposed to infer shape
+# A shape value of -1 (inferred size) is a shape attribute of None, as in a
+# batch dimension of unknown size
+# FIXME: Only one dimension may be inferred, so a shape with two None
+# dimensions has no shape value
 # ========
+def shape_to_value(shape) -> Tuple:
+    """Shape value for reshape of shape attribute `shape`"""
+    return tuple(-1 if dim is None else int(dim)
+                 for dim in const_to_tuple(shape))
+
+def value_to_shape(value) -> Tuple:
+    """Shape attribute of the output of reshape to shape value `value`"""
+    return tuple(None if dim == -1 else int(dim)
+                 for dim in const_to_tuple(value))
+
 def reshape_eval_pred(arr: "ReshapeArrow", port_attr: PortAttributes):
     return ports_has(arr.in_ports(), 'value', port_attr)
 
@@ -316,21 +426,21 @@ def reshape_pred1(arr: "ReshapeArrow", port_attr: PortAttributes):
 def reshape_dispatch1(arr: "ReshapeArrow", port_attr: PortAttributes):
     o = port_attr[arr.out_ports()[0]]['value']
     s = port_attr[arr.in_ports()[0]]['shape']
-    return {arr.in_ports()[0]: {'value': np.reshape(o, const_to_tuple(s))}}
+    return {arr.in_ports()[0]: {'value': np.reshape(o, shape_to_value(s))}}
 
 def reshape_pred2(arr: "ReshapeArrow", port_attr: PortAttributes):
     return ports_has(arr.out_ports()[:1], 'shape', port_attr)
 
 def reshape_dispatch2(arr: "ReshapeArrow", port_attr: PortAttributes):
     o = port_attr[arr.out_ports()[0]]['shape']
-    return {arr.in_ports()[1]: {'value': np.array(o)}}
+    return {arr.in_ports()[1]: {'value': np.array(shape_to_value(o))}}
 
 def reshape_pred3(arr: "ReshapeArrow", port_attr: PortAttributes):
     return ports_has(arr.in_ports()[1:2], 'value', port_attr)
 
 def reshape_dispatch3(arr: "ReshapeArrow", port_attr: PortAttributes):
     i = port_attr[arr.in_ports()[1]]['value']
-    return {arr.out_ports()[0]: {'shape': const_to_tuple(i)}}
+    return {arr.out_ports()[0]: {'shape': value_to_shape(i)}}
 
 class ReshapeArrow(PrimitiveArrow):
     """
@@ -449,22 +559,28 @@ def stack_shapes(shapes: Sequence, axis: int):
     """if `axis == 0` then the `output` tensor will have the shape `(N, A, B, C)`.
        if `axis == 1` then the `output` tensor will have the shape `(A, N, B, C)`.
     """
-    assert same(shapes), "shapes of input to stack should be the same"
-    s = shapes[0]
+    s = list(unify_shapes(shapes))
     n = len(shapes)
+    axis = axis if axis >= 0 else len(s) + 1 + axis
     new_shape = s[0:axis] + [n] + s[axis:]
     return tuple(new_shape)
 
 
 def stack_shape_pred(arr: "StackArrow", port_attr: PortAttributes):
-    return False
-    # return ports_has(arr.in_ports(), 'shape', port_attr)
+    return ports_has(arr.in_ports(), 'shape', port_attr)
 
 def stack_shape_disp(arr: "StackArrow", port_attr: PortAttributes):
-    ptv = extract_attribute('shape', port_attr)
-    import pdb; pdb.set_trace()
-    o = port_attr[arr.out_port(0)]
-    return {arr.out_port(0): {'shape': new_shape}}
+    shapes = [port_attr[port]['shape'] for port in arr.in_ports()]
+    return {arr.out_port(0): {'shape': stack_shapes(shapes, arr.axis)}}
+
+def unstack_shape_pred(arr: "StackArrow", port_attr: PortAttributes):
+    return port_has(arr.out_port(0), 'shape', port_attr)
+
+def unstack_shape_disp(arr: "StackArrow", port_attr: PortAttributes):
+    out_shape = tuple(port_attr[arr.out_port(0)]['shape'])
+    axis = arr.axis if arr.axis >= 0 else len(out_shape) + arr.axis
+    shape = out_shape[:axis] + out_shape[axis + 1:]
+    return {port: {'shape': shape} for port in arr.in_ports()}
 
 
 class StackArrow(PrimitiveArrow):
@@ -480,11 +596,52 @@ def __init__(self, n_inputs, axis):
     def get_dispatches(self):
           disp = super().get_dispatches()
           disp.update({
-              stack_shape_pred: stack_shape_disp
+              stack_shape_pred: stack_shape_disp,
+              unstack_shape_pred: unstack_shape_disp
               })
           return disp
 
 
+def concat_shape_pred(arr: "ConcatArrow", port_attr: PortAttributes):
+    return ports_has(arr.in_ports(), 'shape', port_attr)
+
+def concat_shape_disp(arr: "ConcatArrow", port_attr: PortAttributes):
+    shapes = [tuple(port_attr[port]['shape']) for port in arr.in_ports()]
+    axis = arr.axis if arr.axis >= 0 else len(shapes[0]) + arr.axis
+    lengths = [shape[axis] for shape in shapes]
+    length = None if None in lengths else sum(lengths)
+    rest = unify_shapes([shape[:axis] + (None,) + shape[axis + 1:]
+                         for shape in shapes])
+    shape = rest[:axis] + (length,) + rest[axis + 1:]
+    return {arr.out_port(0): {'shape': shape}}
+
+def concat_pred(arr: "ConcatArrow", port_attr: PortAttributes):
+    return ports_has(arr.in_ports(), 'value', port_attr)
+
+def concat_disp(arr: "ConcatArrow", port_attr: PortAttributes):
+    values = [port_attr[port]['value'] for port in arr.in_ports()]
+    return {arr.out_port(0): {'value': np.concatenate(values, axis=arr.axis)}}
+
+
+class ConcatArrow(PrimitiveArrow):
+    """
+    tf.concat
+    """
+    def __init__(self, n_inputs, axis):
+        """Concatenates inputs along axis"""
+        name = 'Concat'
+        self.axis = axis
+        super().__init__(n_in_ports=n_inputs, n_out_ports=1, name=name)
+
+    def get_dispatches(self):
+        disp = super().get_dispatches()
+        disp.update({
+            concat_shape_pred: concat_shape_disp,
+            concat_pred: concat_disp
+            })
+        return disp
+
+
 class TransposeArrow(PrimitiveArrow):
     """
     tf.stack
@@ -221,20 +221,35 @@ def broadcast_bwd_disp(arr: "BroadcastArrow", port_attr: PortAttributes):
     out_val = port_attr[arr.out_port(0)]['value']
     in_shape = port_attr[arr.in_port(0)]['shape']
     out_shape = constant_to_shape(out_val)
-    if len(out_shape) <= len(in_shape):
+    # out_val may be a batch, leave its batch dimensions alone
+    batch = ()
+    if port_has(arr.out_port(0), 'shape', port_attr):
+        batch = batch_shape(out_val, port_attr[arr.out_port(0)]['shape'])
+    if len(out_shape) - len(batch) <= len(in_shape):
         return {arr.in_port(0): {'value': out_val}}
     else:
-        ext_shape = out_shape[:len(out_shape) - len(in_shape)]
-        idx = tuple(0 for i in ext_shape)
+        ext_shape = out_shape[len(batch):len(out_shape) - len(in_shape)]
+        idx = tuple(slice(None) for i in batch) + tuple(0 for i in ext_shape)
         return {arr.in_port(0): {'value': out_val[idx]}}
 
 def broadcast_fwd_pred(arr: "BroadcastArrow", port_attr: PortAttributes):
-    return ports_has(arr.out_ports(), 'shape', port_attr) and ports_has(arr.in_ports(), 'value', port_attr)
+    # Can't broadcast to a shape of unknown size, e.g. an unknown batch size
+    return (ports_has(arr.out_ports(), 'shape', port_attr) and
+            ports_has(arr.in_ports(), 'value', port_attr) and
+            not is_polymorphic(port_attr[arr.out_port(0)]['shape']))
 
 def broadcast_fwd_disp(arr: "BroadcastArrow", port_attr: PortAttributes):
     in_val = port_attr[arr.in_port(0)]['value']
     out_shape = port_attr[arr.out_port(0)]['shape']
-    return {arr.out_port(0): {'value': np.broadcast_to(in_val, out_shape)}}
+    # in_val may be a batch, in which case broadcast each example
+    batch = ()
+    if port_has(arr.in_port(0), 'shape', port_attr):
+        in_shape = port_attr[arr.in_port(0)]['shape']
+        batch = batch_shape(in_val, in_shape)
+        ext_shape = tuple(1 for i in range(len(out_shape) - len(in_shape)))
+        in_val = np.reshape(in_val, batch + ext_shape + tuple(in_shape))
+    out_val = np.broadcast_to(in_val, batch + tuple(out_shape))
+    return {arr.out_port(0): {'value': out_val}}
 
 ## FIXME Add assertion to test that shapes are broadcast compatibl
 class BroadcastArrow(PrimitiveArrow):
@@ -1,9 +1,9 @@
 from arrows.arrow import Arrow
 from arrows.port import Port, InPort, OutPort
-from arrows.port_attributes import make_in_port, make_out_port
+from arrows.port_attributes import make_in_port, make_out_port, copy_port_attr
 from typing import Dict, List, MutableMapping, Set
 from sympy import Expr, Rel
-from copy import copy
+from copy import copy, deepcopy
 
 class PrimitiveArrow(Arrow):
     """Primitive arrow"""
@@ -21,6 +21,10 @@ def __deepcopy__(self, memo):
         if self.name != None:
             new_arrow.name = self.name + "_copy"
         new_arrow.parent = None
+        new_arrow.invalidate_port_kinds()
+        # Don't share port attributes, making a port parametric on the copy
+        # should not affect the original
+        new_arrow.port_attr = [copy_port_attr(attr) for attr in self.port_attr]
         n_ports = self.n_in_ports + self.n_out_ports
         assert new_arrow.n_in_ports + new_arrow.n_out_ports == n_ports, "incorrect copy"
         new_arrow._ports = [Port(new_arrow, i) for i in range(n_ports)]
@@ -0,0 +1,106 @@
+"""Common subexpression elimination"""
+from typing import Dict, List
+
+from arrows.arrow import Arrow
+from arrows.compositearrow import CompositeArrow
+from arrows.primitive.control_flow import DuplArrow
+from arrows.util.hash import structural_hash
+
+
+def is_pure(arrow: Arrow) -> bool:
+    """Can arrow be merged with another arrow with the same structural hash.
+    Not tensorflow arrows, which each have their own variables, nor arrows
+    holding functions, which structural_hash does not tell apart"""
+    arrows = [arrow]
+    if isinstance(arrow, CompositeArrow):
+        arrows += list(arrow.get_sub_arrows_nested())
+    return not any(a.is_tf() or any(callable(v) and not isinstance(v, Arrow)
+                                    for v in vars(a).values())
+                   for a in arrows)
+
+
+def remove_dupls(arrow: CompositeArrow) -> None:
+    """Replace each DuplArrow in arrow by edges from its input to the
+    receivers of its outputs, the inverse of `duplify`"""
+    for dupl in [a for a in arrow.get_sub_arrows() if type(a) is DuplArrow]:
+        source = arrow.neigh_out_ports(dupl.in_port(0))[0]
+        arrow.remove_edge(source, dupl.in_port(0))
+        for out_port in dupl.out_ports():
+            for receiver in arrow.neigh_in_ports(out_port):
+                arrow.remove_edge(out_port, receiver)
+                arrow.add_edge(source, receiver)
+        dupl.parent = None
+
+
+def topo_sort(arrow: CompositeArrow) -> List[Arrow]:
+    """Sub arrows of `arrow`, each after the arrows whose outputs it takes"""
+    sub_arrows = arrow.get_sub_arrows()
+    n_waiting = {sub_arrow: 0 for sub_arrow in sub_arrows}
+    for left, right in arrow.edges.items():
+        if left.arrow is not arrow and right.arrow is not arrow:
+            n_waiting[right.arrow] += 1
+    ready = [sub_arrow for sub_arrow, n in n_waiting.items() if n == 0]
+    order = []
+    while len(ready) > 0:
+        sub_arrow = ready.pop()
+        order.append(sub_arrow)
+        for out_port in sub_arrow.out_ports():
+            for receiver in arrow.neigh_in_ports(out_port):
+                if receiver.arrow is not arrow:
+                    n_waiting[receiver.arrow] -= 1
+                    if n_waiting[receiver.arrow] == 0:
+                        ready.append(receiver.arrow)
+    assert len(order) == len(sub_arrows), "Cycle in %s" % arrow
+    return order
+
+
+def merge_arrow(arrow: CompositeArrow, duplicate: Arrow, orig: Arrow) -> None:
+    """Feed the receivers of the outputs of `duplicate` from `orig` instead
+    and remove `duplicate` from `arrow`"""
+    for in_port in duplicate.in_ports():
+        for source in arrow.neigh_out_ports(in_port):
+            arrow.remove_edge(source, in_port)
+    for out_port, orig_out_port in zip(duplicate.out_ports(), orig.out_ports()):
+        for receiver in arrow.neigh_in_ports(out_port):
+            arrow.remove_edge(out_port, receiver)
+            arrow.add_edge(orig_out_port, receiver)
+    duplicate.parent = None
+
+
+def eliminate_common_subexpressions(arrow: CompositeArrow,
+                                    deep=True) -> CompositeArrow:
+    """Merge sub arrows of `arrow` which compute the same function of the
+    same inputs, so that e.g. cos(x) used in many places is computed (and
+    inverted) once.  Outputs shared this way go through DuplArrows.
+    Args:
+        arrow: Composite arrow to transform in place, e.g. before `invert`
+        deep: Also eliminate within composite sub arrows
+    Returns:
+        arrow"""
+    if deep:
+        for sub_arrow in arrow.get_sub_arrows():
+            if isinstance(sub_arrow, CompositeArrow):
+                eliminate_common_subexpressions(sub_arrow, deep=deep)
+    remove_dupls(arrow)
+    memo = {}
+    seen = {}  # type: Dict[tuple, Arrow]
+    constants = set()
+    for sub_arrow in topo_sort(arrow):
+        # Sources of merged arrows are already the outputs of what they
+        # were merged into
+        sources = tuple(tuple(arrow.neigh_out_ports(in_port))
+                        for in_port in sub_arrow.in_ports())
+        # FIXME: Constants are left unmerged because a DuplArrow of a
+        # constant is inverted as if it were variable
+        if all(port.arrow in constants for ports in sources for port in ports):
+            constants.add(sub_arrow)
+            continue
+        if not is_pure(sub_arrow):
+            continue
+        key = (structural_hash(sub_arrow, memo), sources)
+        if key in seen:
+            merge_arrow(arrow, sub_arrow, seen[key])
+        else:
+            seen[key] = sub_arrow
+    arrow.duplify()
+    return arrow
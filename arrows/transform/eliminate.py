@@ -4,6 +4,7 @@
 from arrows.apply.propagate import propagate
 from arrows.transform.symbolic_tensor import SymbolicTensor, unroll
 from arrows.std_arrows import GatherArrow, SourceArrow, ReshapeArrow
+from arrows.util.union_find import UnionFind
 import numpy as np
 # from arrows.port_attributes import get_sh
 
@@ -20,43 +21,45 @@ def filter_arrows(fil, arrow: CompositeArrow, deep=True):
 dupl_names = ['InvDuplApprox']
 
 def num_unique_elem(equiv_thetas):
-    return len(set(equiv_thetas.values()))
+    return len(np.unique(equiv_thetas))
 
-def find_equivalent_thetas(dupl_to_equiv):
-    equiv_thetas = {}
-    group_index = 0
-    dupl_unrolled = {k: list(map(unroll, v)) for k, v in dupl_to_equiv.items()}
-
-    # Find the equivalence classes
-    for dupl, constraints in dupl_unrolled.items():
-        constraint_len = constraints[0].shape
-        assert all(((constraint.shape) == constraint_len for constraint in constraints))
-        for i, _ in np.ndenumerate(constraints[0]):
-            # Find the mapping index
-            already_in_map = False
-            all_zero = True
-            for j in range(len(constraints)):
-                theta = constraints[j][i]
-                if theta != 0 and theta in equiv_thetas:
-                    if already_in_map:
-                        assert equiv_thetas[theta] == group_index
-                    group_index = equiv_thetas[theta]
-                    already_in_map = True
-            # Now assign them all
-            for j in range(len(constraints)):
-                theta = constraints[j][i]
-                if theta != 0:
-                    all_zero = False
-                    equiv_thetas[theta] = group_index
-
-            if not already_in_map and not all_zero:
-                group_index += 1
-
-    return equiv_thetas
+def find_equivalent_thetas(dupl_to_equiv, nthetas):
+    """Equivalence classes of thetas, thetas at the same position of the
+    constraints of a dupl are equivalent
+    Args:
+        dupl_to_equiv: Map from dupl to the SymbolicTensors on its ports
+        nthetas: Number of thetas, ids of thetas are 1..nthetas
+    Returns:
+        Array whose ith element is the class of theta i, classes are numbered
+        in order of their smallest theta"""
+    sets = UnionFind(nthetas + 1)
+    for dupl, constraints in dupl_to_equiv.items():
+        if len(constraints) == 0:
+            continue
+        constraint_len = constraints[0].indices.shape
+        assert all(constraint.indices.shape == constraint_len
+                   for constraint in constraints)
+        ids = np.stack([unroll(constraint).reshape(-1)
+                        for constraint in constraints])
+        # Join every known theta of a position to the largest of them
+        largest = np.broadcast_to(ids.max(axis=0), ids.shape)
+        known = ids != 0
+        sets.union_many(ids[known], largest[known])
+    return sets.classes()
 
 def create_arrow(arrow: CompositeArrow, equiv_thetas, port_attr, valid_ports, symbt_ports):
-    # New parameter space should have nclasses elements
-    nclasses = num_unique_elem(equiv_thetas)
+    # New parameter space should have nclasses elements, one for each class
+    # of the thetas of valid ports
+    valid_symbt = {in_port: symbt_ports[in_port]['symbolic_tensor']
+                   for in_port in arrow.in_ports() if in_port in valid_ports}
+    thetas = np.concatenate([np.asarray(symbt.symbols, dtype=np.int64)
+                             for symbt in valid_symbt.values()])
+    classes, setids = np.unique(equiv_thetas[thetas], return_inverse=True)
+    nclasses = len(classes)
+    offsets = np.cumsum([0] + [len(symbt.symbols)
+                               for symbt in valid_symbt.values()])
+    port_setids = {in_port: setids[offsets[i]:offsets[i + 1]]
+                   for i, in_port in enumerate(valid_symbt)}
     new_arrow = CompositeArrow(name="%s_elim" % arrow.name)
     for out_port in arrow.out_ports():
         c_out_port = new_arrow.add_port()
@@ -73,11 +76,7 @@ def create_arrow(arrow: CompositeArrow, equiv_thetas, port_attr, valid_ports, sy
     batch_size = None
     for in_port in arrow.in_ports():
         if in_port in valid_ports:
-            symbt = symbt_ports[in_port]['symbolic_tensor']
-            indices = []
-            for theta in symbt.symbols:
-                setid = equiv_thetas[theta]
-                indices.append(setid)
+            indices = port_setids[in_port]
             shape = get_port_shape(in_port, port_attr)
             if len(shape) > 1:
                 if batch_size is not None:
@@ -122,12 +121,15 @@ def eliminate(arrow: CompositeArrow):
     # Get the shapes of param ports
     port_attr = propagate(arrow)
     symbt_ports = {}
+    nthetas = 0
     for port in arrow.in_ports():
         if is_param_port(port):
             shape = get_port_shape(port, port_attr)
             symbt_ports[port] = {}
             # Create a symbolic tensor for each param port
-            st = SymbolicTensor(shape=shape, name="port%s" % port.index, port=port)
+            st = SymbolicTensor(shape=shape, name="port%s" % port.index,
+                                port=port, start=nthetas + 1)
+            nthetas += len(st.symbols)
             symbt_ports[port]['symbolic_tensor'] = st
 
     # repropagate
@@ -147,5 +149,5 @@ def eliminate(arrow: CompositeArrow):
                 equiv.append(port_attr[p]['symbolic_tensor'])
         dupl_to_equiv[dupl] = equiv
 
-    equiv_thetas = find_equivalent_thetas(dupl_to_equiv)
+    equiv_thetas = find_equivalent_thetas(dupl_to_equiv, nthetas)
     return create_arrow(arrow, equiv_thetas, port_attr, valid_ports, symbt_ports)
@@ -4,8 +4,9 @@
 from arrows.port_attributes import *
 from arrows.compositearrow import CompositeArrow
 from arrows.transform.eliminate import filter_arrows, dupl_names
-from arrows.std_arrows import AddArrow, MulArrow, SourceArrow, ScatterNdArrow, GatherNdArrow, UpdateArrow
-from reverseflow.util.misc import complement_bool_list
+from arrows.std_arrows import (SourceArrow, ScatterNdArrow, GatherArrow,
+                               ReshapeArrow, ConcatArrow, UpdateArrow)
+from reverseflow.util.misc import flat_indices, index_rows
 
 
 def eliminate_gathernd(arrow: CompositeArrow):
@@ -17,10 +18,10 @@ def eliminate_gathernd(arrow: CompositeArrow):
     dupls = filter_arrows(lambda a: a.name in dupl_names, arrow)
     for dupl in dupls:
         slim_param_arrow = UpdateArrow()
-        constraints = None
-        free = None
+        outs = []
+        flat_inds = []
         shape = None
-        shape_source = None
+        depth = None
         for p in dupl.in_ports():
             inv = arrow.neigh_ports(p)[0].arrow
             if inv.name == 'InvGatherNd':
@@ -31,35 +32,34 @@ def eliminate_gathernd(arrow: CompositeArrow):
                 indices_val = get_port_value(indices)
                 if shape is not None:
                     assert np.array_equal(shape, np.array(get_port_shape(inv.out_port(0))))
+                    assert index_rows(indices_val).shape[1] == depth
                 else:
                     shape = np.array(get_port_shape(inv.out_port(0)))
-                    shape_source = SourceArrow(shape)
+                    depth = index_rows(indices_val).shape[1]
+                outs.append(arrow.neigh_ports(out)[0])
+                flat_inds.append(flat_indices(indices_val, shape))
+        if len(outs) > 0:
+            # Elements of the outputs of all gathers at the same position are
+            # equal, keep the first of each position as the known value there
+            covered, first = np.unique(np.concatenate(flat_inds),
+                                       return_index=True)
+            known = consolidate_gathers(arrow, outs, shape, depth, first)
+            known_inds = np.transpose(np.unravel_index(covered, shape[:depth]))
+            shape_source = SourceArrow(shape)
+            scatter = ScatterNdArrow()
+            arrow.add_edge(SourceArrow(known_inds).out_port(0),
+                           scatter.in_port(0))
+            arrow.add_edge(known, scatter.in_port(1))
+            arrow.add_edge(shape_source.out_port(0), scatter.in_port(2))
 
-                out = arrow.neigh_ports(out)[0]
-
-                unset, unique = complement_bool_list(indices_val, shape)
-                free = unset if free is None else np.logical_and(unset, free)  # FIXME: don't really need bool anymore
-                unique_source = SourceArrow(unique)
-                unique_inds = SourceArrow(indices_val[tuple(np.transpose(unique))])
-
-                # add in a constraint for these new known values
-                unique_upds = GatherNdArrow()
-                arrow.add_edge(out, unique_upds.in_port(0))
-                arrow.add_edge(unique_source.out_port(0), unique_upds.in_port(1))
-                tmp = UpdateArrow()
-                if constraints is None:
-                    constraints = SourceArrow(np.zeros(shape, dtype=np.float32))
-                arrow.add_edge(constraints.out_port(0), tmp.in_port(0))
-                arrow.add_edge(unique_inds.out_port(0), tmp.in_port(1))
-                arrow.add_edge(unique_upds.out_port(0), tmp.in_port(2))
-                arrow.add_edge(shape_source.out_port(0), tmp.in_port(3))
-                constraints = tmp
-        if constraints is not None:
             # put in knowns
-            arrow.add_edge(constraints.out_port(0), slim_param_arrow.in_port(0))
+            arrow.add_edge(scatter.out_port(0), slim_param_arrow.in_port(0))
             # put in params
             make_param_port(slim_param_arrow.in_port(2))
             arrow.add_edge(shape_source.out_port(0), slim_param_arrow.in_port(3))
+            free = np.ones(shape, dtype=np.dtype(bool))
+            # covered indexes shape[:depth] flattened, a slice of free each
+            free.reshape(-1, int(np.prod(shape[depth:])))[covered] = False
             inds = np.transpose(np.nonzero(free))
             if (free == free[0]).all():
                 print("Assuming batched input")
@@ -68,4 +68,26 @@ def eliminate_gathernd(arrow: CompositeArrow):
                 print("WARNING: Unbatched input, haven't designed for this case")
             inds_source = SourceArrow(inds)
             arrow.add_edge(inds_source.out_port(0), slim_param_arrow.in_port(1))
-        # import pdb; pdb.set_trace()
+
+
+def consolidate_gathers(arrow: CompositeArrow, outs, shape, depth, positions):
+    """Port of `arrow` whose value is the elements at `positions` of the
+    outputs `outs` of gathers of depth `depth` from `shape`, each flattened to
+    (-1,) + shape[depth:] and then concatenated, using one gather"""
+    flat_shape = SourceArrow(np.array((-1,) + tuple(shape[depth:]),
+                                      dtype=np.int32))
+    flats = []
+    for out in outs:
+        flatten = ReshapeArrow()
+        arrow.add_edge(out, flatten.in_port(0))
+        arrow.add_edge(flat_shape.out_port(0), flatten.in_port(1))
+        flats.append(flatten.out_port(0))
+    if len(flats) > 1:
+        concat = ConcatArrow(len(flats), axis=0)
+        for i, flat in enumerate(flats):
+            arrow.add_edge(flat, concat.in_port(i))
+        flats = [concat.out_port(0)]
+    gather = GatherArrow()
+    arrow.add_edge(flats[0], gather.in_port(0))
+    arrow.add_edge(SourceArrow(positions).out_port(0), gather.in_port(1))
+    return gather.out_port(0)
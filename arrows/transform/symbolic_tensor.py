@@ -1,26 +1,27 @@
 import numpy as np
 from arrows.util.misc import product
-import sympy
 
 def unroll(x):
-    """The point is to replace each element of indices with the corresponding theta,
-    or with zero if unknown"""
-    indices = np.zeros(x.indices.shape, dtype=np.dtype(object))
-    for i, theta_id in np.ndenumerate(x.indices):
-        if theta_id == 0:
-            indices[i] = 0
-        else:
-            indices[i] = x.symbols[theta_id-1]
-    return indices
+    """The point is to replace each element of indices with the id of the
+    corresponding theta, or with zero if unknown"""
+    ids = np.concatenate([[0], np.asarray(x.symbols, dtype=np.int64)])
+    return ids[np.asarray(x.indices, dtype=np.int64)]
 
 class SymbolicTensor:
-    def __init__(self, indices=None, symbols=None, shape=None, port=None, name=""):
+    """Tensor whose elements are unknown parameters (thetas).
+    Each theta is identified by a positive integer id; `symbols` are the ids
+    of the thetas of this tensor and element i of `indices` is 0 if unknown or
+    k if it is theta `symbols[k-1]`.
+    Created from a shape, the thetas are the range of ids start, start + 1, ...
+    so tensors of different ports must be given disjoint ranges"""
+    def __init__(self, indices=None, symbols=None, shape=None, port=None,
+                 name="", start=1):
         self.port = port
         self.name=name
         if indices is None and symbols is None and shape is not None:
             num_elements = product(shape)
             self.indices = np.arange(1, num_elements+1).reshape(shape)
-            self.symbols = [sympy.Dummy("%s_theta_%s" % (name, i)) for i in range(num_elements)]
+            self.symbols = range(start, start + num_elements)
         else:
             self.indices = indices
             self.symbols = symbols
@@ -0,0 +1,115 @@
+"""Memory mapped datasets which are converted to floatX one batch at a time"""
+import glob
+import os
+from typing import Sequence, Union
+
+import numpy as np
+
+from arrows.config import floatX
+
+
+def shard_paths(path: Union[str, Sequence[str]]) -> Sequence[str]:
+    """Paths of the shards of a dataset, in order
+    Args:
+        path: path to a .npy file, a glob pattern such as 'data_*.npy', or a
+            list of paths
+    Returns:
+        List of paths"""
+    if not isinstance(path, str):
+        return list(path)
+    if os.path.exists(path):
+        return [path]
+    paths = sorted(glob.glob(path))
+    assert len(paths) > 0, "No npy files match %s" % path
+    return paths
+
+
+def save_shards(data: np.ndarray,
+                prefix: str,
+                shard_size: int) -> Sequence[str]:
+    """Save `data` along its first dimension into .npy shards which can be
+    loaded with `MappedDataset('%s_*.npy' % prefix)`"""
+    paths = []
+    nshards = int(np.ceil(len(data) / shard_size))
+    for i in range(nshards):
+        path = "%s_%05d.npy" % (prefix, i)
+        np.save(path, data[i * shard_size:(i + 1) * shard_size])
+        paths.append(path)
+    return paths
+
+
+class MappedDataset:
+    """Rows of one or more memory mapped .npy files.
+    Nothing is read from disk until rows are indexed, at which point only
+    those rows are read and converted to `dtype` and multiplied by `scale`,
+    e.g. uint8 voxel grids are stored as is and become floatX in [0, 1] one
+    batch at a time in `infinite_batches`.
+    """
+    def __init__(self,
+                 path: Union[str, Sequence[str]],
+                 dtype=None,
+                 scale=None,
+                 indices=None):
+        self.paths = shard_paths(path)
+        self.shards = [np.load(p, mmap_mode='r') for p in self.paths]
+        shapes = set(shard.shape[1:] for shard in self.shards)
+        assert len(shapes) == 1, "Shards have different shapes %s" % shapes
+        lengths = [len(shard) for shard in self.shards]
+        self.offsets = np.cumsum([0] + lengths)
+        self.dtype = np.dtype(floatX() if dtype is None else dtype)
+        self.scale = scale
+        # Rows of the underlying shards in this dataset, None for all of them
+        self.indices = indices
+
+    def __len__(self):
+        if self.indices is None:
+            return int(self.offsets[-1])
+        return len(self.indices)
+
+    @property
+    def shape(self):
+        return (len(self),) + self.shards[0].shape[1:]
+
+    def subset(self, rows) -> "MappedDataset":
+        """Dataset of `rows` of this one (a slice or array of indices), without
+        reading anything"""
+        rows = np.arange(len(self))[rows]
+        indices = rows if self.indices is None else self.indices[rows]
+        subset = MappedDataset.__new__(MappedDataset)
+        subset.__dict__.update(self.__dict__)
+        subset.indices = indices
+        return subset
+
+    def shuffled(self) -> "MappedDataset":
+        return self.subset(np.random.permutation(len(self)))
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        """Raw rows (indices into all shards) in their stored dtype"""
+        shard_ids = np.searchsorted(self.offsets, rows, side='right') - 1
+        output = np.empty((len(rows),) + self.shards[0].shape[1:],
+                          dtype=self.shards[0].dtype)
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            local = rows[mask] - self.offsets[shard_id]
+            # Read rows in file order, reads from the memory map are faster
+            order = np.argsort(local)
+            shard = self.shards[shard_id]
+            output[np.flatnonzero(mask)[order]] = shard[local[order]]
+        return output
+
+    def __getitem__(self, key) -> np.ndarray:
+        scalar = np.isscalar(key)
+        rows = np.arange(len(self))[key] if scalar or isinstance(key, slice) \
+            else np.asarray(key)
+        rows = np.atleast_1d(rows)
+        if self.indices is not None:
+            rows = self.indices[rows]
+        batch = self.read(rows).astype(self.dtype)
+        if self.scale is not None:
+            batch *= self.dtype.type(self.scale)
+        return batch[0] if scalar else batch
+
+    def __array__(self, dtype=None):
+        print("WARNING: Reading entire dataset %s into memory" % self.paths)
+        data = self[:]
+        return data if dtype is None else data.astype(dtype)
@@ -1,4 +1,6 @@
 """Generators"""
+import queue
+import threading
 import numpy as np
 
 # Minibatching
@@ -20,14 +22,16 @@ def tile_shape(x, y):
         yield batch_data
 
 
-def infinite_batches(inputs, batch_size, f=lambda x: x, shuffle=False):
+def infinite_batches(inputs, batch_size, f=lambda x: x, shuffle=False,
+                     dtype=None):
     """Create generator which without termintation yields batch_size chunk
     of inputs
     Args:
-        inputs:
+        inputs: array, memory mapped array or MappedDataset
         batch_size:
         f: arbitrary function to apply to batch
         Shuffle: If True randomly shuffles ordering
+        dtype: If not None convert each batch (and only the batch) to dtype
     """
     start_idx = 0
     nelements = len(inputs)
@@ -50,7 +54,10 @@ def infinite_batches(inputs, batch_size, f=lambda x: x, shuffle=False):
         else:
             excerpt = indices[start_idx:start_idx + batch_size]
             start_idx = start_idx + batch_size
-        yield f(inputs[excerpt])
+        batch = inputs[excerpt]
+        if dtype is not None:
+            batch = batch.astype(dtype)
+        yield f(batch)
 
 
 def constant_batches(x, f):
@@ -80,3 +87,83 @@ def attach(tensor, gen):
 def gen_gens(ts, data, batch_size):
     return [attach(ts[i], infinite_batches(data[i], batch_size)) \
                  for i in range(len(data))]
+
+
+# Prefetching
+class LockedGenerator:
+    """Wrap a generator so that it can be advanced from several threads"""
+    def __init__(self, gen):
+        self.gen = gen
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.lock:
+            return next(self.gen)
+
+
+def merge_feeds(gens):
+    """Generator of the union of the feed dicts yielded by each of gens"""
+    while True:
+        feed_dict = {}
+        for gen in gens:
+            feed_dict.update(next(gen))
+        yield feed_dict
+
+
+class Prefetcher:
+    """Generator which fills a bounded queue from `gen` in a background thread,
+    so that the next items are ready while the consumer (e.g. sess.run) works"""
+    def __init__(self, gen, size=4):
+        self.gen = gen
+        self.queue = queue.Queue(maxsize=size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+
+    def put(self, item, error=None) -> bool:
+        """Put into the queue unless closed first, returns whether put"""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fill(self):
+        try:
+            for item in self.gen:
+                if not self.put(item):
+                    return
+            self.put(None, StopIteration())
+        except Exception as e:
+            # Reraise in the consumer
+            self.put(None, e)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item, error = self.queue.get()
+        if error is not None:
+            raise error
+        return item
+
+    def close(self, timeout=1.0):
+        """Stop the background thread and discard prefetched items"""
+        self.stopped.set()
+        # The thread may be inside a slow next(gen), it exits after it
+        self.thread.join(timeout)
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+
+def prefetch_feeds(gens, size=4):
+    """Feed dicts merged from `gens`, prepared `size` steps ahead"""
+    return Prefetcher(merge_feeds(gens), size=size)
@@ -0,0 +1,166 @@
+"""Structural hashing of arrows"""
+import hashlib
+import marshal
+import types
+from typing import Dict
+
+import numpy as np
+
+from arrows.arrow import Arrow
+from arrows.compositearrow import CompositeArrow
+
+# Attributes which do not affect what an arrow computes
+IGNORED_ATTRS = {'name', 'parent', 'plan', 'edges', '_ports', 'port_attr',
+                 '_port_kinds', '_structural_hash'}
+
+
+def sha1(string: str) -> str:
+    return hashlib.sha1(string.encode('utf-8')).hexdigest()
+
+
+def value_key(value, memo=None) -> str:
+    """Stable string key for an attribute or port attribute value"""
+    if isinstance(value, Arrow):
+        return structural_hash(value, memo)
+    if isinstance(value, np.ndarray):
+        data = np.ascontiguousarray(value).tobytes()
+        return "ndarray:%s:%s:%s" % (value.dtype, value.shape,
+                                     hashlib.sha1(data).hexdigest())
+    if isinstance(value, np.generic):
+        return value_key(np.asarray(value), memo)
+    if isinstance(value, dict):
+        items = sorted(value_key(k, memo) + "=" + value_key(v, memo)
+                       for k, v in value.items())
+        return "dict:{%s}" % ",".join(items)
+    if isinstance(value, (set, frozenset)):
+        return "set:{%s}" % ",".join(sorted(value_key(v, memo)
+                                            for v in value))
+    if isinstance(value, (list, tuple)):
+        return "%s:[%s]" % (type(value).__name__,
+                            ",".join(value_key(v, memo) for v in value))
+    if isinstance(value, types.FunctionType):
+        return function_key(value, memo)
+    if callable(value) and hasattr(value, '__qualname__'):
+        return "callable:%s.%s" % (value.__module__, value.__qualname__)
+    return "%s:%r" % (type(value).__name__, value)
+
+
+def function_key(f: types.FunctionType, memo=None) -> str:
+    """Key of a python function, which tells apart lambdas and closures of
+    the same name by their code, default arguments and closed over values.
+    Globals they refer to are not part of the key"""
+    memo = {} if memo is None else memo
+    if f in memo:
+        # A function which (indirectly) closes over itself
+        return memo[f]
+    memo[f] = "function:%s.%s" % (f.__module__, f.__qualname__)
+    code = hashlib.sha1(marshal.dumps(f.__code__)).hexdigest()
+    cells = []
+    for cell in f.__closure__ or ():
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError:
+            # Variable not assigned yet
+            cells.append(None)
+    memo[f] = "%s:%s:%s:%s" % (memo[f], code, value_key(f.__defaults__, memo),
+                               value_key(cells, memo))
+    return memo[f]
+
+
+def class_key(arrow: Arrow) -> str:
+    return "%s.%s" % (arrow.__class__.__module__, arrow.__class__.__qualname__)
+
+
+def local_key(arrow: Arrow, memo=None) -> str:
+    """Key for an arrow ignoring anything inside of it"""
+    attrs = sorted((k, v) for k, v in vars(arrow).items()
+                   if k not in IGNORED_ATTRS)
+    attr_key = ",".join("%s=%s" % (k, value_key(v, memo)) for k, v in attrs)
+    port_key = ",".join(value_key(attr) for attr in arrow.port_attr)
+    return "%s(%s)[%s]" % (class_key(arrow), attr_key, port_key)
+
+
+def canonical_order(comp_arrow, keys: Dict[Arrow, str]) -> Dict[Arrow, int]:
+    """Number sub arrows of `comp_arrow` independently of names and of the
+    (set) order in which they are stored, by traversing edges from the
+    ports of `comp_arrow` in index order
+    Args:
+        comp_arrow: Composite arrow whose sub arrows to number
+        keys: structural hash of each sub arrow
+    Returns:
+        Map from each arrow (including comp_arrow itself) to its number"""
+    order = {comp_arrow: 0}
+    queue = [comp_arrow]
+    while len(queue) > 0:
+        arrow = queue.pop(0)
+        for port in arrow.ports():
+            neighs = [neigh for neigh in comp_arrow.neigh_ports(port)
+                      if neigh.arrow not in order]
+            neighs.sort(key=lambda p: (keys[p.arrow], p.index))
+            for neigh in neighs:
+                if neigh.arrow not in order:
+                    order[neigh.arrow] = len(order)
+                    queue.append(neigh.arrow)
+        if len(queue) == 0:
+            # Arrows not connected to anything reached so far
+            unreached = [a for a in keys if a not in order]
+            if len(unreached) > 0:
+                first = min(unreached, key=lambda a: keys[a])
+                order[first] = len(order)
+                queue.append(first)
+    return order
+
+
+def structural_hash(arrow: Arrow, memo=None) -> str:
+    """Hash of the structure of an arrow.
+    Two arrows with the same structural hash compute the same function; names
+    of arrows are ignored.
+    Args:
+        arrow: Arrow to hash
+        memo: Dict from arrows and functions to their already computed key
+    Returns:
+        Hex digest which depends on the topology, primitive types, port
+        attributes and values of source arrows in `arrow`
+    The hash is kept on the arrow until it (or an arrow within it) is changed
+    through add_edge, remove_edge, add_port or the port_attributes setters"""
+    memo = {} if memo is None else memo
+    if arrow in memo:
+        return memo[arrow]
+    if arrow._structural_hash is not None:
+        memo[arrow] = arrow._structural_hash
+        return memo[arrow]
+    if not isinstance(arrow, CompositeArrow):
+        memo[arrow] = arrow._structural_hash = sha1(local_key(arrow, memo))
+        return memo[arrow]
+
+    keys = {sub_arrow: structural_hash(sub_arrow, memo)
+            for sub_arrow in arrow.get_sub_arrows()}
+    order = canonical_order(arrow, keys)
+    sub_arrows = sorted(order.items(), key=lambda item: item[1])
+    sub_keys = [keys[sub_arrow] for sub_arrow, _ in sub_arrows[1:]]
+    edges = sorted((order[left.arrow], left.index,
+                    order[right.arrow], right.index)
+                   for left, right in arrow.edges.items())
+    memo[arrow] = arrow._structural_hash = sha1("%s|%s|%s" % (
+        local_key(arrow, memo), ",".join(sub_keys), edges))
+    return memo[arrow]
+
+
+def canonical_ports(arrow: Arrow, memo=None, prefix=(), ids=None) -> Dict:
+    """Map every port nested in `arrow` to an id which is the same for the
+    corresponding port of any arrow with the same structural hash
+    Returns:
+        Dict from port to (path of canonical numbers of arrows, port index)"""
+    memo = {} if memo is None else memo
+    ids = {} if ids is None else ids
+    for port in arrow.ports():
+        ids[port] = (prefix, port.index)
+    if isinstance(arrow, CompositeArrow):
+        keys = {sub_arrow: structural_hash(sub_arrow, memo)
+                for sub_arrow in arrow.get_sub_arrows()}
+        # FIXME: Arrows which are indistinguishable by canonical_order may be
+        # numbered differently in equal arrows
+        for sub_arrow, number in canonical_order(arrow, keys).items():
+            if sub_arrow is not arrow:
+                canonical_ports(sub_arrow, memo, prefix + (number,), ids)
+    return ids
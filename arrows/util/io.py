@@ -1,5 +1,7 @@
 import os
 import csv
+import pickle
+import tempfile
 
 def save_params(fname, params):
     f = open(fname, 'w')
@@ -17,6 +19,35 @@ def save_dict_csv(fname, params):
     f.close()
 
 
+def save_pickle(obj, path: str, protocol=pickle.HIGHEST_PROTOCOL) -> None:
+    """Pickle obj into path atomically, so that a crash while writing never
+    leaves a truncated file at path"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f, protocol)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_pickle(path: str):
+    """Unpickled contents of path, or None if it is missing or unreadable"""
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            ImportError, IndexError, TypeError, ValueError) as e:
+        print("WARNING: Ignoring unreadable %s: %s" % (path, e))
+        return None
+
+
 def get_filepaths(directory):
     """
     This function will generate the file names in a directory
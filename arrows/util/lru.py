@@ -0,0 +1,28 @@
+"""Least recently used caches"""
+from collections import OrderedDict
+
+
+class LRUCache(OrderedDict):
+    """Dict of at most `size` items, putting an item in a full cache drops
+    the one least recently got or put"""
+
+    def __init__(self, size: int=128):
+        super().__init__()
+        self.size = size
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def put(self, key, value) -> None:
+        self[key] = value
+        self.move_to_end(key)
+        self.resize(self.size)
+
+    def resize(self, size: int) -> None:
+        """Keep at most size items, dropping the least recently used"""
+        self.size = size
+        while len(self) > size:
+            self.popitem(last=False)
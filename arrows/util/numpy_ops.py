@@ -0,0 +1,65 @@
+"""NumPy equivalents of tensorflow ops, to evaluate them without a session"""
+import numpy as np
+
+from arrows.config import floatX
+
+
+def gather_nd(params: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Numpy equivalent of tf.gather_nd"""
+    indices = np.asarray(indices)
+    return np.asarray(params)[tuple(np.moveaxis(indices, -1, 0))]
+
+
+def scatter_nd(indices: np.ndarray, updates: np.ndarray, shape) -> np.ndarray:
+    """Numpy equivalent of tf.scatter_nd, duplicate indices are summed"""
+    indices = np.asarray(indices)
+    updates = np.asarray(updates)
+    output = np.zeros(tuple(np.atleast_1d(shape)), dtype=updates.dtype)
+    np.add.at(output, tuple(np.moveaxis(indices, -1, 0)), updates)
+    return output
+
+
+def sparse_to_dense(sparse_indices: np.ndarray,
+                    output_shape,
+                    sparse_values,
+                    default_value=0) -> np.ndarray:
+    """Numpy equivalent of tf.sparse_to_dense(validate_indices=False)"""
+    sparse_indices = np.asarray(sparse_indices)
+    sparse_values = np.asarray(sparse_values)
+    if sparse_indices.ndim < 2:
+        sparse_indices = sparse_indices.reshape(-1, 1)
+    output = np.full(tuple(np.atleast_1d(output_shape)), default_value,
+                     dtype=sparse_values.dtype)
+    output[tuple(sparse_indices.T)] = sparse_values
+    return output
+
+
+def batch_sparse_to_dense(sparse_indices: np.ndarray,
+                          output_shape,
+                          sparse_values,
+                          default_value=0) -> np.ndarray:
+    """sparse_to_dense of each element of a batch.
+    Args:
+        sparse_indices: (batch_size, n, len(output_shape) - 1) indices into
+            each element of the batch
+        output_shape: Shape of the output, (batch_size, ...)
+        sparse_values: (batch_size, n) values or a scalar
+    Returns:
+        Array of shape output_shape"""
+    sparse_indices = np.asarray(sparse_indices)
+    batch = np.broadcast_to(np.arange(sparse_indices.shape[0]).reshape(-1, 1, 1),
+                            sparse_indices.shape[:-1] + (1,))
+    sparse_indices = np.concatenate([batch, sparse_indices], axis=-1)
+    if np.ndim(sparse_values) > 0:
+        sparse_values = np.reshape(sparse_values, -1)
+    return sparse_to_dense(sparse_indices.reshape(-1, sparse_indices.shape[-1]),
+                           output_shape, sparse_values, default_value)
+
+
+def constant(value) -> np.ndarray:
+    """Array of `value` with the dtype tf.constant would give it"""
+    if isinstance(value, float):
+        return np.array(value, dtype=floatX())
+    if isinstance(value, int):
+        return np.array(value, dtype='int32')
+    return np.asarray(value)
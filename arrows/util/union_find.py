@@ -0,0 +1,61 @@
+"""Disjoint sets of integers"""
+import numpy as np
+
+
+class UnionFind():
+    """Partition of the integers 0..n-1 into disjoint sets.
+    The representative of a set is its smallest element, so parent[i] <= i"""
+
+    def __init__(self, n: int):
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def compress(self) -> np.ndarray:
+        """Point every element directly at its representative"""
+        while True:
+            grandparent = self.parent[self.parent]
+            if np.array_equal(grandparent, self.parent):
+                return self.parent
+            self.parent = grandparent
+
+    def find(self, i: int) -> int:
+        """Representative of the set containing i"""
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return int(root)
+
+    def union(self, i: int, j: int) -> int:
+        """Merge the sets containing i and j, returns the new representative"""
+        i, j = self.find(i), self.find(j)
+        self.parent[max(i, j)] = min(i, j)
+        return min(i, j)
+
+    def union_many(self, i: np.ndarray, j: np.ndarray) -> None:
+        """Merge the sets containing i[k] and j[k] for every k.
+        Each round hooks the representative of every unmerged pair to the
+        smaller of the two, then compresses paths, so the number of rounds
+        is small unless sets are joined in long chains"""
+        i = np.asarray(i, dtype=np.int64).reshape(-1)
+        j = np.asarray(j, dtype=np.int64).reshape(-1)
+        while len(i) > 0:
+            parent = self.compress()
+            root_i, root_j = parent[i], parent[j]
+            unmerged = root_i != root_j
+            i, j = i[unmerged], j[unmerged]
+            root_i, root_j = root_i[unmerged], root_j[unmerged]
+            # Of several hooks of one representative the smallest wins, the
+            # others are retried next round
+            np.minimum.at(self.parent, np.maximum(root_i, root_j),
+                          np.minimum(root_i, root_j))
+
+    def classes(self) -> np.ndarray:
+        """Array whose ith element is the number of the set containing i,
+        sets are numbered 0, 1, ... in order of their smallest element"""
+        _, inverse = np.unique(self.compress(), return_inverse=True)
+        return inverse
@@ -31,8 +31,8 @@ def get_data(dirs, data_fname="last_it_4999_fetch.pickle"):
         data_file.close()
     return data
 
-def best_hyperparameters(prefix, names, num_iterations):
-    prefix = path+prefix
+def best_hyperparameters(prefix, names, num_iterations, datadir=path):
+    prefix = os.path.join(datadir, prefix)
     dirs = get_dirs(prefix)
     data = get_data(dirs, data_fname="last_it_"+str(num_iterations-1)+"_fetch.pickle")
     options = get_data(dirs, data_fname="options.pickle")
@@ -0,0 +1,62 @@
+"""Compare the cost of executing arrows with tensorflow and with numpy"""
+import time
+import numpy as np
+from arrows import CompositeArrow
+from arrows.port_attributes import make_in_port, make_out_port
+from arrows.primitive.math_arrows import AddArrow, MulArrow
+from arrows.apply.apply import apply, compile_arrow
+from arrows.apply.apply_numpy import apply_numpy
+
+
+def chain_arrow(n_arrows: int) -> CompositeArrow:
+    """((x * y_0) + y_1) * y_2 ... with `n_arrows` primitives"""
+    comp_arrow = CompositeArrow(name="chain_%s" % n_arrows)
+    sub_arrows = [MulArrow() if i % 2 == 0 else AddArrow()
+                  for i in range(n_arrows)]
+    x = comp_arrow.add_port()
+    make_in_port(x)
+    comp_arrow.add_edge(x, sub_arrows[0].in_port(0))
+    for i, sub_arrow in enumerate(sub_arrows):
+        y = comp_arrow.add_port()
+        make_in_port(y)
+        comp_arrow.add_edge(y, sub_arrow.in_port(1))
+        if i > 0:
+            comp_arrow.add_edge(sub_arrows[i - 1].out_port(0),
+                                sub_arrow.in_port(0))
+    out = comp_arrow.add_port()
+    make_out_port(out)
+    comp_arrow.add_edge(sub_arrows[-1].out_port(0), out)
+    assert comp_arrow.is_wired_correctly()
+    return comp_arrow
+
+
+def time_per_call(f, arrow, inputs, n_calls):
+    start = time.time()
+    for i in range(n_calls):
+        f(arrow, inputs)
+    return (time.time() - start) / n_calls
+
+
+def compare_backends(sizes=(1, 10, 100, 1000),
+                     n_arrows=(4, 16, 64),
+                     n_calls=10):
+    """Time per call (seconds) of each backend for chains of arrows"""
+    backends = {'apply': apply,
+                'compiled': lambda arrow, inputs: compile_arrow(arrow)(inputs),
+                'numpy': apply_numpy}
+    results = []
+    for n in n_arrows:
+        arrow = chain_arrow(n)
+        for size in sizes:
+            inputs = [np.random.rand(size) for i in range(arrow.num_in_ports())]
+            row = {'n_arrows': n, 'size': size}
+            for name, f in backends.items():
+                row[name] = time_per_call(f, arrow, inputs, n_calls)
+            results.append(row)
+            print("%(n_arrows)5d arrows, size %(size)6d:  apply %(apply).5f  "
+                  "compiled %(compiled).5f  numpy %(numpy).5f" % row)
+    return results
+
+
+if __name__ == "__main__":
+    compare_backends()
@@ -1,9 +1,9 @@
 """Functions common for examples"""
 import sys
 from arrows.util.io import *
-from arrows.apply.propagate import propagate
+from arrows.apply.propagate import propagate, enable_propagate_cache
 from arrows.util.misc import rand_string, getn
-from metrics.generalization import test_everything
+from metrics.generalization import test_everything, successive_halving
 from reverseflow.train.common import layer_width
 from reverseflow.train.reparam import *
 from reverseflow.train.unparam import unparam
@@ -40,11 +40,33 @@ def default_benchmark_options():
     options['template_name'] = (str, 'res_net')
     # options['train'] = (bool, True)
     options['script'] = (boolify, False)
+    options['invert_cache'] = (boolify, False)
+    options['invert_cache_dir'] = (str, "")
+    options['propagate_cache'] = (boolify, False)
+    options['propagate_cache_dir'] = (str, "")
+    options['prefetch'] = (int, 0)
+    options['batch_polymorphic'] = (boolify, False)
+    # Hyperparameter sweeps
+    options['prefix'] = (str, "")
+    options['nprocs'] = (int, 0)
+    options['threads_per_proc'] = (int, 1)
+    options['resume'] = (boolify, False)
+    options['search'] = (str, 'grid')  # or 'halving'
+    options['halving_eta'] = (int, 3)
+    options['halving_min_iterations'] = (int, 0)  # 0 to choose automatically
     return options
 
 # Training stuff
 def gen_arrow(batch_size, model_tensorflow, options):
-    inputs, outputs = getn(model_tensorflow(**options), 'inputs', 'outputs')
+    enable_propagate_cache(options.get('propagate_cache', False),
+                           cache_dir=options.get('propagate_cache_dir') or None)
+    model_options = dict(options)
+    if options.get('batch_polymorphic', False):
+        # Leave the batch size unknown, so that the arrow (and with
+        # invert_cache its inverse) is the same for every batch size
+        model_options['batch_size'] = None
+    inputs, outputs = getn(model_tensorflow(**model_options),
+                           'inputs', 'outputs')
     name = options['model_name']
     arrow = graph_to_arrow(outputs,
                            input_tensors=inputs,
@@ -52,6 +74,14 @@ def gen_arrow(batch_size, model_tensorflow, options):
     return arrow
 
 
+def gen_inv_arrow(arrow, options):
+    """Invert arrow, reusing inverses of identical arrows if invert_cache"""
+    cache_dir = options.get('invert_cache_dir') or None
+    return invert(arrow,
+                  cache=options.get('invert_cache', False),
+                  cache_dir=cache_dir)
+
+
 def rand_input(batch_size, n_angles, n_lengths):
     input_data = []
     for _ in range(n_angles):
@@ -114,7 +144,7 @@ def pi_supervised(options):
     gen_data = options['gen_data']
 
     arrow = gen_arrow(batch_size, model_tensorflow, options)
-    inv_arrow = invert(arrow)
+    inv_arrow = gen_inv_arrow(arrow, options)
     inv_arrow = inv_fwd_loss_arrow(arrow, inv_arrow)
     right_inv = unparam(inv_arrow)
     sup_right_inv = supervised_loss_arrow(right_inv)
@@ -211,7 +241,7 @@ def pi_reparam(options):
     n_links = options['n_links']
 
     arrow = gen_arrow(batch_size, model_tensorflow, options)
-    inv_arrow = invert(arrow)
+    inv_arrow = gen_inv_arrow(arrow, options)
     inv_arrow = inv_fwd_loss_arrow(arrow, inv_arrow)
     rep_arrow = reparam(inv_arrow, (batch_size,) + phi_shape)
     def sampler(*x):
@@ -234,25 +264,47 @@ def sampler(*x):
 
 
 # Benchmarks
+def sweep(run_me, options, var_option_keys, nrepeats):
+    """test_everything with the sweep options of `options`, returns prefix"""
+    prefix = options['prefix'] if options['prefix'] else rand_string(5)
+    test_everything(run_me, options, var_option_keys, prefix=prefix,
+                    nrepeats=nrepeats, nprocs=options['nprocs'],
+                    threads_per_proc=options['threads_per_proc'],
+                    resume=options['resume'])
+    return prefix
+
+
 def nn_benchmarks(model_name, options=None):
     options = {} if options is None else options
     options.update(handle_options(model_name, sys.argv[1:]))
     options['data_size'] = [1, 7, 15, 25, 36, 50, 70, 90, 120, 150]# [int(ds) for ds in np.round(np.logspace(0, np.log10(500-1), 10)).astype(int)]
     options['error'] = ['inv_fwd_error']
-    prefix = rand_string(5)
-    test_everything(nn_supervised, options, ["error",], prefix=prefix, nrepeats=3)
+    sweep(nn_supervised, options, ["error",], nrepeats=3)
 
 
 def pi_reparam_benchmarks(model_name, options=None):
     options = {} if options is None else options
     options.update(handle_options(model_name, sys.argv[1:]))
     options['error'] = ['inv_fwd_error'] # , 'inv_fwd_error', 'error', 'sub_arrow_error']
-    prefix = rand_string(5)
     options['learning_rate'] = np.linspace(0.00001, 0.1, 30)
     options['lambda'] = np.linspace(1, 10, 30)
     # pi_reparam(options)
-    test_everything(pi_reparam, options, ['learning_rate', 'lambda'], prefix=prefix, nrepeats=1)
-    learning_rate, lmbda = best_hyperparameters(prefix, ['learning_rate', 'lambda'], options['num_iterations'])
+    if options['search'] == 'halving':
+        prefix = options['prefix'] if options['prefix'] else rand_string(5)
+        min_iterations = options['halving_min_iterations'] or None
+        ranked = successive_halving(pi_reparam, options,
+                                    ['learning_rate', 'lambda'],
+                                    prefix=prefix, eta=options['halving_eta'],
+                                    min_iterations=min_iterations)
+        best = ranked[0][1]
+        learning_rate, lmbda = best['learning_rate'], best['lambda']
+    else:
+        prefix = sweep(pi_reparam, options, ['learning_rate', 'lambda'],
+                       nrepeats=1)
+        learning_rate, lmbda = best_hyperparameters(prefix,
+                                                    ['learning_rate', 'lambda'],
+                                                    options['num_iterations'],
+                                                    datadir=options['datadir'])
     print(learning_rate, lmbda)
 
 
@@ -262,5 +314,4 @@ def pi_benchmarks(model_name, options=None):
     options['data_size'] = [1, 7, 15, 25, 36, 50, 70, 90, 120, 150]# [int(ds) for ds in np.round(np.logspace(0, np.log10(500-1), 10)).astype(int)]
     # options['data_size'] = [int(ds) for ds in np.round(np.logspace(0, np.log10(500-1), 10)).astype(int)]
     options['error'] = ['supervised_error'] # , 'inv_fwd_error', 'error', 'sub_arrow_error']
-    prefix = rand_string(5)
-    test_everything(pi_supervised, options, ["error", 'data_size'], prefix=prefix, nrepeats=3)
+    sweep(pi_supervised, options, ["error", 'data_size'], nrepeats=3)
@@ -0,0 +1,62 @@
+"""Compare complement_bool_list with the per index loop it replaced, on
+indices like those of a voxel renderer gathering from a batch of grids"""
+import time
+from functools import partial
+import numpy as np
+from reverseflow.util.misc import complement_bool_list
+
+
+def loop_complement_bool_list(indices: np.ndarray, shape):
+    """Reference: one python iteration per index"""
+    bools = np.ones(shape, dtype=np.dtype(bool))
+    unique = []
+    for i in np.ndindex(indices.shape[:-1]):
+        index = tuple(indices[i])
+        if bools[index] == 1:
+            unique.append(i)
+        bools[index] = 0
+    return bools, np.array(unique)
+
+
+def voxel_indices(shape, n_rays: int, steps: int, seed=0):
+    """(batch, n_rays, steps, len(shape)) indices into a batch of grids of
+    `shape`, with repeats as when rays pass through the same voxels"""
+    rng = np.random.RandomState(seed)
+    batch_size, res = shape[0], shape[1]
+    inds = rng.randint(0, res, size=(batch_size, n_rays, steps, len(shape) - 1))
+    batch = np.broadcast_to(np.arange(batch_size)[:, None, None, None],
+                            (batch_size, n_rays, steps, 1))
+    return np.concatenate([batch, inds], axis=-1)
+
+
+def measure(f, indices, shape, repeats=3) -> float:
+    """Best time (seconds) of `repeats` calls of f(indices, shape)"""
+    best = float('inf')
+    for i in range(repeats):
+        start = time.time()
+        f(indices, shape)
+        best = min(best, time.time() - start)
+    return best
+
+
+def compare_complements(sizes=((8, 32), (32, 32), (1, 64), (8, 64)),
+                        n_rays=1024, steps=32, max_loop_indices=2 ** 20):
+    results = {}
+    for batch_size, res in sizes:
+        shape = (batch_size, res, res, res)
+        indices = voxel_indices(shape, n_rays, steps)
+        row = {'dense': measure(complement_bool_list, indices, shape),
+               'sparse': measure(partial(complement_bool_list, sparse=True),
+                                 indices, shape)}
+        # The loop takes minutes on the larger sizes
+        n_indices = int(np.prod(indices.shape[:-1]))
+        row['loop'] = measure(loop_complement_bool_list, indices, shape, 1) \
+            if n_indices <= max_loop_indices else float('nan')
+        results[shape] = row
+        print("%20s %9d indices: loop %8.3fs  dense %.3fs  sparse %.3fs" %
+              (shape, n_indices, row['loop'], row['dense'], row['sparse']))
+    return results
+
+
+if __name__ == "__main__":
+    compare_complements()
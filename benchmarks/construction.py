@@ -0,0 +1,54 @@
+"""Memory and time to construct large arrows with graph_to_arrow, and the
+cost of querying their ports"""
+import time
+import tracemalloc
+import tensorflow as tf
+from reverseflow.to_arrow import graph_to_arrow
+
+
+def chain_graph(n_ops: int):
+    """Tensorflow graph ((x * y) + y) * y ... with `n_ops` ops"""
+    x = tf.placeholder(tf.float32, shape=(), name="x")
+    y = tf.placeholder(tf.float32, shape=(), name="y")
+    z = x
+    for i in range(n_ops):
+        z = z * y if i % 2 == 0 else z + y
+    return [x, y], [z]
+
+
+def query_ports(arrow, uncached=False):
+    """Query the in/out/param/error ports of every sub arrow of `arrow`,
+    if uncached recompute them each time, as before they were cached"""
+    for sub_arrow in arrow.get_sub_arrows():
+        for query in (sub_arrow.in_ports, sub_arrow.out_ports,
+                      sub_arrow.param_ports, sub_arrow.error_ports):
+            if uncached:
+                sub_arrow.invalidate_port_kinds()
+            query()
+
+
+def benchmark_construction(n_ops=(100, 1000, 10000), n_queries=10):
+    results = []
+    for n in n_ops:
+        tf.reset_default_graph()
+        inputs, outputs = chain_graph(n)
+        tracemalloc.start()
+        start = time.time()
+        arrow = graph_to_arrow(outputs, input_tensors=inputs, name="chain")
+        row = {'n_ops': n, 'construct': time.time() - start,
+               'memory': tracemalloc.get_traced_memory()[0]}
+        tracemalloc.stop()
+        for uncached in (False, True):
+            start = time.time()
+            for i in range(n_queries):
+                query_ports(arrow, uncached)
+            key = 'uncached' if uncached else 'cached'
+            row[key] = (time.time() - start) / n_queries
+        results.append(row)
+        print("%(n_ops)6d ops: construct %(construct).3fs  memory %(memory)10d B"
+              "  port queries cached %(cached).4fs uncached %(uncached).4fs" % row)
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_construction()
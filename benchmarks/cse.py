@@ -0,0 +1,93 @@
+"""Compare inverting the Stanford manipulator's forward kinematics with and
+without common subexpression elimination.
+The arrow is built like graph_to_arrow would build it from tensorflow: one
+arrow per operation and one SourceArrow per use of a constant"""
+import time
+from arrows.compositearrow import CompositeArrow
+from arrows.port_attributes import make_in_port, make_out_port, set_port_shape
+from arrows.std_arrows import (AddArrow, SubArrow, MulArrow, NegArrow, SinArrow,
+                               CosArrow, SourceArrow)
+from arrows.apply.propagate import propagate
+from arrows.transform.cse import eliminate_common_subexpressions
+from reverseflow.invert import invert
+from stanford_exprs import stanford_fwd
+
+
+class Term():
+    """Output port of an arrow within `comp_arrow`, combined with other terms
+    and constants by python operators into new arrows"""
+
+    def __init__(self, comp_arrow: CompositeArrow, port):
+        self.comp_arrow = comp_arrow
+        self.port = port
+
+    def apply(self, arrow, *args) -> "Term":
+        for i, arg in enumerate(args):
+            if not isinstance(arg, Term):
+                arg = Term(self.comp_arrow, SourceArrow(arg).out_port(0))
+            self.comp_arrow.add_edge(arg.port, arrow.in_port(i))
+        return Term(self.comp_arrow, arrow.out_port(0))
+
+    def __add__(self, other): return self.apply(AddArrow(), self, other)
+    def __radd__(self, other): return self.apply(AddArrow(), other, self)
+    def __sub__(self, other): return self.apply(SubArrow(), self, other)
+    def __rsub__(self, other): return self.apply(SubArrow(), other, self)
+    def __mul__(self, other): return self.apply(MulArrow(), self, other)
+    def __rmul__(self, other): return self.apply(MulArrow(), other, self)
+    def __neg__(self): return self.apply(NegArrow(), self)
+
+
+def stanford_arrow() -> CompositeArrow:
+    arrow = CompositeArrow(name="stanford")
+    inputs = []
+    for i in range(6):
+        in_port = arrow.add_port()
+        make_in_port(in_port)
+        set_port_shape(in_port, ())
+        inputs.append(Term(arrow, in_port))
+    outputs = stanford_fwd(inputs,
+                           lambda x: x.apply(CosArrow(), x),
+                           lambda x: x.apply(SinArrow(), x))
+    for output in outputs:
+        out_port = arrow.add_port()
+        make_out_port(out_port)
+        arrow.add_edge(output.port, out_port)
+    return arrow
+
+
+def measure(cse: bool):
+    """Sub arrows, parameters and times (seconds) to invert and propagate"""
+    arrow = stanford_arrow()
+    start = time.time()
+    if cse:
+        eliminate_common_subexpressions(arrow)
+    cse_time = time.time() - start
+    n_sub_arrows = len(arrow.get_sub_arrows())
+    start = time.time()
+    inv = invert(arrow)
+    invert_time = time.time() - start
+    start = time.time()
+    propagate(inv)
+    propagate_time = time.time() - start
+    return {'sub_arrows': n_sub_arrows,
+            'inv_sub_arrows': len(inv.get_sub_arrows_nested()),
+            'params': inv.num_param_ports(),
+            'cse': cse_time,
+            'invert': invert_time,
+            'propagate': propagate_time}
+
+
+def compare_cse():
+    results = {}
+    for cse in (False, True):
+        row = measure(cse)
+        results[cse] = row
+        print("cse=%-5s: %4d sub arrows, inverse %5d nested sub arrows"
+              " %3d params, cse %.3fs invert %.3fs propagate %.3fs" %
+              (cse, row['sub_arrows'], row['inv_sub_arrows'], row['params'],
+               row['cse'], row['invert'], row['propagate']))
+    return results
+
+
+if __name__ == "__main__":
+    compare_cse()
@@ -0,0 +1,57 @@
+"""Compare memory and lookup time of edge stores for composite arrows"""
+import time
+import tracemalloc
+from arrows.port import InPort, OutPort
+from arrows.primitive.math_arrows import AddArrow
+from reverseflow.util.mapping import Relation, ArrayRelation
+
+
+def chain_edges(n_edges: int):
+    """Edges of a chain of `n_edges` + 1 AddArrows"""
+    arrows = [AddArrow() for i in range(n_edges + 1)]
+    return [(arrows[i].out_port(0), arrows[i + 1].in_port(0))
+            for i in range(n_edges)]
+
+
+def measure(edge_store, edges):
+    """Memory (bytes) and time (seconds) to build and query `edge_store`"""
+    tracemalloc.start()
+    start = time.time()
+    rel = edge_store()
+    for left, right in edges:
+        rel.add(left, right)
+    build_time = time.time() - start
+    if isinstance(rel, ArrayRelation):
+        # Merge edges added since the last rebuild into the arrays
+        rel.build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.time()
+    for left, right in edges:
+        rel.fwd(left)
+        rel.inv(right)
+    lookup_time = (time.time() - start) / (2 * len(edges))
+
+    start = time.time()
+    n_items = sum(1 for item in rel.items())
+    items_time = time.time() - start
+    assert n_items == len(edges)
+    return {'memory': memory, 'build': build_time, 'lookup': lookup_time,
+            'items': items_time}
+
+
+def compare_edge_stores(n_edges=100000):
+    edges = chain_edges(n_edges)
+    results = {}
+    for edge_store in (Relation, ArrayRelation):
+        row = measure(edge_store, edges)
+        results[edge_store.__name__] = row
+        print("%15s: memory %8.2fMB  build %.3fs  lookup %.2fus  items %.3fs" %
+              (edge_store.__name__, row['memory'] / 1e6, row['build'],
+               row['lookup'] * 1e6, row['items']))
+    return results
+
+
+if __name__ == "__main__":
+    compare_edge_stores()
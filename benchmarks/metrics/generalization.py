@@ -1,4 +1,9 @@
 """Test generalization"""
+import glob
+import multiprocessing
+import os
+import pickle
+import traceback
 import numpy as np
 import subprocess
 from typing import Sequence
@@ -47,7 +52,62 @@ def string_dict(d):
             new_d[key] = val_string
     return str(new_d)
 
-def test_everything(run_me, options, var_option_keys, prefix='', nrepeats=1):
+def result_fname(options) -> str:
+    """Name of file saved by save_everything_last at the end of a run"""
+    return "last_it_%s_fetch.pickle" % (options['num_iterations'] - 1)
+
+
+def result_path(dirname, options, resultsdir=None):
+    """Path to saved results of run saved in (a directory prefixed by)
+    dirname, None if it hasn't finished"""
+    if resultsdir is None:
+        resultsdir = options.get('datadir', '')
+    base = os.path.join(resultsdir, dirname)
+    for rundir in glob.glob(base) + glob.glob("%s_*" % base):
+        path = os.path.join(rundir, result_fname(options))
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def run_config(run_me, options, nthreads):
+    """Run a single configuration in a worker process, with tensorflow
+    limited to nthreads"""
+    options['intra_op_threads'] = nthreads
+    options['inter_op_threads'] = nthreads
+    start = time.time()
+    try:
+        run_me(options)
+        status = 'done'
+    except Exception:
+        print("WARNING: %s failed" % options['dirname'])
+        traceback.print_exc()
+        status = 'failed'
+    return {'dirname': options['dirname'],
+            'status': status,
+            'time': round(time.time() - start, 1)}
+
+
+def summarize(runs, var_option_keys, options, resultsdir=None):
+    """Print table of the result of each run and add test losses to runs"""
+    for run in runs:
+        path = result_path(run['dirname'], options, resultsdir)
+        if path is not None:
+            with open(path, 'rb') as f:
+                run['test_loss'] = pickle.load(f)['test_fetch_res']['loss']
+    columns = (['dirname'] + list(var_option_keys) +
+               ['status', 'time', 'test_loss'])
+    print("\t".join(columns))
+    for run in runs:
+        row = [run.get(col, '') for col in columns]
+        print("\t".join(string_dict(v) if isinstance(v, dict) else str(v)
+                        for v in row))
+    return runs
+
+
+def test_everything(run_me, options, var_option_keys, prefix='', nrepeats=1,
+                    nprocs=0, threads_per_proc=1, resume=False,
+                    resultsdir=None):
     """Train parametric inverse and vanilla neural network with different
     amounts of data and see the test_error
     Args:
@@ -55,20 +115,149 @@ def test_everything(run_me, options, var_option_keys, prefix='', nrepeats=1):
         Options: Options to be passed into run_me
         var_option_keys: Set of keys, where options['keys'] is a sequence
             and we will vary over cartesian product of all the keys
-
+        nprocs: If > 0 run configurations in a pool of nprocs processes,
+            each in a fresh process; run_me must then be picklable
+        threads_per_proc: tensorflow/blas threads for each process
+        resume: Skip configurations whose directory already contains results;
+            directories are then named by prefix and position only
+        resultsdir: where run directories are saved, defaults to datadir
+    Returns:
+        list of dicts with dirname, values of var_option_keys, status, time,
+        and test_loss of each run
     """
     _options = {}
     _options.update(options)
     var_options = extract(var_option_keys, options)
 
+    runs = []
+    configs = []
     for i in range(nrepeats):
         var_options_prod = dict_prod(var_options)
         the_time = time.time()
         for j, prod in enumerate(var_options_prod):
-            dirname = "%s_%s_%s_%s" % (prefix, str(the_time), i, j)
+            if resume:
+                dirname = "%s_%s_%s" % (prefix, i, j)
+            else:
+                dirname = "%s_%s_%s_%s" % (prefix, str(the_time), i, j)
+            run = {'dirname': dirname}
+            run.update(prod)
+            runs.append(run)
+            if resume and result_path(dirname, options, resultsdir) is not None:
+                print("Skipping %s, already has results" % dirname)
+                run['status'] = 'skipped'
+                continue
             _options['dirname'] = dirname
             _options.update(prod)
+            if nprocs > 0:
+                configs.append((run, dict(_options)))
+                continue
             if options['script']:
                 command = 'sbatch -gres=gpu:1 -n1 ./runscript.sh ' + str(run_me) + ' ' + string_dict(_options)
                 subprocess.call(command)
+            start = time.time()
             run_me(_options)
+            run['status'] = 'done'
+            run['time'] = round(time.time() - start, 1)
+
+    if len(configs) > 0:
+        # Workers (started throughout, one per run) inherit these before
+        # numpy or tensorflow is imported
+        thread_vars = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS']
+        old_env = {var: os.environ.get(var) for var in thread_vars}
+        os.environ.update({var: str(threads_per_proc) for var in thread_vars})
+        ctx = multiprocessing.get_context('spawn')
+        pool = ctx.Pool(nprocs, maxtasksperchild=1)
+        results = [pool.apply_async(run_config,
+                                    (run_me, config_options, threads_per_proc))
+                   for run, config_options in configs]
+        pool.close()
+        for (run, _), result in zip(configs, results):
+            run.update(result.get())
+        pool.join()
+        for var, value in old_env.items():
+            if value is None:
+                del os.environ[var]
+            else:
+                os.environ[var] = value
+
+    return summarize(runs, var_option_keys, options, resultsdir)
+
+
+def halving_callback(fetch_data, feed_dict, i: int, **kwargs):
+    """Record test loss of a run of successive_halving and on the last
+    iteration save the parameters so that the run can be continued"""
+    result = kwargs['halving_result']
+    if 'test_fetch_res' in fetch_data:
+        result['loss'] = fetch_data['test_fetch_res']['loss']
+    if i == kwargs['num_iterations'] - 1 and 'saver' in kwargs:
+        path = os.path.join(kwargs['savedir'], "halving_params")
+        result['params_file'] = kwargs['saver'].save(kwargs['sess'], path)
+
+
+def successive_halving(run_me, options, var_option_keys, prefix='',
+                       loss_key='general_loss', eta=3, min_iterations=None):
+    """Successive halving search over the cartesian product of var_option_keys.
+    Every configuration is trained for min_iterations; the best 1/eta of them
+    by test `loss_key` are continued (from their saved parameters) until they
+    have been trained eta times as long, and so on until the survivors have
+    been trained for options['num_iterations'].
+    Args:
+        run_me: function to call, must pass options['callbacks'] to train_loop
+        options: Options to be passed into run_me
+        var_option_keys: keys of options to search over
+        min_iterations: iterations in first round, by default chosen such
+            that the last round trains for num_iterations
+    Returns:
+        list of (loss, configuration) of last round, best first
+    """
+    max_iterations = options['num_iterations']
+    configs = list(dict_prod(extract(var_option_keys, options)))
+    nrounds = int(np.ceil(np.log(len(configs)) / np.log(eta))) + 1
+    if min_iterations is None:
+        min_iterations = max(1, max_iterations // eta ** (nrounds - 1))
+
+    # State of each surviving configuration
+    runs = [{'config': config, 'params_file': None, 'iterations': 0,
+             'loss': None}
+            for config in configs]
+    budget = min_iterations
+    total_iterations = 0
+    k = 0
+    while True:
+        for j, run in enumerate(runs):
+            _options = {}
+            _options.update(options)
+            _options.update(run['config'])
+            _options['dirname'] = "%s_halving_%s_%s" % (prefix, k, j)
+            _options['num_iterations'] = budget - run['iterations']
+            _options['save'] = True
+            _options['load'] = run['params_file'] is not None
+            _options['params_file'] = run['params_file']
+            _options['halving_result'] = result = {}
+            _options['callbacks'] = ([halving_callback] +
+                                     list(options.get('callbacks', [])))
+            run_me(_options)
+            total_iterations += _options['num_iterations']
+            run['iterations'] = budget
+            assert 'loss' in result, \
+                "No test loss from %s, run_me must pass options['callbacks'] " \
+                "to train_loop" % run['config']
+            run['params_file'] = result.get('params_file')
+            run['loss'] = result['loss'][loss_key]
+            print("Round %s, %s iterations: %s, %s %s" %
+                  (k, budget, run['config'], loss_key, run['loss']))
+        runs.sort(key=lambda run: run['loss'])
+        if budget >= max_iterations:
+            break
+        runs = runs[:max(1, len(runs) // eta)]
+        for run in runs:
+            # Otherwise it would be retrained from scratch on a reduced budget
+            assert run['params_file'] is not None, \
+                "Parameters of %s were not saved, run_me must save through " \
+                "prep_save" % run['config']
+        budget = min(budget * eta, max_iterations)
+        k = k + 1
+
+    print("Successive halving trained for %s iterations, a full grid would "
+          "take %s" % (total_iterations, len(configs) * max_iterations))
+    return [(run['loss'], run['config']) for run in runs]
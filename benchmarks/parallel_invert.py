@@ -0,0 +1,41 @@
+"""Time inversion of the voxel renderer serially and with executors"""
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import tensorflow as tf
+from arrows.util.hash import structural_hash
+from reverseflow.invert import invert
+from reverseflow.to_arrow import graph_to_arrow
+from voxel_render import render_gen_graph
+
+
+def renderer_arrow(options):
+    tf.reset_default_graph()
+    out_img = render_gen_graph(options)['out_img']
+    return graph_to_arrow([out_img], name="renderer")
+
+
+def time_invert(options, executor=None):
+    arrow = renderer_arrow(options)
+    start = time.time()
+    inv = invert(arrow, executor=executor)
+    return time.time() - start, structural_hash(inv)
+
+
+def benchmark_parallel_invert(max_workers=(2, 4, 8)):
+    options = {'res': 32, 'batch_size': 8, 'phong': False, 'nviews': 1,
+               'width': 128, 'height': 128, 'nsteps': 6, 'density': 1.0}
+    serial_time, serial_hash = time_invert(options)
+    print("serial: %.3fs" % serial_time)
+    results = {'serial': serial_time}
+    for pool in (ThreadPoolExecutor, ProcessPoolExecutor):
+        for n in max_workers:
+            with pool(max_workers=n) as executor:
+                inv_time, inv_hash = time_invert(options, executor)
+            assert inv_hash == serial_hash, "parallel inverse differs"
+            results[(pool.__name__, n)] = inv_time
+            print("%s(%s): %.3fs" % (pool.__name__, n, inv_time))
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_parallel_invert()
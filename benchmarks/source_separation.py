@@ -10,6 +10,7 @@
 from matplotlib.pyplot import specgram
 from functools import reduce
 from arrows.util.misc import getn, pull
+from arrows.util.datasets import MappedDataset
 import sys
 from common import handle_options, gen_sfx_key
 from reverseflow.invert import invert
@@ -37,7 +38,12 @@
 # # raw_sounds, srs = load_sound_files(full_sound_paths)
 # raw_sounds, srs = load_sound_files(fold1_paths)
 # sound_batch = np.array(raw_sounds)
-fold1_dataset = np.load(os.path.join(fold1_dir, "fold1.npz")).items()[0][1]
+fold1_shards = os.path.join(fold1_dir, "fold1_*.npy")
+if len(glob.glob(fold1_shards)) > 0:
+    # Memory mapped, see arrows.util.datasets.save_shards
+    fold1_dataset = MappedDataset(fold1_shards)
+else:
+    fold1_dataset = np.load(os.path.join(fold1_dir, "fold1.npz")).items()[0][1]
 sound_len = fold1_dataset[0].shape[0]
 
 
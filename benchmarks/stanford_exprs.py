@@ -0,0 +1,48 @@
+"""Forward kinematics of the Stanford manipulator, in terms of functions
+c (cos) and s (sin) so that it can build a tensorflow graph or arrows"""
+
+
+def stanford_fwd(inputs, c, s):
+    phi1 = inputs[0]
+    phi2 = inputs[1]
+    phi4 = inputs[2]
+    phi5 = inputs[3]
+    phi6 = inputs[4]
+    d2 = inputs[5]
+    d3 = 2.0
+    h1 = 1.0
+    r11 = (-s(phi6)*(c(phi4)*s(phi1) + c(phi1)*c(phi2)*s(phi4))
+           - c(phi6)*(c(phi5)*(s(phi1)*s(phi4) - c(phi1)*c(phi2)*c(phi4))
+                      + c(phi1)*s(phi2)*s(phi5)))
+    r12 = (s(phi6)*(c(phi5)*(s(phi1)*s(phi4) - c(phi1)*c(phi2)*c(phi4))
+                    + c(phi1)*s(phi2)*s(phi5))
+           - c(phi6)*(c(phi4)*s(phi1) + c(phi1)*c(phi2)*s(phi4)))
+    r13 = (s(phi5)*(s(phi1)*s(phi4) - c(phi1)*c(phi2)*c(phi4))
+           - c(phi1)*c(phi5)*s(phi2))
+    r21 = (s(phi6)*(c(phi1)*c(phi4) - c(phi2)*s(phi1)*s(phi4))
+           + c(phi6)*(c(phi5)*(c(phi1)*s(phi4) + c(phi2)*c(phi4)*s(phi1))
+                      - s(phi1)*s(phi2)*s(phi5)))
+    r22 = (c(phi6)*(c(phi1)*c(phi4) - c(phi2)*s(phi1)*s(phi4))
+           - s(phi6)*(c(phi5)*(c(phi1)*s(phi4) + c(phi2)*c(phi4)*s(phi1))
+                      - s(phi1)*s(phi2)*s(phi5)))
+    r23 = (-s(phi5)*(c(phi1)*s(phi4) + c(phi2)*c(phi4)*s(phi1))
+           - c(phi5)*s(phi1)*s(phi2))
+    r31 = (c(phi6)*(c(phi2)*s(phi5) + c(phi4)*c(phi5)*s(phi2))
+           - s(phi2)*s(phi4)*s(phi6))
+    r32 = (-s(phi6)*(c(phi2)*s(phi5) + c(phi4)*c(phi5)*s(phi2))
+           - c(phi6)*s(phi2)*s(phi4))
+    r33 = c(phi2)*c(phi5) - c(phi4)*s(phi2)*s(phi5)
+    px = d2*s(phi1) - d3*c(phi1)*s(phi2)
+    py = -d2*c(phi1) - d3*s(phi1)*s(phi2)
+    pz = h1 + d3*c(phi2)
+    outputs = [px, py, pz]
+    outputs.extend([r11,
+                    r12,
+                    r13,
+                    r21,
+                    r22,
+                    r23,
+                    r31,
+                    r32,
+                    r33])
+    return outputs
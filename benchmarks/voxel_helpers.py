@@ -1,9 +1,11 @@
 """Helpers for Dealing with Voxels"""
 import numpy as np
+import hashlib
 import os
 import math
 from functools import reduce
 from wacacore.util.misc import batch_map
+from arrows.util.datasets import MappedDataset
 
 # Datasets
 
@@ -11,17 +13,19 @@
 def model_net_40(voxels_path=os.path.join(os.environ['DATADIR'],
                                           'ModelNet40',
                                           'alltrain32.npy')):
-    """Model net 40 scaled to betwee 0 and 1.0"""
-    voxel_grids = np.load(voxels_path) / 255.0
-    return voxel_grids
+    """Model net 40 scaled to betwee 0 and 1.0.
+    `voxels_path` may also be a glob of npy shards; the uint8 data is memory
+    mapped and rows are converted to floatX when indexed"""
+    return MappedDataset(voxels_path, scale=1 / 255.0)
 
 
 def model_net_40_exp(voxels_path=os.path.join(os.environ['DATADIR'],
                                           'ModelNet40',
                                           'alltrain32_exp.npy')):
-    """Model net 40 scaled to betwee 0 and 1.0"""
-    voxel_grids = np.load(voxels_path) / 255.0
-    return voxel_grids
+    """Model net 40 scaled to betwee 0 and 1.0.
+    `voxels_path` may also be a glob of npy shards; the uint8 data is memory
+    mapped and rows are converted to floatX when indexed"""
+    return MappedDataset(voxels_path, scale=1 / 255.0)
 
 
 def model_net_40_grads(voxels_path=os.path.join(os.environ['DATADIR'],
@@ -38,30 +42,90 @@ def model_net_40_gdotl(voxels_path=os.path.join(os.environ['DATADIR'],
     return np.load(voxels_path)['arr_0']
 
 
-def voxel_indices(voxels, limit, missing_magic_num=-1):
-    """
-    Convert voxel data_set (n, 32, 32, 32) to (n, 3, m)
-    """
+def voxel_indices_chunk(voxels, limit, missing_magic_num=-1):
+    """voxel_indices of a single chunk of voxel grids, in memory"""
+    voxels = np.asarray(voxels)
     n, x, y, z = voxels.shape
-    output = np.ones((n, 4, limit))
-    output = output * missing_magic_num
+    output = np.full((n, limit, 4), missing_magic_num, dtype='float64')
+
+    # Occupied voxels of every grid, in the order np.where finds them
+    flat_voxels = voxels.reshape(-1)
+    occupied = np.flatnonzero(flat_voxels != 0)
+    grid, flat = np.divmod(occupied, x * y * z)
+    # Position of each occupied voxel within its own grid
+    rank = np.arange(len(grid)) - np.searchsorted(grid, np.arange(n))[grid]
+    keep = rank < limit
+    if not keep.all():
+        occupied, grid = occupied[keep], grid[keep]
+        flat, rank = flat[keep], rank[keep]
+
+    coords = np.stack(np.unravel_index(np.arange(x * y * z), (x, y, z)),
+                      axis=1)
+    output[grid, rank, 0:3] = coords[flat]
+    output[grid, rank, 3] = flat_voxels[occupied]
+    return output
+
+
+def voxels_digest(voxels, chunk_size=1024):
+    """sha1 of the contents of `voxels`, read `chunk_size` grids at a time"""
+    digest = hashlib.sha1(str(voxels.dtype).encode())
+    for i in range(0, len(voxels), chunk_size):
+        digest.update(np.ascontiguousarray(voxels[i:i + chunk_size]).tobytes())
+    return digest.hexdigest()
 
-    # obtain occupied voxels
-    for v in range(len(voxels)):
-        voxel = voxels[v]
-        x_list, y_list, z_list = np.where(voxel)
-        assert len(x_list) == len(y_list)
-        assert len(y_list) == len(z_list)
 
-        # fill in output tensor
-        npoints = min(limit, len(x_list))
-        output[v][0][0:npoints] = x_list[0:npoints]
-        output[v][1][0:npoints] = y_list[0:npoints]
-        output[v][2][0:npoints] = z_list[0:npoints]
-        output[v][3][0:npoints] = voxel[x_list, y_list, z_list][0:npoints]
+def voxel_indices_cache_path(cache_dir, shape, limit, missing_magic_num,
+                             dataset_id):
+    """Cache file for voxel_indices of data set `dataset_id` of `shape`"""
+    n, x, y, z = shape
+    fname = "voxel_indices_%s_%sx%sx%s_n%s_limit%s_missing%s.npy" % (
+        dataset_id, x, y, z, n, limit, missing_magic_num)
+    return os.path.join(cache_dir, fname)
 
-    output = np.transpose(output, [0, 2, 1]) # switch limit and coords
 
+def voxel_indices(voxels, limit, missing_magic_num=-1, chunk_size=1024,
+                  processes=None, cache_dir=None, dataset_id=None):
+    """
+    Convert voxel data_set (n, 32, 32, 32) to (n, m, 4), where the last
+    dimension is the x, y, z index and value of the first `limit` = m
+    occupied voxels of each grid, padded with `missing_magic_num`
+    Args:
+        voxels: array or MappedDataset of voxel grids
+        limit: maximum number of occupied voxels per grid
+        chunk_size: number of grids converted at once
+        processes: If not None, convert chunks with a pool of this many
+            processes
+        cache_dir: If not None, load result from / save result to this
+            directory
+        dataset_id: Name identifying the contents of `voxels` in the cache.
+            If None, a hash of the contents is used, which reads all of
+            `voxels` even when the result is cached
+    """
+    n, x, y, z = voxels.shape
+    if cache_dir is not None:
+        if dataset_id is None:
+            dataset_id = voxels_digest(voxels, chunk_size)
+        cache_path = voxel_indices_cache_path(cache_dir, voxels.shape, limit,
+                                              missing_magic_num, dataset_id)
+        if os.path.exists(cache_path):
+            return np.load(cache_path)
+
+    ranges = [(i, min(i + chunk_size, n)) for i in range(0, n, chunk_size)]
+    if processes is None:
+        output = [voxel_indices_chunk(voxels[i:j], limit, missing_magic_num)
+                  for i, j in ranges]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(voxel_indices_chunk, voxels[i:j], limit,
+                                       missing_magic_num) for i, j in ranges]
+            output = [future.result() for future in futures]
+    output = np.concatenate(output) if len(output) > 0 else \
+        np.full((0, limit, 4), missing_magic_num, dtype='float64')
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(cache_path, output)
     return output
 
 
@@ -54,10 +54,8 @@
 def gen_fragcoords(width: int, height: int):
     """Create a (width * height * 2) matrix, where element i,j is [i,j]
        This is used to generate ray directions based on an increment"""
-    raster_space = np.zeros([width, height, 2], dtype=floatX())
-    for i in range(width):
-        for j in range(height):
-            raster_space[i, j] = np.array([i, j], dtype=floatX()) + 0.5
+    i, j = np.meshgrid(np.arange(width), np.arange(height), indexing='ij')
+    raster_space = np.stack([i, j], axis=2).astype(floatX()) + 0.5
     return raster_space
 
 
@@ -456,9 +454,9 @@ def train_test_model_net_40(test_hold_out=0.2, shuffle=True):
     # voxel_data = np.exp(-voxel_data)
     test_hold_out = int(test_hold_out * len(voxel_data))
     if shuffle:
-        np.random.shuffle(voxel_data)
-    test_voxel_data = voxel_data[0:test_hold_out]
-    train_voxel_data = voxel_data[test_hold_out:]
+        voxel_data = voxel_data.shuffled()
+    test_voxel_data = voxel_data.subset(slice(0, test_hold_out))
+    train_voxel_data = voxel_data.subset(slice(test_hold_out, None))
     return train_voxel_data, test_voxel_data
 
 
@@ -65,10 +65,8 @@ def rand_rotation_matrices(n: int, floatX='float32'):
 def gen_fragcoords(width: int, height: int):
     """Create a (width * height * 2) matrix, where element i,j is [i,j]
        This is used to generate ray directions based on an increment"""
-    raster_space = np.zeros([width, height, 2], dtype=floatX)
-    for i in range(width):
-        for j in range(height):
-            raster_space[i, j] = np.array([i, j], dtype=floatX) + 0.5
+    i, j = np.meshgrid(np.arange(width), np.arange(height), indexing='ij')
+    raster_space = np.stack([i, j], axis=2).astype(floatX) + 0.5
     return raster_space
 
 
@@ -4,11 +4,12 @@
     make_param_port, get_port_attr, set_port_shape)
 from arrows.std_arrows import *
 from arrows.apply.constants import CONST, VAR, is_constant
+from arrows.apply.shapes import is_polymorphic
+from arrows.primitive.array_arrows import shape_to_value
 from arrows.util.misc import extract
 from reverseflow.inv_primitives.inv_math_arrows import *
 from reverseflow.inv_primitives.inv_array_arrows import *
 from reverseflow.util.mapping import Bimap
-from reverseflow.util.misc import complement, complement_bool
 import numpy as np
 from typing import Set, Tuple, Dict, Sequence
 from copy import deepcopy
@@ -174,27 +175,30 @@ def inv_gather(arrow: GatherArrow, port_attr: PortAttributes) -> Tuple[Arrow, Po
     if is_constant(arrow.out_ports()[0], port_attr):
         return GatherArrow(), {0: 0, 1: 1, 2: 2}
     tensor_shape = port_attr[arrow.in_ports()[0]]['shape']
+    assert not is_polymorphic(tensor_shape), \
+        "Can't invert gather from tensor of unknown shape %s" % (tensor_shape,)
     if isinstance(tensor_shape, tuple):
         tensor_shape = list(tensor_shape)
-    index_list_value = port_attr[arrow.in_ports()[1]]['value']
-    index_list_compl = complement(index_list_value, tensor_shape)
+    # The complement of the indices is computed from them when executed
+    compl = ComplementIndicesArrow()
     std1 = SparseToDenseArrow()
     std2 = SparseToDenseArrow()
-    dupl1 = DuplArrow()
-    dupl2 = DuplArrow()
-    # FIXME: don't do this, complement could be huge
-    source_compl = SourceArrow(np.array(index_list_compl))
+    dupl0 = DuplArrow()
+    dupl1 = DuplArrow(n_duplications=3)
     source_tensor_shape = SourceArrow(np.array(tensor_shape))
     add = AddArrow()
     edges = Bimap()
-    edges.add(source_compl.out_ports()[0], std1.in_ports()[0])
+    edges.add(dupl0.out_ports()[0], std2.in_ports()[0])
+    edges.add(dupl0.out_ports()[1], compl.in_ports()[0])
+    edges.add(compl.out_ports()[0], std1.in_ports()[0])
     edges.add(source_tensor_shape.out_ports()[0], dupl1.in_ports()[0])
     edges.add(dupl1.out_ports()[0], std1.in_ports()[1])
     edges.add(dupl1.out_ports()[1], std2.in_ports()[1])
+    edges.add(dupl1.out_ports()[2], compl.in_ports()[1])
     edges.add(std1.out_ports()[0], add.in_ports()[0])
     edges.add(std2.out_ports()[0], add.in_ports()[1])
     # orig_out_port, params, inp_list
-    in_ports = [std2.in_ports()[2], std1.in_ports()[2], std2.in_ports()[0]]
+    in_ports = [std2.in_ports()[2], std1.in_ports()[2], dupl0.in_ports()[0]]
     out_ports = [add.out_ports()[0]]
     op = CompositeArrow(in_ports=in_ports,
                         out_ports=out_ports,
@@ -207,22 +211,29 @@ def inv_gather(arrow: GatherArrow, port_attr: PortAttributes) -> Tuple[Arrow, Po
 def inv_gathernd(arrow: GatherNdArrow, port_attr: PortAttributes) -> Tuple[Arrow, PortMap]:
     if is_constant(arrow.out_ports()[0], port_attr):
         return GatherNdArrow(), {0: 0, 1: 1, 2: 2}
+    assert not is_polymorphic(port_attr[arrow.in_ports()[0]]['shape']), \
+        "Can't invert gather_nd from tensor of unknown shape %s" % \
+        (port_attr[arrow.in_ports()[0]]['shape'],)
     tensor_shape = np.array(port_attr[arrow.in_ports()[0]]['shape'])
-    index_list_value = port_attr[arrow.in_ports()[1]]['value']
-    index_list_compl = complement_bool(index_list_value, tensor_shape)
-    # fixme: don't do this, complement could be huge
-    source_compl = SourceArrow(np.array(index_list_compl, dtype=np.float32))
+    # The complement of the indices is computed from them when executed
+    compl = ComplementMaskArrow()
     source_tensor_shape = SourceArrow(tensor_shape)
     snd = ScatterNdArrow()
     mul = MulArrow()
     add = AddArrow()
+    dupl0 = DuplArrow()
+    dupl1 = DuplArrow()
     edges = Bimap()
-    edges.add(source_tensor_shape.out_port(0), snd.in_port(2))
-    edges.add(source_compl.out_port(0), mul.in_port(1))
+    edges.add(source_tensor_shape.out_port(0), dupl1.in_port(0))
+    edges.add(dupl1.out_port(0), snd.in_port(2))
+    edges.add(dupl1.out_port(1), compl.in_port(1))
+    edges.add(dupl0.out_port(0), snd.in_port(0))
+    edges.add(dupl0.out_port(1), compl.in_port(0))
+    edges.add(compl.out_port(0), mul.in_port(1))
     edges.add(snd.out_port(0), add.in_port(0))
     edges.add(mul.out_port(0), add.in_port(1))
     # orig_out_port, params, inp_list
-    in_ports = [snd.in_port(1), mul.in_port(0), snd.in_port(0)]
+    in_ports = [snd.in_port(1), mul.in_port(0), dupl0.in_port(0)]
     out_ports = [add.out_port(0)]
     op = CompositeArrow(in_ports=in_ports,
                         out_ports=out_ports,
@@ -243,8 +254,27 @@ def inv_gathernd_elim(arrow: GatherNdArrow, port_attr: PortAttributes) -> Tuple[
 def dict_subset(keys, dict):
     return {key: dict[key] for key in keys}
 
-def inv_reshape(arrow: GatherArrow, port_values: PortAttributes) -> Tuple[Arrow, PortMap]:
-    import pdb; pdb.set_trace()
+def inv_reshape(arrow: ReshapeArrow,
+                port_attr: PortAttributes) -> Tuple[Arrow, PortMap]:
+    if is_constant(arrow.out_ports()[0], port_attr):
+        return ReshapeArrow(), {0: 0, 1: 1, 2: 2}
+    # Reshape back to the shape of the input, whose unknown (batch) dimension
+    # if any is inferred; the target shape is not needed
+    tensor_shape = port_attr[arrow.in_ports()[0]]['shape']
+    source_tensor_shape = SourceArrow(np.array(shape_to_value(tensor_shape)))
+    ignore = IgnoreInputArrow()
+    reshape = ReshapeArrow()
+    edges = Bimap()
+    edges.add(ignore.out_port(0), reshape.in_port(0))
+    edges.add(source_tensor_shape.out_port(0), reshape.in_port(1))
+    # orig_out_port, target shape
+    in_ports = [ignore.in_port(1), ignore.in_port(0)]
+    out_ports = [reshape.out_port(0)]
+    op = CompositeArrow(in_ports=in_ports,
+                        out_ports=out_ports,
+                        edges=edges,
+                        name="InvReshape")
+    return op, {0: 2, 1: 1, 2: 0}
 
 
 def inv_mul(arrow: MulArrow, port_values: PortAttributes) -> Tuple[Arrow, PortMap]:
@@ -307,12 +337,6 @@ def inv_broadcast(arrow: BroadcastArrow, port_attr: PortAttributes) -> Tuple[Arr
     return inv_arrow, port_map
 
 
-def inv_reshape(arrow: ReshapeArrow, port_attr: PortAttributes) -> Tuple[Arrow, PortMap]:
-    import pdb; pdb.set_trace()
-    sub_port_attr = extract(arrow.ports(), port_attr)
-
-
-
 def inv_sin(arrow: SinArrow, port_attr: PortAttributes) -> Tuple[Arrow, PortMap]:
     if is_constant(arrow.in_ports()[0], port_attr):
         return deepcopy(arrow), {0: 0, 1: 1}
@@ -1,10 +1,9 @@
 """Constructors for inverse arrows."""
 
-import tensorflow as tf
-
 from arrows.compositearrow import CompositeArrow
 from arrows.port_attributes import *
 from arrows.primitive.control_flow import IgnoreInputArrow
+from arrows.util.numpy_ops import gather_nd, constant
 
 
 def gathernd_bwd_pred(arr: "InvGatherNdArrow", port_attr: PortAttributes):
@@ -12,11 +11,9 @@ def gathernd_bwd_pred(arr: "InvGatherNdArrow", port_attr: PortAttributes):
 
 
 def gathernd_bwd_disp(arr: "InvGatherNdArrow", port_attr: PortAttributes):
-    inds = tf.constant(port_attr[arr.in_port(2)]['value'])
-    output = tf.constant(port_attr[arr.out_port(0)]['value'])
-    gather_nd = tf.gather_nd(output, inds)
-    with tf.Session() as sess:
-        return {arr.in_ports()[0]: {'value': sess.run(gather_nd)}}
+    inds = port_attr[arr.in_port(2)]['value']
+    output = port_attr[arr.out_port(0)]['value']
+    return {arr.in_ports()[0]: {'value': gather_nd(constant(output), inds)}}
 
 
 
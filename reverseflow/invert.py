@@ -1,14 +1,24 @@
 """Parametric Inversion"""
+import os
+import copy
+import pickle
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from arrows import Arrow, Port, InPort
 from arrows.compositearrow import CompositeArrow, is_projecting, is_receiving
 from arrows.compositearrow import CompositeArrow, would_project, would_receive
 from arrows.transform.eliminate_gather import eliminate_gathernd
+from arrows.transform.cse import eliminate_common_subexpressions
 from arrows.apply.constants import CONST, VAR, is_constant
 from arrows.std_arrows import *
 from arrows.port_attributes import *
 from arrows.apply.propagate import propagate
+from arrows.util.hash import structural_hash, canonical_order, local_key
+from arrows.util.io import save_pickle, load_pickle
+from arrows.util.lru import LRUCache
 from reverseflow.defaults import default_dispatch
-from typing import Dict, Callable, Set, Tuple, TypeVar, Any
+from typing import Dict, Callable, Set, Tuple, TypeVar, Any, Sequence
 from overloading import overload
 
 PortMap = Dict[int, int]
@@ -37,6 +47,48 @@ def invert_sub_arrow(comp_arrow: CompositeArrow,
     return inner_invert(comp_arrow, port_attr, dispatch)
 
 
+def invert_sub_arrow_task(sub_arrow: Arrow, port_attr, dispatch):
+    """Invert `sub_arrow` (e.g. in another thread or process)"""
+    return invert_sub_arrow(sub_arrow, port_attr, dispatch)
+
+
+def detached_copy(sub_arrow: Arrow, sub_port_attr: PortAttributes):
+    """Copies of `sub_arrow` without its parent and of `sub_port_attr` keyed
+    by the ports of the copy, so that pickling them (to send to another
+    process) does not pickle the whole arrow `sub_arrow` is in"""
+    # The copy of the parent is None, so copying stops there
+    memo = {id(sub_arrow.parent): None}
+    return copy.deepcopy((sub_arrow, sub_port_attr), memo)
+
+
+def invert_sub_arrows(sub_arrows: Sequence[Arrow],
+                      port_attr: PortAttributes,
+                      dispatch: Dict[Arrow, Callable],
+                      executor=None):
+    """Invert each of `sub_arrows`, concurrently if `executor` is given.
+    Args:
+        sub_arrows: Arrows to invert
+        executor: concurrent.futures.Executor (thread or process pool)
+    Returns:
+        List of (inverse, port_map), in the order of `sub_arrows`"""
+    if executor is None:
+        return [invert_sub_arrow(sub_arrow, port_attr, dispatch)
+                for sub_arrow in sub_arrows]
+    futures = []
+    for sub_arrow in sub_arrows:
+        # Each task gets its own port_attr, which it may add entries to
+        # without racing other tasks, holding only the ports it inverts
+        sub_port_attr = defaultdict(dict, ((port, port_attr[port])
+                                           for port in sub_arrow.all_ports()
+                                           if port in port_attr))
+        if isinstance(executor, ProcessPoolExecutor):
+            sub_arrow, sub_port_attr = detached_copy(sub_arrow, sub_port_attr)
+        futures.append(executor.submit(invert_sub_arrow_task, sub_arrow,
+                                       sub_port_attr, dispatch))
+    # Results are reassembled in order of sub_arrows, not of completion
+    return [future.result() for future in futures]
+
+
 def get_inv_port(port: Port,
                  arrow_to_port_map: [Arrow, PortMap],
                  arrow_to_inv: Dict[Arrow, Arrow]):
@@ -49,11 +101,14 @@ def get_inv_port(port: Port,
 
 def inner_invert(comp_arrow: CompositeArrow,
                  port_attr: PortAttributes,
-                 dispatch: Dict[Arrow, Callable]):
+                 dispatch: Dict[Arrow, Callable],
+                 executor=None):
     """Construct a parametric inverse of arrow
     Args:
         arrow: Arrow to invert
         dispatch: Dict mapping arrow class to invert function
+        executor: Executor to invert sub_arrows of `arrow` concurrently with,
+            composites within sub_arrows are inverted serially within a task
     Returns:
         A (approximate) parametric inverse of `arrow`
         The ith in_port of comp_arrow will be corresponding ith out_port
@@ -85,10 +140,12 @@ def inner_invert(comp_arrow: CompositeArrow,
     # invert each sub_arrow
     arrow_to_inv = dict()
     arrow_to_port_map = dict()
-    for sub_arrow in comp_arrow.get_sub_arrows():
-        inv_sub_arrow, port_map = invert_sub_arrow(sub_arrow,
-                                                   port_attr,
-                                                   dispatch)
+    # Order sub_arrows canonically so the inverse does not depend on set order
+    order = canonical_order(comp_arrow, {sub_arrow: local_key(sub_arrow)
+                                         for sub_arrow in comp_arrow.get_sub_arrows()})
+    sub_arrows = sorted(comp_arrow.get_sub_arrows(), key=order.get)
+    inverses = invert_sub_arrows(sub_arrows, port_attr, dispatch, executor)
+    for sub_arrow, (inv_sub_arrow, port_map) in zip(sub_arrows, inverses):
         assert sub_arrow is not None
         assert inv_sub_arrow.parent is None
         arrow_to_port_map[sub_arrow] = port_map
@@ -115,7 +172,11 @@ def inner_invert(comp_arrow: CompositeArrow,
         transform(inv_comp_arrow)
 
     # Craete new ports on inverse compositions for parametric and error ports
-    for sub_arrow in inv_comp_arrow.get_sub_arrows():
+    # in the order of the sub_arrows they are inverses of
+    inv_order = {inv: i for i, (inv, _) in enumerate(inverses)}
+    inv_sub_arrows = sorted(inv_comp_arrow.get_sub_arrows(),
+                            key=lambda a: inv_order.get(a, len(inv_order)))
+    for sub_arrow in inv_sub_arrows:
         for port in sub_arrow.ports():
             if is_param_port(port):
                 assert port not in inv_comp_arrow.edges.keys()
@@ -135,15 +196,92 @@ def inner_invert(comp_arrow: CompositeArrow,
     return inv_comp_arrow, comp_port_map
 
 
+# Inverses computed so far, keyed by `invert_key`, at most the 32 most
+# recently used as inverses of large arrows are large (see LRUCache.resize)
+INVERT_CACHE = LRUCache(32)
+
+
+def dispatch_key(dispatch: Dict[Arrow, Callable]) -> str:
+    """Stable key for a dispatch table"""
+    name = lambda x: "%s.%s" % (x.__module__, x.__qualname__)
+    return ",".join(sorted("%s:%s" % (name(cls), name(f))
+                           for cls, f in dispatch.items()))
+
+
+def invert_key(comp_arrow: CompositeArrow,
+               dispatch: Dict[Arrow, Callable]) -> str:
+    key = structural_hash(comp_arrow) + dispatch_key(dispatch)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def copy_inverse(inv_arrow: Arrow) -> Arrow:
+    """Copy of `inv_arrow` which shares no mutable state with it"""
+    if isinstance(inv_arrow, CompositeArrow):
+        # Unlike deepcopy this keeps names, which to_graph relies on
+        return inv_arrow.clone(suffix="")
+    try:
+        # Unlike deepcopy this keeps names, which to_graph relies on
+        return pickle.loads(pickle.dumps(inv_arrow))
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return copy.deepcopy(inv_arrow)
+
+
+def cached_invert(comp_arrow: CompositeArrow,
+                  dispatch: Dict[Arrow, Callable],
+                  incremental: bool,
+                  cache_dir: str=None,
+                  executor=None) -> Arrow:
+    """Invert `comp_arrow`, reusing the inverse of a structurally identical
+    arrow inverted previously, in memory or in `cache_dir`"""
+    key = invert_key(comp_arrow, dispatch)
+    path = None if cache_dir is None else os.path.join(cache_dir, key + ".pkl")
+    inv_arrow = INVERT_CACHE.get(key)
+    if inv_arrow is None and path is not None:
+        # A truncated or otherwise unreadable file is a cache miss
+        inv_arrow = load_pickle(path)
+    computed = inv_arrow is None
+    if computed:
+        port_attr = propagate(comp_arrow, incremental=incremental)
+        inv_arrow = inner_invert(comp_arrow, port_attr, dispatch, executor)[0]
+    INVERT_CACHE.put(key, inv_arrow)
+    if path is not None and (computed or not os.path.exists(path)):
+        try:
+            save_pickle(inv_arrow, path)
+        except (pickle.PicklingError, AttributeError, TypeError, OSError) as e:
+            print("WARNING: could not save inverse of %s: %s" %
+                  (comp_arrow.name, e))
+    return copy_inverse(inv_arrow)
+
+
+def clear_invert_cache() -> None:
+    INVERT_CACHE.clear()
+
+
 def invert(comp_arrow: CompositeArrow,
-           dispatch: Dict[Arrow, Callable]=default_dispatch) -> Arrow:
+           dispatch: Dict[Arrow, Callable]=default_dispatch,
+           incremental=False,
+           cache=False,
+           cache_dir: str=None,
+           executor=None,
+           cse=False) -> Arrow:
     """Construct a parametric inverse of comp_arrow
     Args:
         comp_arrow: Arrow to invert
         dispatch: Dict mapping comp_arrow class to invert function
+        incremental: Propagate with the worklist engine
+        cache: Reuse inverses of structurally identical arrows
+        cache_dir: Directory to also store cached inverses in, if cache
+        executor: concurrent.futures Executor to invert sub_arrows with
+        cse: First merge repeated subexpressions of comp_arrow (in place),
+            so that each is inverted once
     Returns:
         A (approximate) parametric inverse of `comp_arrow`"""
+    if cse:
+        eliminate_common_subexpressions(comp_arrow)
     # Replace multiedges with dupls and propagate
     comp_arrow.duplify()
-    port_attr = propagate(comp_arrow)
-    return inner_invert(comp_arrow, port_attr, dispatch)[0]
+    if cache:
+        return cached_invert(comp_arrow, dispatch, incremental, cache_dir,
+                             executor)
+    port_attr = propagate(comp_arrow, incremental=incremental)
+    return inner_invert(comp_arrow, port_attr, dispatch, executor)[0]
@@ -18,11 +18,15 @@
 
 
 def gen_input_tensors(arrow: Arrow,
-                      param_port_as_var=True):
+                      param_port_as_var=True,
+                      batch_size=None):
     """Generate tensors corresponding to in_ports
     Args:
         arrow: Arrow of interest
         param_port_as_var: Whether parametric ports should be tf.Variable
+        batch_size: Size of dimensions of unknown (None) size of variables.
+            Placeholders keep dimensions of unknown size, so that the graph
+            can be fed batches of any size
     """
     input_tensors = []
     state = propagate(arrow)
@@ -31,6 +35,9 @@ def gen_input_tensors(arrow: Arrow,
         dtype = get_port_dtype(in_port)
         if is_param_port(in_port) and param_port_as_var:
             name = "param_input_%s" % in_port.index
+            shape = tuple(batch_size if dim is None else dim for dim in shape)
+            assert None not in shape, ("Variable %s of unknown shape %s, "
+                                       "set batch_size" % (name, shape))
             var = tf.Variable(np.random.rand(*shape), name=name,
                               dtype=dtype)
             input_tensors.append(var)
@@ -243,6 +250,33 @@ def conv(a: GatherNdArrow, args: TensorVarList, state) -> Sequence[Tensor]:
 def conv(a: ScatterNdArrow, args: TensorVarList, state) -> Sequence[Tensor]:
     return [tf.scatter_nd(*args)]
 
+def complement_covered(indices: Tensor, shape: Tensor) -> Tensor:
+    """Number of times each element of `shape` is covered by `indices`"""
+    indices = tf.cast(indices, shape.dtype)
+    if indices.get_shape().ndims == 1:
+        indices = tf.expand_dims(indices, 1)
+    # Each index covers a slice of shape shape[index_depth:]
+    index_depth = tf.shape(indices)[-1]
+    updates_shape = tf.concat([tf.cast(tf.shape(indices)[:-1], shape.dtype),
+                               shape[index_depth:]], 0)
+    return tf.scatter_nd(indices, tf.ones(updates_shape, dtype=tf.int32), shape)
+
+
+@overload
+def conv(a: ComplementMaskArrow, args: TensorVarList,
+         state) -> Sequence[Tensor]:
+    covered = complement_covered(*args)
+    return [tf.cast(tf.equal(covered, 0), floatX())]
+
+
+@overload
+def conv(a: ComplementIndicesArrow, args: TensorVarList,
+         state) -> Sequence[Tensor]:
+    indices, shape = args
+    covered = complement_covered(indices, shape)
+    return [tf.cast(tf.where(tf.equal(covered, 0)), shape.dtype)]
+
+
 @overload
 def conv(a: SparseToDenseArrow, args: TensorVarList, state) -> Sequence[Tensor]:
     return [tf.sparse_to_dense(*args, validate_indices=False)]
@@ -278,6 +312,10 @@ def conv(a: TfLambdaArrow, args: TensorVarList, state) -> Sequence[Tensor]:
 def conv(a: StackArrow, args: TensorVarList, state) -> Sequence[Tensor]:
     return [tf.stack(args, axis=a.axis)]
 
+@overload
+def conv(a: ConcatArrow, args: TensorVarList, state) -> Sequence[Tensor]:
+    return [tf.concat(args, axis=a.axis)]
+
 @overload
 def conv(a: TransposeArrow, args: TensorVarList, state) -> Sequence[Tensor]:
     inp = args[0]
@@ -290,20 +328,19 @@ def conv(a: IgnoreInputArrow, args: TensorVarList, state) -> Sequence[Tensor]:
     inp = args[1]
     return [inp]
 
-@overload
-def conv(a: CompositeArrow, args: TensorVarList, state) -> Sequence[Tensor]:
-    assert len(args) == a.num_in_ports()
-    with tf.name_scope(a.name):
-        # import pdb; pdb.set_trace()
-        # FIXME: A horrible horrible hack
-        port_grab = state['port_grab']
-        return interpret(conv, a, args, state, port_grab)
-
 
 def arrow_to_graph(comp_arrow: CompositeArrow,
                    input_tensors: Sequence[Tensor],
-                   port_grab: Dict[Port, Any]={}): #FIXME DANGERIOUS {}
+                   port_grab: Dict[Port, Any]={}, #FIXME DANGERIOUS {}
+                   profile=None):
+    """Construct the graph of comp_arrow applied to input_tensors.
+    If profile is an ExecutionProfile the ops of each sub arrow are put in a
+    name scope of that arrow, and their construction is timed"""
     input_tensors_wrapped = list(map(tf.identity, input_tensors))
     port_attr = propagate(comp_arrow)
     state = {'port_attr': port_attr}
+    if profile is not None:
+        profile.scope = tf.name_scope if profile.scope is None else profile.scope
+        profile.root = comp_arrow if profile.root is None else profile.root
+        state['exec_profile'] = profile
     return interpret(conv, comp_arrow, input_tensors_wrapped, state, port_grab)
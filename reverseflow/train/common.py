@@ -2,12 +2,15 @@
 from arrows.port_attributes import is_param_port, is_error_port
 from arrows.std_arrows import *
 from arrows.config import floatX
+from arrows.util.generators import LockedGenerator, merge_feeds, prefetch_feeds
 from reverseflow.to_arrow import graph_to_arrow
 from reverseflow.to_graph import arrow_to_graph, gen_input_tensors
-from typing import List, Generator, Callable
+from typing import List, Generator, Callable, Sequence
+import numpy as np
 import tensorflow as tf
 from tensorflow import Graph, Tensor, Session
 import os
+import time
 
 from wacacore.util.io import mk_dir
 
@@ -115,6 +118,14 @@ def prep_save(sess: Session, save: bool, dirname: str, params_file: str, load: b
     return save_params
 
 
+def gen_session(intra_op_threads=0, inter_op_threads=0, **kwargs) -> Session:
+    """Session limited to the given numbers of threads, 0 lets tensorflow
+    choose"""
+    config = tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                            inter_op_parallelism_threads=inter_op_threads)
+    return tf.Session(config=config)
+
+
 def gen_fetch(sess: Session,
               debug=False,
               **kwargs):
@@ -146,6 +157,7 @@ def train_loop(sess: Session,
                test_every=100,
                num_iterations=100000,
                callbacks=[],
+               prefetch=0,
                **kwargs):
     """Perform training
     Args:
@@ -159,6 +171,7 @@ def train_loop(sess: Session,
         test_every: evaluate test data set test_every iterations
         num_iterations: number of iterations
         callbacks: functions to be called with result from fetch
+        prefetch: prepare this many feed dicts ahead in a background thread
     """
     # Default 1 for loss_ratios and normalize
     loss_ratios = [1 for i in range(len(loss_updates))] if loss_ratios is None else loss_ratios
@@ -170,31 +183,50 @@ def train_loop(sess: Session,
     callback_dict.update({'sess': sess})
     state = {}
 
-    # Main loop
-    for i in range(num_iterations):
-        # Generate input
-        curr_fetch = {}
-        curr_fetch.update(fetch)
-        curr_fetch["update_loss"] = np.random.choice(loss_updates, p=loss_ratios)
-        feed_dict = {}
-        for gen in generators:
-            sub_feed_dict = next(gen)
-            feed_dict.update(sub_feed_dict)
-        # Optimizeation Step
-        fetch_res = sess.run(curr_fetch, feed_dict=feed_dict)
-
-        # Evaluate on test data every test_every iterations
-        if i % test_every == 0 or i == num_iterations - 1:
-            test_feed_dict = {}
-            for gen in test_generators:
-                sub_feed_dict = next(gen)
-                test_feed_dict.update(sub_feed_dict)
-            test_feed_dict = {k: v for k, v in test_feed_dict.items() if k != "update_step"}
-            test_fetch_res = sess.run(fetch, feed_dict=test_feed_dict)
-            fetch_res['test_fetch_res'] = test_fetch_res
-            print("Test Loss", test_fetch_res['loss'])
-
-        # Do all call backs
-        for cb in callbacks:
-            cb(fetch_res, feed_dict, i, num_iterations=num_iterations, state=state, **callback_dict)
-        print("Iteration: ", i, " Loss: ", fetch_res['loss'])
+    prefetcher = None
+    if prefetch > 0:
+        # Generators shared between train and test are also advanced by the
+        # prefetching thread, so must be locked
+        locked = {id(gen): LockedGenerator(gen) for gen in generators}
+        test_generators = [locked.get(id(gen), gen) for gen in test_generators]
+        prefetcher = prefetch_feeds([locked[id(gen)] for gen in generators],
+                                    size=prefetch)
+        feeds = prefetcher
+    else:
+        feeds = merge_feeds(generators)
+
+    try:
+        # Main loop
+        start = time.time()
+        for i in range(num_iterations):
+            # Generate input
+            curr_fetch = {}
+            curr_fetch.update(fetch)
+            curr_fetch["update_loss"] = np.random.choice(loss_updates,
+                                                         p=loss_ratios)
+            feed_dict = next(feeds)
+            # Optimizeation Step
+            fetch_res = sess.run(curr_fetch, feed_dict=feed_dict)
+
+            # Evaluate on test data every test_every iterations
+            if i % test_every == 0 or i == num_iterations - 1:
+                test_feed_dict = {}
+                for gen in test_generators:
+                    sub_feed_dict = next(gen)
+                    test_feed_dict.update(sub_feed_dict)
+                test_feed_dict = {k: v for k, v in test_feed_dict.items()
+                                  if k != "update_step"}
+                test_fetch_res = sess.run(fetch, feed_dict=test_feed_dict)
+                fetch_res['test_fetch_res'] = test_fetch_res
+                print("Test Loss", test_fetch_res['loss'])
+                print("Steps/sec: ", (i + 1) / (time.time() - start))
+
+            # Do all call backs
+            for cb in callbacks:
+                cb(fetch_res, feed_dict, i, num_iterations=num_iterations,
+                   state=state, **callback_dict)
+            print("Iteration: ", i, " Loss: ", fetch_res['loss'])
+    finally:
+        # Also stop prefetching if sess.run or a callback raises
+        if prefetcher is not None:
+            prefetcher.close()
@@ -127,7 +127,9 @@ def reparam_train(arrow: Arrow,
 
     param_feed_gens = []
     for t in tensors['param']:
-        shape = tuple(t.get_shape().as_list())
+        # Dimensions of unknown size are the batch dimension
+        shape = tuple(options['batch_size'] if dim is None else dim
+                      for dim in t.get_shape().as_list())
         gen = infinite_samples(np.random.rand, options['batch_size'], shape)
         param_feed_gens.append(attach(t, gen))
     train_gen_gens += param_feed_gens
@@ -174,7 +176,7 @@ def reparam_train(arrow: Arrow,
     loss_dict['sound_loss'] = sound_loss
     loss_dict['general_loss'] = losses[0]
 
-    sess = tf.Session()
+    sess = gen_session(**options)
     fetch = gen_fetch(sess, **options)
     fetch['input_tensors'] = tensors['input']
     fetch['param_tensors'] = tensors['param']
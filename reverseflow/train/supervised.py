@@ -3,8 +3,8 @@
 from arrows.arrow import Arrow
 from arrows.compositearrow import CompositeArrow
 from arrows.port_attributes import has_port_label, is_in_port, is_param_port
-from arrows.util.generators import infinite_batches
-from reverseflow.train.common import extract_tensors, gen_fetch
+from arrows.util.generators import infinite_batches, prefetch_feeds
+from reverseflow.train.common import extract_tensors, gen_fetch, gen_session
 from reverseflow.train.common import accumulate_losses, gen_update_step
 from arrows.util.misc import print_one_per_line
 from wacacore.train.common import train_load_save
@@ -55,7 +55,11 @@ def supervised_train(arrow: Arrow,
 
     train_feed_gens = [okok(options['batch_size'], train_input_data, train_output_data,
                             tensors['input'], tensors['train_output'])]
-
+    prefetcher = None
+    if options.get('prefetch', 0) > 0:
+        # Prepare training batches in the background while sess.run works
+        prefetcher = prefetch_feeds(train_feed_gens, options['prefetch'])
+        train_feed_gens = [prefetcher]
     test_feed_gens = [okok(options['batch_size'], test_input_data, test_output_data,
                           tensors['input'], tensors['train_output'])]
 
@@ -73,20 +77,24 @@ def supervised_train(arrow: Arrow,
     loss_updates = [gen_update_step(loss) for loss in losses]
     loss_ratios = [1]
 
-    sess = tf.Session()
+    sess = gen_session(**options)
     fetch = gen_fetch(sess, **options)
     fetch['input_tensors'] = tensors['input']
     fetch['output_tensors'] = tensors['output']
     fetch['loss'] = loss_dict
 
-    train_load_save(sess,
-                    loss_updates,
-                    fetch,
-                    train_feed_gens,
-                    test_feed_gens,
-                    loss_ratios=loss_ratios,
-                    callbacks=callbacks,
-                    **options)
+    try:
+        train_load_save(sess,
+                        loss_updates,
+                        fetch,
+                        train_feed_gens,
+                        test_feed_gens,
+                        loss_ratios=loss_ratios,
+                        callbacks=callbacks,
+                        **options)
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
 
 # One issue is that the input and output generators should not be completely
 # independent
@@ -12,7 +12,8 @@
 in the forward direction.
 """
 from collections import defaultdict
-from typing import (TypeVar, Generic, Tuple, Set, Dict, ItemsView,
+import numpy as np
+from typing import (TypeVar, Generic, Tuple, Set, Dict, List, ItemsView,
                     ValuesView, KeysView)
 
 # TODO:
@@ -102,6 +103,11 @@ def add(self, left: L, right: R) -> None:
     def remove(self, left: L, right: R) -> None:
         self.left_to_right[left].remove(right)
         self.right_to_left[right].remove(left)
+        # So that keys, values and `in` only hold elements still related
+        if len(self.left_to_right[left]) == 0:
+            del self.left_to_right[left]
+        if len(self.right_to_left[right]) == 0:
+            del self.right_to_left[right]
 
     def items(self):
         def items_gen():
@@ -114,7 +120,7 @@ def keys(self):
         return self.left_to_right.keys()
 
     def values(self) -> ValuesView[R]:
-        return self.left_to_right.keys()
+        return self.right_to_left.keys()
 
     def __getitem__(self, key: L) -> R:
         return self.fwd(key)
@@ -132,6 +138,198 @@ def __repr__(self) -> str:
         return str(self)
 
 
+class ArrayRelation(Generic[L, R]):
+    """Many to Many relation with the same interface as Relation.
+    Elements are interned to integer ids and edges stored as numpy arrays of
+    ids with CSR (compressed sparse row) forward and inverse adjacency.  Ports
+    are interned through their arrow, which needs one dict entry per arrow
+    rather than per port, and lookups avoid Port.__hash__.  Edges
+    added since the adjacency was last built are kept in small lists and
+    merged in once they are a sizeable fraction of the relation."""
+
+    def __init__(self, rebuild_frac: float=0.25):
+        self.rebuild_frac = rebuild_frac
+        self.elems = []  # type: List  # id -> element
+        self.ids = {}  # type: Dict  # element (not a port) -> id
+        self.bases = {}  # type: Dict  # arrow -> id of its first port
+        self.n_removed = 0
+        # Built edges, and CSR adjacency: the edges from left id i are
+        # fwd_edges[fwd_ptr[i]:fwd_ptr[i+1]], their right ids fwd_neighs[..]
+        self.lefts = np.zeros(0, dtype=np.int32)
+        self.rights = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.fwd_ptr = np.zeros(1, dtype=np.int32)
+        self.fwd_edges = np.zeros(0, dtype=np.int32)
+        self.fwd_neighs = np.zeros(0, dtype=np.int32)
+        self.inv_ptr = np.zeros(1, dtype=np.int32)
+        self.inv_edges = np.zeros(0, dtype=np.int32)
+        self.inv_neighs = np.zeros(0, dtype=np.int32)
+        # Edges added since, edge len(lefts) + k is
+        # (new_lefts[k], new_rights[k])
+        self.new_lefts = []  # type: List[int]
+        self.new_rights = []  # type: List[int]
+        self.new_alive = []  # type: List[bool]
+        self.new_fwd = {}  # type: Dict[int, List[int]]
+        self.new_inv = {}  # type: Dict[int, List[int]]
+
+    def id_of(self, elem, create=False):
+        """Integer id of `elem`, or None if elem is not in the relation"""
+        arrow = getattr(elem, 'arrow', None)
+        if arrow is not None:
+            # elem is a Port, ports of an arrow get consecutive ids
+            base = self.bases.get(arrow)
+            if base is None and create:
+                base = self.bases[arrow] = len(self.elems)
+                self.elems.extend(arrow.ports())
+            if base is not None and base + elem.index < len(self.elems):
+                port = self.elems[base + elem.index]
+                if port.arrow is arrow and port.index == elem.index:
+                    return base + elem.index
+            # Otherwise the port was added after its arrow was interned
+        i = self.ids.get(elem)
+        if i is None and create:
+            i = self.ids[elem] = len(self.elems)
+            self.elems.append(elem)
+        return i
+
+    def build(self) -> None:
+        """Compact away removed edges and rebuild the CSR adjacency"""
+        lefts = np.concatenate([self.lefts,
+                                np.array(self.new_lefts, dtype=np.int32)])
+        rights = np.concatenate([self.rights,
+                                 np.array(self.new_rights, dtype=np.int32)])
+        alive = np.concatenate([self.alive,
+                                np.array(self.new_alive, dtype=bool)])
+        self.lefts, self.rights = lefts[alive], rights[alive]
+        self.alive = np.ones(len(self.lefts), dtype=bool)
+        n_ids = len(self.elems)
+        for ids, neighs, direction in ((self.lefts, self.rights, 'fwd'),
+                                       (self.rights, self.lefts, 'inv')):
+            counts = np.bincount(ids, minlength=n_ids)
+            ptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+            # Stable so that each row is in insertion order
+            edges = np.argsort(ids, kind='stable').astype(np.int32)
+            setattr(self, direction + '_ptr', ptr)
+            setattr(self, direction + '_edges', edges)
+            setattr(self, direction + '_neighs', neighs[edges])
+        self.n_removed = 0
+        self.new_lefts, self.new_rights, self.new_alive = [], [], []
+        self.new_fwd, self.new_inv = {}, {}
+
+    def neigh_ids(self, i: int, ptr, edges, neighs, new, other, new_other):
+        """Ids related to id `i` given the adjacency in one direction"""
+        n_built = len(self.lefts)
+        if self.n_removed == 0:
+            row = neighs[ptr[i]:ptr[i + 1]].tolist() if i < len(ptr) - 1 else []
+            if i in new:
+                row += [new_other[e - n_built] for e in new[i]]
+            return row
+        row = edges[ptr[i]:ptr[i + 1]].tolist() if i < len(ptr) - 1 else []
+        row += new.get(i, [])
+        return [other[e] if e < n_built else new_other[e - n_built]
+                for e in row if self.is_alive(e)]
+
+    def fwd_ids(self, left: L) -> List[int]:
+        i = self.id_of(left)
+        if i is None:
+            return []
+        return self.neigh_ids(i, self.fwd_ptr, self.fwd_edges, self.fwd_neighs,
+                              self.new_fwd, self.rights, self.new_rights)
+
+    def inv_ids(self, right: R) -> List[int]:
+        i = self.id_of(right)
+        if i is None:
+            return []
+        return self.neigh_ids(i, self.inv_ptr, self.inv_edges, self.inv_neighs,
+                              self.new_inv, self.lefts, self.new_lefts)
+
+    def is_alive(self, e: int) -> bool:
+        n_built = len(self.lefts)
+        return self.alive[e] if e < n_built else self.new_alive[e - n_built]
+
+    def fwd(self, left: L) -> R:
+        return [self.elems[i] for i in self.fwd_ids(left)]
+
+    def inv(self, right: R) -> L:
+        return [self.elems[i] for i in self.inv_ids(right)]
+
+    def add(self, left: L, right: R) -> None:
+        l, r = self.id_of(left, create=True), self.id_of(right, create=True)
+        e = len(self.lefts) + len(self.new_lefts)
+        self.new_lefts.append(l)
+        self.new_rights.append(r)
+        self.new_alive.append(True)
+        self.new_fwd.setdefault(l, []).append(e)
+        self.new_inv.setdefault(r, []).append(e)
+        if len(self.new_lefts) > 64 + self.rebuild_frac * len(self.lefts):
+            self.build()
+
+    def remove(self, left: L, right: R) -> None:
+        l, r = self.id_of(left), self.id_of(right)
+        n_built = len(self.lefts)
+        row = []
+        if l is not None:
+            ptr = self.fwd_ptr
+            if l < len(ptr) - 1:
+                row = self.fwd_edges[ptr[l]:ptr[l + 1]].tolist()
+            row += self.new_fwd.get(l, [])
+        for e in row:
+            right_id = (self.rights[e] if e < n_built
+                        else self.new_rights[e - n_built])
+            if right_id == r and self.is_alive(e):
+                if e < n_built:
+                    self.alive[e] = False
+                else:
+                    self.new_alive[e - n_built] = False
+                self.n_removed += 1
+                return
+        raise ValueError("%s -> %s not in relation" % (left, right))
+
+    def is_dirty(self) -> bool:
+        """Have edges been added or removed since the last build"""
+        return len(self.new_lefts) > 0 or self.n_removed > 0
+
+    def items(self):
+        if self.is_dirty():
+            self.build()
+        lefts = self.lefts[self.fwd_edges].tolist()
+        rights = self.rights[self.fwd_edges].tolist()
+        def items_gen():
+            for l, r in zip(lefts, rights):
+                yield (self.elems[l], self.elems[r])
+        return items_gen()
+
+    def keys(self):
+        if self.is_dirty():
+            self.build()
+        return dict.fromkeys(self.elems[i]
+                             for i in np.unique(self.lefts)).keys()
+
+    def values(self):
+        if self.is_dirty():
+            self.build()
+        return dict.fromkeys(self.elems[i]
+                             for i in np.unique(self.rights)).keys()
+
+    def __getitem__(self, key: L) -> R:
+        return self.fwd(key)
+
+    def __setitem__(self, key: L, value: R):
+        return self.add(key, value)
+
+    def __contains__(self, key: L) -> bool:
+        return len(self.fwd_ids(key)) > 0
+
+    def __len__(self) -> int:
+        return len(self.lefts) + len(self.new_lefts) - self.n_removed
+
+    def __str__(self) -> str:
+        return str(list(self.items()))
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
 class OneToMany(Generic[L, R]):
     """One to many relations
     Returns a set of values"""
@@ -27,36 +27,78 @@ def same(xs) -> bool:
     return True
 
 
+def index_rows(indices: np.ndarray) -> np.ndarray:
+    """Indices as in tf.gather_nd as a (n, index depth) array, where 1-D
+    indices index the first axis"""
+    indices = np.asarray(indices, dtype=np.int64)
+    if indices.ndim < 2:
+        indices = indices.reshape(-1, 1)
+    return indices.reshape(-1, indices.shape[-1])
+
+
+def flat_indices(indices: np.ndarray, shape: Sequence) -> np.ndarray:
+    """Position of each index of `indices` in the flattened shape[:depth],
+    where depth is the length of the index tuples"""
+    indices = index_rows(indices)
+    shape = tuple(np.atleast_1d(shape))
+    return np.ravel_multi_index(tuple(indices.T), shape[:indices.shape[1]])
+
+
 def complement(indices: Sequence, shape: Sequence) -> Sequence:
-    bools = np.zeros(shape)
-    output = []
-    for index in indices:
-        bools[tuple(index)] = 1
-    for index, value in np.ndenumerate(bools):
-        if value == 0:
-            output.append(index)
-    return np.squeeze(np.array(output))
+    """Indices of elements of shape not in `indices`, squeezed"""
+    return np.squeeze(complement_indices(indices, shape))
 
 
 def complement_bool(indices: np.ndarray, shape: Sequence) -> Sequence:
-    if len(indices.shape) > 2:
-        indices = indices.reshape(-1, indices.shape[-1])
-    bools = np.ones(shape, dtype=np.dtype(bool))
-    for index in indices:
-        bools[tuple(index)] = 0
-    return bools
-
-
-def complement_bool_list(indices: np.ndarray, shape: Sequence) -> Sequence:
-    """Also returns list of indices of unique indices"""
-    bools = np.ones(shape, dtype=np.dtype(bool))
-    unique = []
-    for i in np.ndindex(indices.shape[:-1]):
-        index = tuple(indices[i])
-        if bools[index] == 1:
-            unique.append(i)
-        bools[index] = 0
-    return bools, np.array(unique)
+    """Boolean array of shape `shape` which is False at `indices`"""
+    return complement_mask(indices, shape)
+
+
+def complement_bool_list(indices: np.ndarray,
+                         shape: Sequence,
+                         sparse=False) -> Sequence:
+    """Also returns list of indices of unique indices
+    Args:
+        indices: (..., index depth) indices into shape
+        shape: Shape indexed into
+        sparse: Instead of the boolean complement of shape return the sorted
+            flat positions (see `flat_indices`) which `indices` cover, which
+            takes space proportional to `indices` rather than to `shape`
+    Returns:
+        Complement (or covered positions if sparse), and positions in
+        indices.shape[:-1] of the first occurrence of every distinct index"""
+    indices = np.asarray(indices)
+    covered, first = np.unique(flat_indices(indices, shape), return_index=True)
+    first.sort()
+    unique = np.transpose(np.unravel_index(first, indices.shape[:-1]))
+    if sparse:
+        return covered, unique
+    return complement_mask(indices, shape), unique
+
+
+def complement_mask(indices: np.ndarray, shape: Sequence) -> np.ndarray:
+    """Boolean mask of shape `shape` which is False at `indices`.
+    indices are as in tf.gather_nd (index tuples along the last axis), a
+    tuple shorter than shape covers a slice, 1-D indices index the first axis"""
+    indices = index_rows(indices)
+    mask = np.ones(tuple(np.atleast_1d(shape)), dtype=np.dtype(bool))
+    mask[tuple(indices.T)] = False
+    return mask
+
+
+def complement_indices(indices: np.ndarray, shape: Sequence) -> np.ndarray:
+    """(m, len(shape)) indices of elements of shape not covered by `indices`"""
+    return np.argwhere(complement_mask(indices, shape))
+
+
+def num_complement(indices: np.ndarray, shape: Sequence) -> int:
+    """Number of elements of shape not covered by `indices`, without
+    constructing the complement"""
+    shape = tuple(np.atleast_1d(shape))
+    indices = index_rows(indices)
+    n_covered = len(np.unique(flat_indices(indices, shape))) * \
+        int(np.prod(shape[indices.shape[1]:]))
+    return int(np.prod(shape)) - n_covered
 
 
 def indices_to_bool(indices: np.ndarray, shape: Sequence) -> Sequence:
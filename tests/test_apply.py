@@ -2,7 +2,9 @@
 from totality_test import totality_test
 from reverseflow.invert import invert
 from arrows import Arrow
-from arrows.apply.apply import apply, apply_backwards, from_input_list
+from arrows.apply.apply import (apply, apply_backwards, apply_backwards_batch,
+    from_input_list, compile_arrow)
+from arrows.apply.apply_numpy import apply_numpy
 from arrows.port_attributes import is_error_port
 from arrows.util.viz import show_tensorboard
 import numpy as np
@@ -15,6 +17,45 @@ def test_apply():
     all_test_arrows = [gen() for gen in all_test_arrow_gens]
     totality_test(apply, all_test_arrows, input_gen, test_name="apply")
 
+def same_compiled(arrow: Arrow, inputs):
+    compiled = compile_arrow(arrow)
+    assert compiled is compile_arrow(arrow)
+    for outputs in compiled.map([inputs, inputs]):
+        assert np.allclose(outputs, apply(arrow, inputs))
+
+def test_compile_arrow():
+    all_test_arrows = [gen() for gen in all_test_arrow_gens]
+    totality_test(same_compiled, all_test_arrows, input_gen,
+                  test_name="compile_arrow")
+
+def test_compile_arrow_collected():
+    import gc
+    import weakref
+    arrow = test_twoxyplusx()
+    compiled = weakref.ref(compile_arrow(arrow))
+    del arrow
+    gc.collect()
+    assert compiled() is None
+
+def test_compile_arrow_modified():
+    from arrows.port_attributes import set_port_shape
+    arrow = test_twoxyplusx()
+    compiled = compile_arrow(arrow)
+    compiled([np.ones(1), np.ones(1)])
+    hash = compiled.hash
+    set_port_shape(arrow.in_port(0), (1,))
+    compiled([np.ones(1), np.ones(1)])
+    assert compiled.hash != hash
+
+def same_numpy(arrow: Arrow, inputs):
+    assert np.allclose(apply_numpy(arrow, inputs), apply(arrow, inputs),
+                       atol=1e-5)
+
+def test_apply_numpy():
+    all_test_arrows = [gen() for gen in all_test_arrow_gens]
+    totality_test(same_numpy, all_test_arrows, input_gen,
+                  test_name="apply_numpy")
+
 def test_apply_backwards():
     orig = test_twoxyplusx()
     arrow = invert(orig)
@@ -24,9 +65,23 @@ def test_apply_backwards():
 def test_batch_apply_backwards():
     orig = test_twoxyplusx()
     inv = invert(orig)
-    inputs = [[np.random.randn(2, 2) for in_port in orig.in_ports()] for i in range(10)]
+    inputs = [[np.random.randn(2, 2) for in_port in orig.in_ports()]
+              for i in range(10)]
     return orig, inv, from_input_list(orig, inv, inputs)
 
+def test_apply_backwards_batch():
+    orig = test_twoxyplusx()
+    inv = invert(orig)
+    inputs = [[np.random.randn(2, 2) for in_port in orig.in_ports()]
+              for i in range(10)]
+    stacked = [np.stack([inp[i] for inp in inputs])
+               for i in range(len(inputs[0]))]
+    batch_vals = apply_backwards_batch(inv, stacked)
+    for j, inp in enumerate(inputs):
+        vals = apply_backwards(inv, inp)
+        for port, val in vals.items():
+            assert np.allclose(batch_vals[port][j], val)
+
 if __name__ == '__main__':
     orig, inv, the_list = test_batch_apply_backwards()
     for i in range(len(the_list)):
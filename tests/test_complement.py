@@ -1,7 +1,9 @@
 import operator
 from functools import reduce
 
-from reverseflow.util.misc import complement
+import numpy as np
+
+from reverseflow.util.misc import complement, complement_bool_list
 
 def test_complement():
     shape = (3, 3, 3)
@@ -10,6 +12,19 @@ def test_complement():
     assert len(indices) + len(output) == reduce(operator.mul, list(shape), 1)
     return shape, indices, output
 
+def test_complement_bool_list():
+    shape = (2, 3, 3)
+    indices = np.array([[[1, 2, 0], [0, 0, 0], [1, 2, 0]],
+                        [[0, 0, 0], [1, 1, 1], [0, 2, 1]]])
+    bools, unique = complement_bool_list(indices, shape)
+    assert bools.sum() == 18 - 4
+    assert not bools[1, 2, 0] and bools[1, 2, 1]
+    # First occurrence of each distinct index, in order
+    assert np.array_equal(unique, [[0, 0], [0, 1], [1, 1], [1, 2]])
+    covered, sparse_unique = complement_bool_list(indices, shape, sparse=True)
+    assert np.array_equal(np.sort(np.flatnonzero(~bools)), covered)
+    assert np.array_equal(unique, sparse_unique)
+
 if __name__ == '__main__':
     shape, indices, output = test_complement()
     print("Shape: {}".format(shape))
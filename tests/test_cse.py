@@ -0,0 +1,51 @@
+import numpy as np
+
+from arrows.apply.apply_numpy import apply_numpy
+from arrows.compositearrow import CompositeArrow
+from arrows.port_attributes import make_in_port, make_out_port, set_port_shape
+from arrows.std_arrows import AddArrow, MulArrow, SinArrow, SourceArrow
+from arrows.transform.cse import eliminate_common_subexpressions
+from reverseflow.invert import invert
+from test_arrows import all_test_arrow_gens
+from totality_test import totality_test
+
+
+def sinxy_plus_sinx() -> CompositeArrow:
+    """sin(x) * y + sin(x) * 2 with each sin(x) computed separately"""
+    arrow = CompositeArrow(name="sinxy_plus_sinx")
+    x, y = arrow.add_port(), arrow.add_port()
+    out = arrow.add_port()
+    for port in (x, y):
+        make_in_port(port)
+        set_port_shape(port, ())
+    make_out_port(out)
+    sin1, sin2, add = SinArrow(), SinArrow(), AddArrow()
+    mul1, mul2 = MulArrow(), MulArrow()
+    arrow.add_edge(x, sin1.in_port(0))
+    arrow.add_edge(x, sin2.in_port(0))
+    arrow.add_edge(sin1.out_port(0), mul1.in_port(0))
+    arrow.add_edge(y, mul1.in_port(1))
+    arrow.add_edge(sin2.out_port(0), mul2.in_port(0))
+    arrow.add_edge(SourceArrow(2.0).out_port(0), mul2.in_port(1))
+    arrow.add_edge(mul1.out_port(0), add.in_port(0))
+    arrow.add_edge(mul2.out_port(0), add.in_port(1))
+    arrow.add_edge(add.out_port(0), out)
+    return arrow
+
+
+def test_cse():
+    arrow = eliminate_common_subexpressions(sinxy_plus_sinx())
+    assert arrow.is_wired_correctly()
+    sub_arrows = [type(sub_arrow).__name__
+                  for sub_arrow in arrow.get_sub_arrows()]
+    assert sub_arrows.count('SinArrow') == 1
+    assert np.allclose(apply_numpy(arrow, [0.5, 3.0]),
+                       apply_numpy(sinxy_plus_sinx(), [0.5, 3.0]))
+    assert invert(arrow).is_wired_correctly()
+
+
+def test_cse_totality():
+    all_test_arrows = [gen() for gen in all_test_arrow_gens]
+    totality_test(eliminate_common_subexpressions,
+                  all_test_arrows,
+                  test_name="cse")
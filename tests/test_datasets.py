@@ -0,0 +1,27 @@
+"""Tests for memory mapped datasets"""
+import os
+import tempfile
+import numpy as np
+from arrows.config import floatX
+from arrows.util.datasets import MappedDataset, save_shards
+from arrows.util.generators import infinite_batches
+
+
+def test_mapped_dataset():
+    data = np.random.randint(0, 256, size=(23, 4, 4), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        save_shards(data, os.path.join(tmpdir, "data"), shard_size=5)
+        dataset = MappedDataset(os.path.join(tmpdir, "data_*.npy"),
+                                scale=1 / 255.0)
+        expected = (data / 255.0).astype(floatX())
+        assert dataset.shape == data.shape
+        rows = np.array([22, 0, 7, 6, 13])
+        assert dataset[rows].dtype == floatX()
+        assert np.allclose(dataset[rows], expected[rows])
+        assert np.allclose(dataset[3], expected[3])
+        assert np.allclose(dataset[4:12], expected[4:12])
+        subset = dataset.subset(slice(10, None))
+        assert len(subset) == 13
+        assert np.allclose(subset[[0, 12]], expected[[10, 22]])
+        batches = infinite_batches(subset, 4)
+        assert np.allclose(next(batches), expected[10:14])
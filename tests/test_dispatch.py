@@ -1,23 +1,67 @@
 import numpy as np
 
 from arrows.apply.propagate import propagate
-from arrows.primitive.array_arrows import GatherArrow
+from arrows.primitive.array_arrows import (GatherArrow, SparseToDenseArrow,
+                                           std_disp2, complement_values)
+from arrows.sourcearrow import SourceArrow
 from reverseflow.dispatch import inv_gather
 
 def test_inv_gather():
-    inds = {'shape': (3), 'value': np.array([0, 2, 4])}
-    inp = {'shape': (5), 'value': np.array([0, 2, 1, 3, 9])}
+    inds = {'shape': (3,), 'value': np.array([0, 2, 4])}
+    inp = {'shape': (5,), 'value': np.array([0, 2, 1, 3, 9])}
     gather = GatherArrow()
     i = gather.in_ports()
     port_attrs = {i[0]: inp, i[1]: inds}
     arrow, portmap = inv_gather(gather, port_attrs)
-    output = {'shape': (3), 'value': np.array([0, 1, 9])}
-    theta = {'shape': (2), 'value': np.array([2, 3])}
+    output = {'shape': (3,), 'value': np.array([0, 1, 9])}
+    theta = {'shape': (2,), 'value': np.array([2, 3])}
     i = arrow.in_ports()
-    inv_attrs = {i[0]: output, i[1]: theta}
-    propd_values = propagate(arrow, inv_attrs)
+    inv_attrs = {i[0]: output, i[1]: theta, i[2]: inds}
+    with complement_values():
+        propd_values = propagate(arrow, inv_attrs)
     return inds, inp, port_attrs, arrow, portmap, propd_values
 
+
+def test_inv_gather_values():
+    inds, inp, port_attrs, arrow, portmap, propd_values = test_inv_gather()
+    assert np.array_equal(propd_values[arrow.out_port(0)]['value'],
+                          inp['value'])
+    # The only constant in the inverse is the shape, not the complement
+    sources = [sub_arrow.value.tolist() for sub_arrow in arrow.get_sub_arrows()
+               if isinstance(sub_arrow, SourceArrow)]
+    assert sources == [[5]]
+
+
+def test_inv_gather_no_complement_value():
+    from arrows.primitive.array_arrows import ComplementIndicesArrow
+    inds, inp, port_attrs, arrow, portmap, propd_values = test_inv_gather()
+    compl = [sub_arrow for sub_arrow in arrow.get_sub_arrows()
+             if isinstance(sub_arrow, ComplementIndicesArrow)][0]
+    assert 'value' in propd_values[compl.out_port(0)]
+    # Propagation outside apply_backwards finds the shape of the complement
+    # without building it
+    i = arrow.in_ports()
+    port_attr = propagate(arrow, {i[0]: {'shape': (3,)}, i[2]: inds})
+    assert port_attr[compl.out_port(0)]['shape'] == (2, 1)
+    assert 'value' not in port_attr[compl.out_port(0)]
+
+def test_sparse_to_dense_values():
+    std = SparseToDenseArrow()
+    i = std.in_ports()
+    port_attrs = {i[0]: {'value': np.array([[0, 1], [2, 0]])},
+                  i[1]: {'value': np.array([3, 2])},
+                  i[2]: {'value': np.array([4, 5], dtype=np.int32)}}
+    output = std_disp2(std, port_attrs)[std.out_port(0)]['value']
+    assert output.dtype == np.int32
+    assert np.array_equal(output, [[0, 4], [0, 0], [5, 0]])
+    # Indices into each element of a batch
+    port_attrs[i[0]]['value'] = np.array([[[1], [2]], [[0], [2]]])
+    port_attrs[i[1]]['value'] = np.array([2, 3])
+    port_attrs[i[2]]['value'] = np.array([[1., 2.], [3., 4.]], dtype=np.float32)
+    output = std_disp2(std, port_attrs)[std.out_port(0)]['value']
+    assert output.dtype == np.float32
+    assert np.array_equal(output, [[0, 1, 2], [3, 0, 4]])
+
 if __name__ == '__main__':
     inds, inp, port_attrs, arrow, portmap, propd_values = test_inv_gather()
     import pdb; pdb.set_trace()
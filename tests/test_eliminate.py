@@ -0,0 +1,33 @@
+import numpy as np
+
+from arrows.transform.eliminate import find_equivalent_thetas
+from arrows.transform.symbolic_tensor import SymbolicTensor, unroll
+from arrows.util.union_find import UnionFind
+
+def test_union_find():
+    sets = UnionFind(6)
+    sets.union(4, 1)
+    sets.union(5, 3)
+    sets.union(3, 4)
+    assert sets.find(5) == sets.find(1)
+    assert np.array_equal(sets.classes(), [0, 1, 2, 1, 1, 1])
+
+def test_union_many():
+    pairs = np.random.RandomState(0).randint(0, 1000, size=(2, 600))
+    sets, many = UnionFind(1000), UnionFind(1000)
+    for i, j in pairs.T:
+        sets.union(i, j)
+    many.union_many(pairs[0], pairs[1])
+    assert np.array_equal(sets.classes(), many.classes())
+
+def test_find_equivalent_thetas():
+    x = SymbolicTensor(shape=(2, 2), start=1)
+    y = SymbolicTensor(shape=(3,), start=5)
+    assert np.array_equal(unroll(x), [[1, 2], [3, 4]])
+    # y[0] is unknown where x[0, 0] is constrained
+    y_perm = SymbolicTensor(indices=np.array([[0, 3], [2, 1]]),
+                            symbols=y.symbols)
+    x_flat = SymbolicTensor(indices=np.array([3, 4, 0]), symbols=x.symbols)
+    classes = find_equivalent_thetas({'a': [x, y_perm], 'b': [x_flat, y]}, 7)
+    # 2 = 7, 3 = 6, 4 = 5 from a and 3 = 5, 4 = 6 from b
+    assert np.array_equal(classes[1:], [1, 2, 3, 3, 3, 3, 2])
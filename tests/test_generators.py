@@ -0,0 +1,45 @@
+"""Tests for prefetching of feed dicts"""
+from arrows.util.generators import LockedGenerator, prefetch_feeds
+
+
+def counter(key):
+    i = 0
+    while True:
+        yield {key: i}
+        i += 1
+
+
+def test_prefetch_feeds():
+    feeds = prefetch_feeds([counter('a'), counter('b')], size=2)
+    for i in range(10):
+        assert next(feeds) == {'a': i, 'b': i}
+    feeds.close()
+
+
+def test_prefetch_close():
+    feeds = prefetch_feeds([counter('a')], size=2)
+    next(feeds)
+    feeds.close()
+    assert not feeds.thread.is_alive()
+    assert feeds.queue.empty()
+
+
+def test_prefetch_errors():
+    def failing():
+        yield {'a': 0}
+        raise ValueError("bad batch")
+    feeds = prefetch_feeds([failing()])
+    assert next(feeds) == {'a': 0}
+    try:
+        next(feeds)
+        assert False, "Error in generator should be reraised"
+    except ValueError:
+        pass
+
+
+def test_locked_generator():
+    shared = LockedGenerator(counter('a'))
+    feeds = prefetch_feeds([shared], size=1)
+    seen = [next(feeds)['a'] for i in range(5)] + [next(shared)['a']]
+    assert len(set(seen)) == len(seen)
+    feeds.close()
@@ -0,0 +1,48 @@
+"""Tests compiled interpretation plans."""
+import numpy as np
+
+from arrows.apply.interpret import get_plan
+from arrows.apply.apply_numpy import apply_numpy
+from arrows.apply.profile import ExecutionProfile
+from arrows.compositearrow import CompositeArrow
+from arrows.port_attributes import make_in_port, make_out_port
+from reverseflow.invert import invert
+from test_arrows import test_twoxyplusx
+
+
+def test_plan_cache():
+    arrow = invert(test_twoxyplusx())
+    plan = get_plan(arrow)
+    assert get_plan(arrow) is plan
+    arrow.add_port()
+    assert arrow.plan is None
+    # Changing an arrow nested within also invalidates the plan
+    get_plan(arrow)
+    nested = [sub_arrow for sub_arrow in arrow.get_sub_arrows_nested()
+              if isinstance(sub_arrow, CompositeArrow)]
+    nested[0].add_port()
+    assert arrow.plan is None
+    # As does changing which ports are in and out ports
+    get_plan(arrow)
+    make_out_port(nested[0].add_port())
+    get_plan(arrow)
+    make_in_port(nested[0].ports()[-1])
+    assert arrow.plan is None
+
+
+def test_plan_outputs():
+    arrow = test_twoxyplusx()
+    assert np.allclose(apply_numpy(arrow, [1.0, 3.0]), [7.0])
+    assert np.allclose(apply_numpy(arrow, [2.0, 0.5]), [4.0])
+
+
+def test_exec_profile():
+    arrow = test_twoxyplusx()
+    profile = ExecutionProfile()
+    assert np.allclose(apply_numpy(arrow, [1.0, 3.0], profile=profile), [7.0])
+    table = profile.by_class()
+    nprims = len([a for a in arrow.get_sub_arrows_nested()
+                  if not isinstance(a, CompositeArrow)])
+    assert sum(profile.counts.values()) == nprims
+    assert 'MulArrow' in table and 'AddArrow' in table
+    assert "MulArrow" in profile.report()
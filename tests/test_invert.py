@@ -27,3 +27,135 @@ def test_invert():
                   all_test_arrows,
                   test_name="invert",
                   ignore=ignore_inv)
+
+
+def test_structural_hash():
+    from arrows.util.hash import structural_hash
+    from test_arrows import test_twoxyplusx
+    a, b = test_twoxyplusx(), test_twoxyplusx()
+    assert structural_hash(a) == structural_hash(b)
+    assert structural_hash(a) != structural_hash(test_xyplusx_flat())
+
+
+def test_function_key():
+    from arrows.util.hash import value_key
+    def scale(k):
+        return lambda x: k * x
+    assert value_key(scale(2)) == value_key(scale(2))
+    assert value_key(scale(2)) != value_key(scale(3))
+    assert value_key(lambda x: x + 1) != value_key(lambda x: x - 1)
+
+
+def test_invert_cache():
+    from reverseflow.invert import clear_invert_cache, INVERT_CACHE
+    from test_arrows import test_twoxyplusx
+    clear_invert_cache()
+    inv = invert(test_twoxyplusx(), cache=True)
+    cached_inv = invert(test_twoxyplusx(), cache=True)
+    assert len(INVERT_CACHE) == 1
+    assert cached_inv is not inv
+    assert cached_inv.is_wired_correctly()
+    assert cached_inv.num_ports() == inv.num_ports()
+    # Only the most recently used inverses are kept
+    INVERT_CACHE.resize(1)
+    try:
+        invert(test_xyplusx_flat(), cache=True)
+        assert len(INVERT_CACHE) == 1
+    finally:
+        INVERT_CACHE.resize(32)
+        clear_invert_cache()
+
+
+def test_invert_cache_unreadable(tmpdir):
+    import os
+    from reverseflow.invert import clear_invert_cache, invert_key
+    from test_arrows import test_twoxyplusx
+    from arrows.util.io import load_pickle
+    from reverseflow.defaults import default_dispatch
+    clear_invert_cache()
+    arrow = test_twoxyplusx()
+    arrow.duplify()
+    key = invert_key(arrow, default_dispatch)
+    path = os.path.join(str(tmpdir), key + ".pkl")
+    with open(path, 'wb') as f:
+        f.write(b"truncated")
+    inv = invert(arrow, cache=True, cache_dir=str(tmpdir))
+    assert inv.is_wired_correctly()
+    # The unreadable entry was replaced and no temporary files are left
+    assert load_pickle(path) is not None
+    assert os.listdir(str(tmpdir)) == [key + ".pkl"]
+    clear_invert_cache()
+
+
+def test_invert_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    from arrows.util.hash import structural_hash
+    from test_arrows import test_twoxyplusx
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        inv = invert(test_twoxyplusx(), executor=executor)
+    assert inv.is_wired_correctly()
+    assert structural_hash(inv) == structural_hash(invert(test_twoxyplusx()))
+
+
+def test_detached_copy():
+    import pickle
+    from arrows.apply.propagate import propagate
+    from reverseflow.invert import detached_copy
+    from test_arrows import test_twoxyplusx
+    arrow = test_twoxyplusx()
+    port_attr = propagate(arrow)
+    sub_arrow = next(iter(arrow.get_sub_arrows()))
+    copy, copy_port_attr = detached_copy(sub_arrow, {
+        port: port_attr[port] for port in sub_arrow.all_ports()})
+    assert copy.parent is None and sub_arrow.parent is arrow
+    assert all(port.arrow is copy for port in copy_port_attr)
+    assert len(pickle.dumps(copy)) < len(pickle.dumps(sub_arrow))
+
+
+def test_clone():
+    from copy import deepcopy
+    from arrows.port_attributes import add_port_label, has_port_label
+    from arrows.util.hash import structural_hash
+    from test_arrows import test_twoxyplusx
+    inv = invert(test_twoxyplusx())
+    for copy_inv in [inv.clone(validate=True), deepcopy(inv)]:
+        assert copy_inv.is_wired_correctly()
+        assert structural_hash(copy_inv) == structural_hash(inv)
+        nested = copy_inv.get_sub_arrows_nested()
+        assert nested.isdisjoint(inv.get_sub_arrows_nested())
+        assert all(sub_arrow.parent in nested or sub_arrow.parent is copy_inv
+                   for sub_arrow in nested)
+        # Labels are not shared with the original
+        add_port_label(copy_inv.in_port(0), 'copied')
+        assert not has_port_label(inv.in_port(0), 'copied')
+
+
+def test_eliminate_gathernd():
+    import numpy as np
+    from arrows.apply.apply_numpy import apply_numpy
+    from arrows.compositearrow import CompositeArrow
+    from arrows.port_attributes import (make_in_port, make_out_port,
+                                        set_port_shape)
+    from arrows.std_arrows import (ConcatArrow, GatherNdArrow, SourceArrow,
+                                   UpdateArrow)
+    # Gathers overlapping at index (1, 2)
+    arrow = CompositeArrow(name="GatherTwice")
+    x = arrow.add_port()
+    make_in_port(x)
+    set_port_shape(x, (2, 3))
+    for indices in ([[0, 1], [1, 2], [0, 1]], [[1, 2], [0, 0]]):
+        gather = GatherNdArrow()
+        out = arrow.add_port()
+        make_out_port(out)
+        arrow.add_edge(x, gather.in_port(0))
+        arrow.add_edge(SourceArrow(np.array(indices)).out_port(0),
+                       gather.in_port(1))
+        arrow.add_edge(gather.out_port(0), out)
+    inv = invert(arrow)
+    sub_arrows = [type(sub_arrow) for sub_arrow in inv.get_sub_arrows()]
+    assert sub_arrows.count(UpdateArrow) == 1
+    assert sub_arrows.count(ConcatArrow) == 1
+    x_val = np.arange(1, 7, dtype=np.float32).reshape(2, 3)
+    params = np.array([10, 20, 30], dtype=np.float32)
+    x_inv = apply_numpy(inv, apply_numpy(arrow, [x_val]) + [params])[0]
+    assert np.array_equal(x_inv, [[1, 2, 10], [20, 30, 6]])
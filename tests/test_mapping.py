@@ -0,0 +1,42 @@
+"""Tests the array backed relation against Relation."""
+import random
+from copy import deepcopy
+
+import numpy as np
+
+from arrows.apply.apply_numpy import apply_numpy
+from reverseflow.invert import invert
+from reverseflow.util.mapping import Relation, ArrayRelation
+from test_arrows import test_twoxyplusx
+
+
+def test_array_relation():
+    rel = Relation()
+    arr_rel = ArrayRelation()
+    edges = [(random.randrange(50), random.randrange(50)) for i in range(1000)]
+    for left, right in edges:
+        rel.add(left, right)
+        arr_rel.add(left, right)
+    for left, right in random.sample(edges, 300):
+        rel.remove(left, right)
+        arr_rel.remove(left, right)
+    for i in range(50):
+        assert rel.fwd(i) == arr_rel.fwd(i)
+        assert rel.inv(i) == arr_rel.inv(i)
+    assert sorted(rel.items()) == sorted(arr_rel.items())
+    assert set(rel.keys()) == set(arr_rel.keys())
+    assert set(rel.values()) == set(arr_rel.values())
+    assert all((i in rel) == (i in arr_rel) for i in range(50))
+
+
+def test_array_relation_arrow():
+    arrow = test_twoxyplusx()
+    edges = ArrayRelation()
+    for left, right in arrow.edges.items():
+        edges.add(left, right)
+    arrow.edges = edges
+    assert arrow.is_wired_correctly()
+    assert isinstance(deepcopy(arrow).edges, ArrayRelation)
+    assert np.allclose(apply_numpy(arrow, [1.0, 3.0]), [7.0])
+    inv = invert(arrow)
+    assert inv.is_wired_correctly()
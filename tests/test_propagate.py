@@ -0,0 +1,120 @@
+"""Tests the worklist propagation engine against the default one."""
+import numpy as np
+
+from arrows import Arrow
+from arrows.apply.propagate import (propagate, enable_propagate_cache,
+                                    clear_propagate_cache, PROPAGATE_CACHE)
+from arrows.port_attributes import set_port_shape
+from arrows.apply.profile import profiling
+from arrows.apply.apply import apply_backwards
+from arrows.port_attributes import is_error_port
+from reverseflow.invert import invert
+from test_arrows import all_test_arrow_gens, test_twoxyplusx
+from totality_test import totality_test
+
+
+def input_gen(arrow: Arrow):
+    return {port: {'shape': (), 'value': 5.0} for port in arrow.in_ports()}
+
+
+def same_propagation(arrow: Arrow, inputs):
+    default = propagate(arrow, inputs)
+    incremental = propagate(arrow, inputs, incremental=True)
+    for port, attrs in default.items():
+        for key in ('shape', 'value', 'constant'):
+            if key in attrs:
+                assert key in incremental[port], "%s lost %s" % (port, key)
+                if key == 'constant':
+                    assert attrs[key] == incremental[port][key]
+                else:
+                    assert np.allclose(attrs[key], incremental[port][key])
+
+
+def test_propagate_incremental():
+    all_test_arrows = [gen() for gen in all_test_arrow_gens]
+    totality_test(same_propagation,
+                  all_test_arrows,
+                  input_gen,
+                  test_name="propagate_incremental")
+
+
+def test_propagate_incremental_state():
+    arrow = test_twoxyplusx()
+    try:
+        propagate(arrow, state={}, incremental=True)
+    except AssertionError:
+        return
+    assert False, "state should be rejected by the worklist engine"
+
+
+def test_apply_backwards_incremental():
+    arrow = invert(test_twoxyplusx(), incremental=True)
+    outputs = [np.random.randn(2, 2) for out_port in arrow.out_ports()
+               if not is_error_port(out_port)]
+    default = apply_backwards(arrow, outputs)
+    incremental = apply_backwards(arrow, outputs, incremental=True)
+    for port, value in default.items():
+        assert np.allclose(value, incremental[port])
+
+
+def test_propagate_profile():
+    arrow = invert(test_twoxyplusx())
+    for incremental in [False, True]:
+        with profiling() as profile:
+            propagate(arrow, incremental=incremental)
+        stats = profile.stats()
+        assert stats['calls'] == 1
+        assert stats['iterations'] > 0
+        assert stats['peak_attrs'] > 0
+        fires = sum(d['fires'] for d in stats['dispatches'].values())
+        assert 0 < fires
+        assert "propagate calls" in profile.report()
+
+
+def test_propagate_cache():
+    arrow = invert(test_twoxyplusx())
+    inputs = {port: {'shape': (2,)} for port in arrow.in_ports()}
+    default = propagate(arrow, inputs)
+    enable_propagate_cache()
+    try:
+        clear_propagate_cache()
+        propagate(arrow, inputs)
+        cached = propagate(arrow, inputs)
+        assert len(PROPAGATE_CACHE) == 1
+        assert set(default.keys()) == set(cached.keys())
+        for port, attrs in default.items():
+            if 'shape' in attrs:
+                assert attrs['shape'] == cached[port]['shape']
+        # Changing the arrow invalidates its hash and so the cache
+        set_port_shape(arrow.in_port(0), (2,))
+        propagate(arrow, inputs)
+        assert len(PROPAGATE_CACHE) == 2
+    finally:
+        enable_propagate_cache(False)
+        clear_propagate_cache()
+
+
+def test_propagate_cache_dir(tmpdir):
+    import os
+    arrow = invert(test_twoxyplusx())
+    inputs = {port: {'shape': (2,)} for port in arrow.in_ports()}
+    enable_propagate_cache(cache_dir=str(tmpdir))
+    try:
+        clear_propagate_cache()
+        default = propagate(arrow, inputs)
+        files = os.listdir(str(tmpdir))
+        assert len(files) == 1 and files[0].endswith(".pkl")
+        # An unreadable entry is recomputed and replaced
+        with open(os.path.join(str(tmpdir), files[0]), 'wb') as f:
+            f.write(b"truncated")
+        clear_propagate_cache()
+        cached = propagate(arrow, inputs)
+        assert set(default.keys()) == set(cached.keys())
+        assert os.listdir(str(tmpdir)) == files
+        # propagate with state bypasses the cache
+        clear_propagate_cache()
+        propagate(arrow, inputs, state={})
+        assert len(PROPAGATE_CACHE) == 0
+    finally:
+        enable_propagate_cache(False)
+        clear_propagate_cache()
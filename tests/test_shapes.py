@@ -2,11 +2,14 @@
 
 import numpy as np
 from arrows import Arrow
-from arrows.port_attributes import is_param_port
+from arrows.port_attributes import is_param_port, set_port_shape
 from arrows.apply.propagate import propagate
+from arrows.apply.shapes import unify_shapes
+from reverseflow.invert import invert
 from reverseflow.inv_primitives.inv_math_arrows import InvAddArrow
 
-from test_arrows import all_test_arrow_gens, test_inv_twoxyplusx
+from test_arrows import (all_test_arrow_gens, test_inv_twoxyplusx,
+                         test_twoxyplusx)
 from totality_test import totality_test
 
 
@@ -21,6 +24,26 @@ def test_shapes():
     totality_test(propagate, all_test_arrows, input_gen)
 
 
+def test_unify_shapes():
+    assert unify_shapes([(None, 1), (4, 1), [None, 1]]) == (4, 1)
+    assert unify_shapes([(None, 3), (None, 3)]) == (None, 3)
+
+
+def test_batch_polymorphic():
+    """One inverse serves every batch size, shapes of known batch size win"""
+    arrow = test_twoxyplusx()
+    for port in arrow.in_ports():
+        set_port_shape(port, (None, 1))
+    inv_arrow = invert(arrow)
+    for incremental in [False, True]:
+        port_attr = propagate(inv_arrow, incremental=incremental)
+        assert port_attr[inv_arrow.in_port(0)]['shape'] == (None, 1)
+        assert port_attr[inv_arrow.out_port(0)]['shape'] == (None, 1)
+        given = {inv_arrow.in_port(0): {'shape': (4, 1)}}
+        port_attr = propagate(inv_arrow, given, incremental=incremental)
+        assert port_attr[inv_arrow.out_port(0)]['shape'] == (4, 1)
+
+
 def manual_inspection():
     """Manually inspect output with PDB."""
     arrow = InvAddArrow()